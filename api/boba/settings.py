@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,10 +41,14 @@ INSTALLED_APPS = [
     "boba",
     "booking",
     "rest_framework",
+    "rest_framework.authtoken",
     "drf_yasg",
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы в спан запроса попало время остальных middleware
+    "booking.tracing.tracing_middleware",
+    "booking.metrics.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,14 +81,110 @@ WSGI_APPLICATION = "boba.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# Если задан POSTGRES_DB, используется PostgreSQL (нужен пакет psycopg),
+# иначе - SQLite в режиме WAL для установки на одной машине.
+
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+
+# Сколько секунд держать соединение открытым между запросами; 0 - закрывать после каждого запроса
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
+if POSTGRES_DB:
+
+    def postgres_database(host, port):
+        return {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": POSTGRES_DB,
+            "USER": os.getenv("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": host,
+            "PORT": port,
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            # Перед переиспользованием постоянное соединение проверяется
+            "CONN_HEALTH_CHECKS": True,
+            # За пулером в режиме transaction (PgBouncer) серверные курсоры не работают
+            "DISABLE_SERVER_SIDE_CURSORS": os.getenv("DB_TRANSACTION_POOLER") == "1",
+            "OPTIONS": {
+                "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+                "application_name": os.getenv("DB_APPLICATION_NAME", "boba"),
+            },
+        }
+
+    DATABASES = {
+        "default": postgres_database(
+            os.getenv("POSTGRES_HOST", "localhost"), os.getenv("POSTGRES_PORT", "5432")
+        )
+    }
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+    # Реплика для чтения каталога и свободных слотов (см. booking.db)
+    POSTGRES_REPLICA_HOST = os.getenv("POSTGRES_REPLICA_HOST")
+    if POSTGRES_REPLICA_HOST:
+        DATABASES["replica"] = postgres_database(
+            POSTGRES_REPLICA_HOST, os.getenv("POSTGRES_REPLICA_PORT", os.getenv("POSTGRES_PORT", "5432"))
+        )
+        DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "OPTIONS": {
+                # Сколько секунд ждать освобождения блокировки записи
+                "timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "20")),
+            },
+            # Тестовая база в файле: в общей in-memory базе параллельные
+            # соединения получают "table is locked" вместо ожидания блокировки
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+        }
     }
+
+# Применяются к каждому соединению SQLite (booking.db.configure_sqlite).
+# WAL позволяет читать параллельно с записью, synchronous=NORMAL в WAL
+# не теряет целостность и сильно ускоряет коммиты.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # 64 МБ
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,  # 256 МБ
 }
 
+DATABASE_ROUTERS = ["booking.db.PrimaryReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# По умолчанию кэш в памяти процесса; при нескольких воркерах нужен общий Redis,
+# иначе сброс версии каталога виден только в том процессе, где изменились данные.
+# Для Redis нужен пакет redis (pip install redis).
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "booking",
+        }
+    }
+
+# Время жизни закэшированных ответов каталога (категории, услуги, специалисты), секунды
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "300"))
+
+# Трассировка (OpenTelemetry, booking.tracing): none, console, file или otlp
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+# Файл для TRACING_EXPORTER=file: JSON спанов, по строке на спан
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "booking-api")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -133,6 +234,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Django REST Framework settings
 REST_FRAMEWORK = {
+    # Token - для MCP-сервера бота (служебный пользователь, см. create_service_token)
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'rest_framework.authentication.TokenAuthentication',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
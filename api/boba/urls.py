@@ -22,6 +22,7 @@ from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from booking.metrics import metrics_view
 
 # Настройка Swagger документации
 schema_view = get_schema_view(
@@ -41,6 +42,8 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("booking.urls")),
     path("api-auth/", include("rest_framework.urls")),
+    # Метрики Prometheus
+    path("metrics", metrics_view, name="metrics"),
     
     # Swagger документация
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -0,0 +1,203 @@
+"""
+Асинхронные версии горячих эндпоинтов чтения.
+
+Рассчитаны на запуск под ASGI-сервером (uvicorn boba.asgi:application):
+запросы к БД идут через async ORM и не блокируют воркер. Изменение данных
+по-прежнему обслуживают синхронные viewset из views.py.
+
+Формат ответов совпадает с синхронными эндпоинтами: используются те же
+сериализаторы, но только для уже загруженных объектов. Списки каталога
+поддерживают те же search, ordering и фильтры, что и viewset, и так же
+кэшируются (ETag, Last-Modified, 304 на условный запрос).
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q, prefetch_related_objects
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from datetime import datetime
+from .models import Specialist, Service, Appointment, SpecialistSchedule
+from .cache import async_catalog_cache
+from .db import use_replica
+from .serializers import SpecialistSerializer, ServiceSerializer, SpecialistScheduleSerializer
+from .slots import compute_slots, DEFAULT_SLOT_MINUTES
+
+PAGE_SIZE = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def error_response(message, status=400):
+    return json_response({"error": message}, status=status)
+
+
+async def paginate(request, queryset):
+    """Страница результатов в формате PageNumberPagination"""
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 0
+    count = await queryset.acount()
+    offset = (page - 1) * PAGE_SIZE
+    if page < 1 or (offset and offset >= count):
+        return None, json_response({"detail": "Invalid page."}, status=404)
+
+    items = [obj async for obj in queryset[offset:offset + PAGE_SIZE]]
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'page', page + 1) if offset + PAGE_SIZE < count else None
+    if page == 1:
+        previous_url = None
+    elif page == 2:
+        previous_url = remove_query_param(url, 'page')
+    else:
+        previous_url = replace_query_param(url, 'page', page - 1)
+    return items, {'count': count, 'next': next_url, 'previous': previous_url}
+
+
+def apply_search(request, queryset, fields):
+    """Поиск ?search= как у SearchFilter: каждое слово должно найтись хотя бы в одном поле"""
+    for term in request.GET.get('search', '').replace(',', ' ').split():
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def apply_ordering(request, queryset, fields):
+    """Сортировка ?ordering= как у OrderingFilter: поля не из fields пропускаются"""
+    ordering = [
+        term.strip() for term in request.GET.get('ordering', '').split(',')
+        if term.strip().lstrip('-') in fields
+    ]
+    # id в конце, чтобы страницы не пересекались при равных значениях
+    return queryset.order_by(*ordering, 'id') if ordering else queryset
+
+
+@use_replica
+@async_catalog_cache('specialist')
+async def specialists_list(request):
+    """
+    Список активных специалистов.
+    Поддерживает фильтры city, category_id, search и ordering.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    queryset = Specialist.objects.filter(is_active=True).select_related('user').order_by('id')
+
+    city = request.GET.get('city')
+    if city:
+        queryset = queryset.filter(city__iexact=city)
+    category_id = request.GET.get('category_id')
+    if category_id:
+        queryset = queryset.filter(services__category_id=category_id).distinct()
+    queryset = apply_search(request, queryset, ['name', 'specialization', 'city'])
+    queryset = apply_ordering(request, queryset, ['name', 'specialization', 'city'])
+
+    specialists, page = await paginate(request, queryset)
+    if specialists is None:
+        return page
+    # В Django 4.2 prefetch_related не работает с async-итерацией
+    await sync_to_async(prefetch_related_objects)(specialists, 'schedules')
+    page['results'] = SpecialistSerializer(specialists, many=True, context={'request': request}).data
+    return json_response(page)
+
+
+@use_replica
+@async_catalog_cache('service')
+async def services_list(request):
+    """
+    Список активных услуг.
+    Поддерживает фильтры category_id, specialist_id, city, search и ordering.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    queryset = Service.objects.filter(is_active=True).select_related('specialist', 'category').order_by('id')
+
+    category_id = request.GET.get('category_id')
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    specialist_id = request.GET.get('specialist_id')
+    if specialist_id:
+        queryset = queryset.filter(specialist_id=specialist_id)
+    city = request.GET.get('city')
+    if city:
+        queryset = queryset.filter(specialist__city__iexact=city)
+    queryset = apply_search(request, queryset, ['name', 'specialist__name', 'category__name'])
+    queryset = apply_ordering(request, queryset, ['name', 'price', 'duration'])
+
+    services, page = await paginate(request, queryset)
+    if services is None:
+        return page
+    page['results'] = ServiceSerializer(services, many=True, context={'request': request}).data
+    return json_response(page)
+
+
+@use_replica
+async def specialist_schedule(request, pk):
+    """График работы специалиста"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    schedules = [
+        schedule async for schedule in SpecialistSchedule.objects.filter(specialist_id=pk, specialist__is_active=True)
+    ]
+    # Каждый запрос async ORM - переход в поток БД, поэтому существование
+    # специалиста проверяем отдельно, только если расписание пустое
+    if not schedules and not await Specialist.objects.filter(pk=pk, is_active=True).aexists():
+        return json_response({"detail": "Not found."}, status=404)
+    return json_response(SpecialistScheduleSerializer(schedules, many=True).data)
+
+
+@use_replica
+async def specialist_available_slots(request, pk):
+    """
+    Свободные слоты специалиста на дату.
+    Параметры те же, что у синхронного available_slots: date и service_id.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    date_str = request.GET.get('date', datetime.now().strftime('%Y-%m-%d'))
+    try:
+        requested_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        requested_date = None
+
+    # В обычном случае хватает одного запроса: расписание активного специалиста на этот день
+    schedule = None
+    if requested_date is not None:
+        schedule = await SpecialistSchedule.objects.filter(
+            specialist_id=pk, specialist__is_active=True, day_of_week=requested_date.weekday()
+        ).afirst()
+    if schedule is None and not await Specialist.objects.filter(pk=pk, is_active=True).aexists():
+        return json_response({"detail": "Not found."}, status=404)
+    if requested_date is None:
+        return error_response("Неверный формат даты. Используйте YYYY-MM-DD")
+
+    slot_minutes = DEFAULT_SLOT_MINUTES
+    service_id = request.GET.get('service_id')
+    if service_id:
+        try:
+            slot_minutes = await Service.objects.values_list('duration', flat=True).aget(
+                pk=service_id, specialist_id=pk
+            )
+        except (Service.DoesNotExist, ValueError):
+            return error_response("Услуга не найдена у этого специалиста")
+
+    if schedule is None:
+        return error_response("Специалист не работает в этот день недели")
+
+    appointments = [
+        interval async for interval in Appointment.objects.active().filter(
+            specialist_id=pk, date=requested_date
+        ).values_list('start_time', 'end_time')
+    ]
+    slots = compute_slots(
+        schedule.start_time,
+        schedule.end_time,
+        appointments,
+        slot_minutes=slot_minutes,
+        step_minutes=DEFAULT_SLOT_MINUTES,
+    )
+    return json_response(slots)
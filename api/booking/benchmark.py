@@ -0,0 +1,111 @@
+"""
+Бенчмарк эндпоинтов API внутри процесса.
+
+Запросы идут через тестовый клиент DRF в несколько потоков, поэтому
+кроме задержек считается и число SQL-запросов на каждый ответ.
+Результаты сравниваются с сохранённым базовым прогоном.
+"""
+import threading
+import time
+from collections import Counter
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .loadtest import percentile
+
+
+def run_scenario(make_client, request, total, concurrency=4, warmup=5):
+    """
+    Выполнить total запросов в concurrency потоков.
+
+    make_client() создаёт клиента для потока, request(client, i) выполняет
+    i-й запрос и возвращает ответ. Возвращает словарь с пропускной
+    способностью, перцентилями задержки и числом SQL-запросов.
+    """
+    latencies = []
+    queries = []
+    statuses = Counter()
+    errors = Counter()
+    lock = threading.Lock()
+    counter = iter(range(total))
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(offset):
+        client = make_client()
+        local_latencies, local_queries, local_statuses, local_errors = [], [], Counter(), Counter()
+        try:
+            for i in range(warmup):
+                try:
+                    request(client, offset * warmup + i)
+                except Exception:
+                    # Ошибки посчитаются в замере; поток должен дойти до барьера
+                    pass
+            barrier.wait()
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    break
+                started = time.perf_counter()
+                try:
+                    with CaptureQueriesContext(connection) as context:
+                        response = request(client, i)
+                except Exception as exc:
+                    local_errors[type(exc).__name__] += 1
+                    continue
+                local_latencies.append(time.perf_counter() - started)
+                local_queries.append(len(context.captured_queries))
+                local_statuses[response.status_code] += 1
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            queries.extend(local_queries)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Отсчёт начинается, когда все потоки прогрелись
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors.values()),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        'queries_avg': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'queries_max': max(queries, default=0),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'error_types': dict(errors),
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Сравнить прогон с базовым.
+
+    Регрессия - падение пропускной способности или рост p99 больше чем
+    на tolerance, а также любой рост максимального числа SQL-запросов.
+    Возвращает список строк с описанием регрессий.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if previous['rps'] and current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['rps']} -> {current['rps']} req/s")
+        if previous['p99_ms'] and current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['p99_ms']} -> {current['p99_ms']} ms")
+        if current['queries_max'] > previous['queries_max']:
+            regressions.append(f"{name}: queries {previous['queries_max']} -> {current['queries_max']}")
+    return regressions
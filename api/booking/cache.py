@@ -0,0 +1,134 @@
+"""
+Кэширование ответов каталога (категории, услуги, специалисты, расписания).
+
+Ключи ответов содержат версию каталога, которую сигналы моделей меняют при
+любом сохранении или удалении, поэтому устаревшие ответы просто перестают
+читаться. Версия - это время последнего изменения, она же отдаётся в
+Last-Modified, а ETag считается по содержимому ответа.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .metrics import CATALOG_CACHE
+
+CATALOG_VERSION_KEY = 'booking:catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Версия неизвестна (холодный кэш) - считаем, что каталог изменился сейчас
+        version = bump_catalog_version()
+    return version
+
+
+def bump_catalog_version():
+    # Версия в секундах и строго растёт, чтобы If-Modified-Since
+    # не принял два изменения за одну секунду за одно и то же состояние
+    version = int(time.time())
+    previous = cache.get(CATALOG_VERSION_KEY)
+    if previous is not None and version <= previous:
+        version = previous + 1
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def lookup_catalog_entry(request):
+    """Текущая версия каталога и закэшированный для запроса ответ (или None)"""
+    version = get_catalog_version()
+    return version, cache.get(f'booking:catalog:{version}:{request.build_absolute_uri()}')
+
+
+def store_catalog_entry(version, request, entry):
+    cache.set(f'booking:catalog:{version}:{request.build_absolute_uri()}', entry, settings.CATALOG_CACHE_TIMEOUT)
+
+
+def content_etag(body):
+    if isinstance(body, str):
+        body = body.encode()
+    return quote_etag(hashlib.md5(body).hexdigest())
+
+
+def catalog_headers(etag, version):
+    return {
+        'ETag': etag,
+        'Last-Modified': http_date(version),
+        'Cache-Control': 'no-cache',
+    }
+
+
+def catalog_cache(view_method):
+    """
+    Декоратор для GET-методов viewset, чей ответ зависит только от каталога.
+
+    Отдаёт ответ из кэша и поддерживает условные запросы
+    (If-None-Match / If-Modified-Since -> 304).
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        version, entry = lookup_catalog_entry(request)
+        CATALOG_CACHE.labels(self.basename, 'miss' if entry is None else 'hit').inc()
+        if entry is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = json.dumps(response.data, sort_keys=True, default=str, ensure_ascii=False)
+            entry = (content_etag(body), response.data)
+            store_catalog_entry(version, request, entry)
+
+        etag, data = entry
+        not_modified = get_conditional_response(request, etag=etag, last_modified=version)
+        if not_modified is not None:
+            return not_modified
+        return Response(data, headers=catalog_headers(etag, version))
+    return wrapper
+
+
+def async_catalog_cache(basename):
+    """
+    catalog_cache для async-представлений, отвечающих JSON.
+
+    Кэшируется готовое тело ответа. Работа с кэшем синхронная, поэтому
+    при попадании в кэш это один переход в поток, при промахе - два.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            version, entry = await sync_to_async(lookup_catalog_entry)(request)
+            CATALOG_CACHE.labels(basename, 'miss' if entry is None else 'hit').inc()
+            if entry is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                entry = (content_etag(response.content), response.content)
+                await sync_to_async(store_catalog_entry)(version, request, entry)
+
+            etag, content = entry
+            not_modified = get_conditional_response(request, etag=etag, last_modified=version)
+            if not_modified is not None:
+                return not_modified
+            return HttpResponse(content, content_type='application/json', headers=catalog_headers(etag, version))
+        return wrapper
+    return decorator
+
+
+class CatalogCacheMixin:
+    """Кэширует list и retrieve для viewset каталога"""
+
+    @catalog_cache
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_cache
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
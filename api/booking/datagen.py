@@ -0,0 +1,354 @@
+"""
+Генератор синтетических данных для нагрузочного тестирования.
+
+Все объекты помечаются префиксом в username, поэтому повторный запуск
+досоздаёт только недостающее, а clear() удаляет только сгенерированное.
+Случайность задаётся seed и номером объекта: при одинаковых параметрах
+получаются одни и те же данные независимо от того, за сколько запусков
+они были созданы.
+
+Записи генерируются по рабочему расписанию специалиста без пересечений
+и равномерно распределяются по окну дат вокруг сегодняшнего дня. На PostgreSQL записи загружаются через
+COPY, на остальных базах - bulk_create.
+"""
+import random
+import time
+from datetime import date, time as dtime, timedelta
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cache import bump_catalog_version
+from .models import ServiceCategory, Specialist, Service, Client, Appointment, SpecialistSchedule
+
+# Категория -> (специализации, [(услуга, длительность, цена)])
+CATALOG = {
+    'Красота': (['Косметолог', 'Парикмахер', 'Мастер маникюра'], [
+        ('Стрижка', 60, 1500), ('Окрашивание', 120, 4500), ('Маникюр', 60, 1500),
+        ('Педикюр', 90, 2000), ('Чистка лица', 90, 3500), ('Массаж лица', 45, 2000),
+    ]),
+    'Здоровье': (['Терапевт', 'Стоматолог', 'Невролог', 'Кардиолог'], [
+        ('Консультация', 30, 2000), ('Повторный приём', 15, 1000), ('Осмотр', 45, 2500),
+        ('УЗИ', 30, 2200), ('Лечение', 60, 5000),
+    ]),
+    'Фитнес': (['Тренер', 'Инструктор по йоге'], [
+        ('Персональная тренировка', 60, 2500), ('Составление программы', 90, 5000),
+        ('Групповое занятие', 45, 800),
+    ]),
+    'Массаж': (['Массажист'], [
+        ('Классический массаж', 60, 3000), ('Массаж спины', 30, 1500), ('Спортивный массаж', 90, 4000),
+    ]),
+    'Психология': (['Психолог', 'Психотерапевт'], [
+        ('Консультация психолога', 60, 4000), ('Семейная консультация', 90, 6000),
+    ]),
+}
+CITIES = ['Казань'] * 4 + ['Москва'] * 4 + ['Санкт-Петербург'] * 3 + [
+    'Новосибирск', 'Екатеринбург', 'Самара', 'Уфа', 'Пермь', 'Краснодар', 'Нижний Новгород',
+]
+FIRST_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Ирина', 'Иван', 'Алексей', 'Сергей', 'Дмитрий', 'Андрей', 'Павел']
+LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов', 'Новиков', 'Морозов']
+# Рабочие часы: (начало, конец) в будни; выходные - сокращённый день или выходной
+WORKING_HOURS = [(8, 17), (9, 18), (10, 19), (12, 21)]
+# Шаг сетки записи и минимальный перерыв при свободном слоте, минуты
+SLOT_STEP = 15
+# Диапазон Telegram ID сгенерированных клиентов, чтобы не пересекаться с настоящими
+TELEGRAM_ID_BASE = 9_000_000_000
+
+APPOINTMENT_COLUMNS = [
+    'client_id', 'service_id', 'specialist_id', 'date', 'start_time', 'end_time',
+    'status', 'created_at', 'updated_at',
+]
+
+
+def person_name(rng):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    # Фамилия в женском роде для женских имён
+    if first.endswith('а') or first.endswith('я'):
+        last += 'а'
+    return f'{first} {last}'
+
+
+class DataGenerator:
+    """
+    Args:
+        seed: зерно генератора
+        prefix: префикс username сгенерированных пользователей
+        batch_size: строк в одной вставке
+        log: функция для вывода прогресса
+    """
+
+    def __init__(self, seed=42, prefix='gen', batch_size=10000, log=None):
+        self.seed = seed
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.use_copy = connection.vendor == 'postgresql'
+
+    def rng(self, kind, index):
+        return random.Random(f'{self.seed}:{kind}:{index}')
+
+    def username(self, kind, index):
+        return f'{self.prefix}_{kind}_{index}'
+
+    # === Генерация ===
+
+    def generate(self, specialists, clients, appointments, days_back=365, days_ahead=60, occupancy=0.6):
+        """Досоздать данные до заданных объёмов. Возвращает число созданных объектов по типам"""
+        started = time.perf_counter()
+        categories = self.ensure_categories()
+        created = {
+            'specialists': self.generate_specialists(specialists, categories),
+            'clients': self.generate_clients(clients),
+        }
+        created['appointments'] = self.generate_appointments(
+            specialists, appointments, days_back, days_ahead, occupancy
+        )
+        # bulk_create и COPY не вызывают сигналы моделей
+        bump_catalog_version()
+        self.log(f'Done in {time.perf_counter() - started:.1f}s: {created}')
+        return created
+
+    def ensure_categories(self):
+        categories = {}
+        for name in CATALOG:
+            categories[name], _ = ServiceCategory.objects.get_or_create(name=name)
+        return categories
+
+    def missing_indexes(self, kind, total):
+        existing = set(
+            User.objects.filter(username__startswith=f'{self.prefix}_{kind}_').values_list('username', flat=True)
+        )
+        return [i for i in range(total) if self.username(kind, i) not in existing]
+
+    def generate_specialists(self, total, categories):
+        missing = self.missing_indexes('specialist', total)
+        for start in range(0, len(missing), self.batch_size):
+            indexes = missing[start:start + self.batch_size]
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=self.username('specialist', i), password='!') for i in indexes
+                ])
+                specialists, schedules, services = [], [], []
+                plans = []
+                for i, user in zip(indexes, users):
+                    rng = self.rng('specialist', i)
+                    category = rng.choice(list(CATALOG))
+                    specializations, catalog_services = CATALOG[category]
+                    specialists.append(Specialist(
+                        user=user,
+                        name=person_name(rng),
+                        specialization=rng.choice(specializations),
+                        city=rng.choice(CITIES),
+                        is_active=rng.random() > 0.05,
+                    ))
+                    plans.append((rng, category, catalog_services))
+                specialists = Specialist.objects.bulk_create(specialists)
+                for specialist, (rng, category, catalog_services) in zip(specialists, plans):
+                    start_hour, end_hour = rng.choice(WORKING_HOURS)
+                    workdays = list(range(5)) + [day for day in (5, 6) if rng.random() < 0.3]
+                    for day in workdays:
+                        day_end = end_hour if day < 5 else min(end_hour, start_hour + 5)
+                        schedules.append(SpecialistSchedule(
+                            specialist=specialist,
+                            day_of_week=day,
+                            start_time=dtime(start_hour),
+                            end_time=dtime(day_end),
+                        ))
+                    for name, duration, price in rng.sample(catalog_services, rng.randint(2, min(4, len(catalog_services)))):
+                        services.append(Service(
+                            name=name,
+                            price=round(price * rng.uniform(0.8, 1.5), -1),
+                            duration=duration,
+                            specialist=specialist,
+                            category=categories[category],
+                            is_active=rng.random() > 0.05,
+                        ))
+                SpecialistSchedule.objects.bulk_create(schedules)
+                Service.objects.bulk_create(services)
+            self.log(f'Specialists: {start + len(indexes)}/{len(missing)}')
+        return len(missing)
+
+    def generate_clients(self, total):
+        missing = self.missing_indexes('client', total)
+        for start in range(0, len(missing), self.batch_size):
+            indexes = missing[start:start + self.batch_size]
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=self.username('client', i), password='!') for i in indexes
+                ])
+                clients = []
+                for i, user in zip(indexes, users):
+                    rng = self.rng('client', i)
+                    clients.append(Client(
+                        user=user,
+                        name=person_name(rng),
+                        phone=f'+79{rng.randrange(10 ** 9):09d}',
+                        email=f'{user.username}@example.com',
+                        city=rng.choice(CITIES),
+                        telegram_id=str(TELEGRAM_ID_BASE + i),
+                    ))
+                Client.objects.bulk_create(clients)
+            self.log(f'Clients: {start + len(indexes)}/{len(missing)}')
+        return len(missing)
+
+    def generate_appointments(self, specialists_total, total, days_back, days_ahead, occupancy):
+        """
+        Распределить total записей поровну между сгенерированными специалистами.
+        Специалисты, у которых записи уже есть, пропускаются.
+        """
+        specialist_ids = self.ids_by_index(Specialist, 'user__username', 'specialist', specialists_total)
+        client_ids = list(
+            Client.objects.filter(user__username__startswith=f'{self.prefix}_client_').order_by('id').values_list('id', flat=True)
+        )
+        if not specialist_ids or not client_ids or not total:
+            return 0
+        done = set(
+            Appointment.objects.filter(specialist_id__in=specialist_ids.values()).values_list('specialist_id', flat=True).distinct()
+        )
+        schedules = {}
+        for specialist_id, day, start, end in SpecialistSchedule.objects.filter(
+            specialist_id__in=specialist_ids.values()
+        ).values_list('specialist_id', 'day_of_week', 'start_time', 'end_time'):
+            schedules.setdefault(specialist_id, {})[day] = (start.hour * 60 + start.minute, end.hour * 60 + end.minute)
+        services = {}
+        for service_id, specialist_id, duration in Service.objects.filter(
+            specialist_id__in=specialist_ids.values()
+        ).order_by('id').values_list('id', 'specialist_id', 'duration'):
+            services.setdefault(specialist_id, []).append((service_id, duration))
+
+        per_specialist, remainder = divmod(total, len(specialist_ids))
+        today = date.today()
+        first_day = today - timedelta(days=days_back)
+        last_day = today + timedelta(days=days_ahead)
+        now = timezone.now()
+
+        created = 0
+        short = 0
+        rows = []
+        started = time.perf_counter()
+        for index, specialist_id in sorted(specialist_ids.items()):
+            quota = per_specialist + (1 if index < remainder else 0)
+            if specialist_id in done or not quota or specialist_id not in services:
+                continue
+            rng = self.rng('appointments', index)
+            # Сначала раскладываем записи по всему окну дат с заданной занятостью,
+            # затем оставляем случайные quota из них: подмножество тоже без пересечений,
+            # а записи равномерно покрывают и историю, и будущее
+            candidates = []
+            day = first_day
+            while day <= last_day:
+                hours = schedules.get(specialist_id, {}).get(day.weekday())
+                if hours:
+                    minute, day_end = hours
+                    while minute + SLOT_STEP <= day_end:
+                        if rng.random() >= occupancy:
+                            minute += SLOT_STEP
+                            continue
+                        service_id, duration = rng.choice(services[specialist_id])
+                        if minute + duration > day_end:
+                            break
+                        candidates.append((day, minute, service_id, duration))
+                        minute += duration
+                day += timedelta(days=1)
+            if len(candidates) > quota:
+                candidates = [candidates[i] for i in sorted(rng.sample(range(len(candidates)), quota))]
+            for day, minute, service_id, duration in candidates:
+                rows.append((
+                    rng.choice(client_ids),
+                    service_id,
+                    specialist_id,
+                    day,
+                    dtime(minute // 60, minute % 60),
+                    dtime((minute + duration) // 60, (minute + duration) % 60),
+                    self.status(rng, day, today),
+                    now,
+                    now,
+                ))
+            count = len(candidates)
+            short += quota - count
+            # Сбрасываем только целых специалистов, чтобы повторный запуск мог их пропустить
+            if len(rows) >= self.batch_size:
+                created += self.insert_appointments(rows)
+                rows = []
+                rate = created / (time.perf_counter() - started)
+                self.log(f'Appointments: {created}/{total} ({rate:.0f} rows/s)')
+        if rows:
+            created += self.insert_appointments(rows)
+        if short:
+            self.log(
+                f'{short} appointments did not fit into the schedules; '
+                'increase --days-back/--days-ahead or --occupancy'
+            )
+        return created
+
+    def ids_by_index(self, model, username_field, kind, total):
+        """Номер сгенерированного объекта -> id"""
+        prefix = f'{self.prefix}_{kind}_'
+        ids = {}
+        for object_id, username in model.objects.filter(
+            **{f'{username_field}__startswith': prefix}
+        ).values_list('id', username_field):
+            index = int(username[len(prefix):])
+            if index < total:
+                ids[index] = object_id
+        return ids
+
+    @staticmethod
+    def status(rng, day, today):
+        value = rng.random()
+        if day < today:
+            return 'completed' if value < 0.85 else 'cancelled'
+        if value < 0.5:
+            return 'confirmed'
+        return 'pending' if value < 0.9 else 'cancelled'
+
+    def insert_appointments(self, rows):
+        with transaction.atomic():
+            if self.use_copy:
+                self.copy_rows(Appointment._meta.db_table, APPOINTMENT_COLUMNS, rows)
+            else:
+                Appointment.objects.bulk_create(
+                    [Appointment(**dict(zip(APPOINTMENT_COLUMNS, row))) for row in rows],
+                    batch_size=self.batch_size,
+                )
+        return len(rows)
+
+    def copy_rows(self, table, columns, rows):
+        """COPY ... FROM STDIN через psycopg 3"""
+        columns_sql = ', '.join(connection.ops.quote_name(column) for column in columns)
+        with connection.cursor() as cursor:
+            with cursor.copy(f'COPY {connection.ops.quote_name(table)} ({columns_sql}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    # === Очистка ===
+
+    def clear(self):
+        """
+        Удалить все сгенерированные данные.
+
+        Записи, расписания, услуги и профили удаляются одним DELETE на таблицу,
+        без загрузки строк: обычный delete() моделей каталога загрузил бы каждую
+        строку ради сигналов и на каждой сменил бы версию каталога. Версия
+        меняется один раз в конце; пользователи удаляются последними, когда
+        каскаду уже нечего загружать.
+        """
+        prefix = f'{self.prefix}_'
+        querysets = [
+            Appointment.objects.filter(
+                Q(specialist__user__username__startswith=prefix) | Q(client__user__username__startswith=prefix)
+            ),
+            SpecialistSchedule.objects.filter(specialist__user__username__startswith=prefix),
+            Service.objects.filter(specialist__user__username__startswith=prefix),
+            Specialist.objects.filter(user__username__startswith=prefix),
+            Client.objects.filter(user__username__startswith=prefix),
+        ]
+        deleted = 0
+        with transaction.atomic():
+            for queryset in querysets:
+                deleted += queryset._raw_delete(queryset.db)
+            more, _ = User.objects.filter(username__startswith=prefix).delete()
+            deleted += more
+        bump_catalog_version()
+        return deleted
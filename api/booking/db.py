@@ -0,0 +1,125 @@
+"""
+Работа с базами данных: маршрутизация чтения на реплику,
+настройка SQLite и проверка доступности баз.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Включается на время обработки запросов чтения каталога и свободных слотов
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Внутри блока чтение идёт с реплики (если она настроена)"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_replica(view):
+    """Декоратор async-представления: все чтения внутри идут с реплики"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        with replica_reads():
+            return await view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaReadMixin:
+    """
+    Безопасные запросы (GET/HEAD/OPTIONS) viewset читают с реплики.
+
+    Подходит только для данных, которым допустимо небольшое отставание:
+    каталог и свободные слоты. Запись и проверка пересечений при создании
+    записи всегда идут в основную базу.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryReplicaRouter:
+    """
+    Роутер баз данных: запись и чтение по умолчанию - основная база,
+    чтение внутри replica_reads() - реплика.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and replica_configured():
+            # Внутри транзакции читаем то же, что пишем
+            if not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+                return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплика получает схему через репликацию
+        return db != REPLICA_DB_ALIAS
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Применить SQLITE_PRAGMAS к каждому новому соединению SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def check_databases():
+    """
+    Проверить все настроенные базы.
+
+    Возвращает словарь alias -> {ok, latency_ms, error}; для реплики PostgreSQL
+    дополнительно отставание репликации в секундах.
+    """
+    results = {}
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        started = time.perf_counter()
+        result = {'vendor': connection.vendor}
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+                if alias == REPLICA_DB_ALIAS and connection.vendor == 'postgresql':
+                    cursor.execute(
+                        'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+                    )
+                    lag = cursor.fetchone()[0]
+                    result['replication_lag_s'] = round(float(lag), 3) if lag is not None else None
+            result['ok'] = True
+        except Exception as exc:
+            result['ok'] = False
+            result['error'] = str(exc)
+            # Битое соединение не должно переиспользоваться следующим запросом
+            connection.close_if_unusable_or_obsolete()
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        results[alias] = result
+    return results
@@ -0,0 +1,94 @@
+"""
+Простой генератор HTTP-нагрузки для сравнения режимов запуска API.
+
+Каждый поток держит своё keep-alive соединение и по кругу запрашивает
+заданные пути в течение duration секунд. Задержки первых warmup секунд
+в статистику не попадают.
+"""
+import http.client
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_load(base_url, paths, concurrency=16, duration=10.0, warmup=1.0, timeout=30.0):
+    """
+    Нагрузить base_url запросами GET к paths.
+
+    Возвращает словарь: число запросов, ошибок, запросов в секунду,
+    перцентили задержки в миллисекундах и распределение кодов ответа.
+    """
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    prefix = url.path.rstrip('/') + '/'
+    targets = [prefix + path.lstrip('/') for path in paths]
+
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    lock = threading.Lock()
+
+    def worker(offset):
+        connection = connection_class(url.netloc, timeout=timeout)
+        local_latencies = []
+        local_statuses = Counter()
+        local_errors = Counter()
+        index = offset
+        while True:
+            request_started = time.perf_counter()
+            if request_started >= stop_at:
+                break
+            target = targets[index % len(targets)]
+            index += 1
+            try:
+                connection.request('GET', target, headers={'Accept': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as exc:
+                connection.close()
+                connection = connection_class(url.netloc, timeout=timeout)
+                if request_started >= measure_from:
+                    local_errors[type(exc).__name__] += 1
+                continue
+            if request_started >= measure_from:
+                local_latencies.append(time.perf_counter() - request_started)
+                local_statuses[status] += 1
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    # Длительность считаем до фактического завершения последнего запроса
+    elapsed = max(time.perf_counter() - measure_from, 1e-9)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors.values()),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'error_types': dict(errors),
+    }
@@ -0,0 +1,204 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from booking.benchmark import run_scenario, compare
+from booking.models import Specialist, Service, Client, Appointment, SpecialistSchedule
+from booking.slots import compute_slots
+from datetime import date, datetime, timedelta
+import json
+import random
+
+SCENARIOS = ['available_slots', 'specialist_search', 'availability', 'appointment_list', 'appointment_create']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the booking API in-process on the current database (see generate_data): '
+        'throughput, latency percentiles and SQL queries per endpoint. '
+        'Results can be saved as JSON and compared against a baseline run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--contenders', type=int, default=4,
+                            help='How many appointment_create requests compete for each free slot')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--with-cache', action='store_true', help='Keep the catalog response cache enabled')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--baseline', help='JSON file of a previous run to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.contenders = options['contenders']
+        self.prepare(options['requests'])
+        admin, _ = User.objects.get_or_create(username='benchmark_admin', defaults={'is_staff': True})
+        self.created = []
+
+        def make_client():
+            api = APIClient()
+            api.force_authenticate(admin)
+            return api
+
+        cache_timeout = {} if options['with_cache'] else {'CATALOG_CACHE_TIMEOUT': 0}
+        results = {}
+        try:
+            with override_settings(**cache_timeout):
+                for name in options['scenarios']:
+                    request = getattr(self, f'request_{name}')
+                    result = run_scenario(
+                        make_client,
+                        request,
+                        options['requests'],
+                        concurrency=options['concurrency'],
+                        # Прогрев занял бы слоты, за которые должны бороться замеряемые запросы
+                        warmup=0 if name == 'appointment_create' else 5,
+                    )
+                    if name == 'appointment_create':
+                        result['double_bookings'] = self.count_double_bookings()
+                    results[name] = result
+                    self.stdout.write(
+                        f"{name:<20} {result['rps']:>8.1f} req/s  p50 {result['p50_ms']:>7.1f} ms  "
+                        f"p99 {result['p99_ms']:>7.1f} ms  queries {result['queries_avg']:>5.1f} "
+                        f"(max {result['queries_max']})  statuses {result['statuses']}"
+                        + (f"  double bookings {result['double_bookings']}" if 'double_bookings' in result else '')
+                    )
+        finally:
+            Appointment.objects.filter(id__in=self.created).delete()
+
+        report = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'dataset': {
+                'specialists': Specialist.objects.count(),
+                'clients': Client.objects.count(),
+                'appointments': Appointment.objects.count(),
+            },
+            'options': {key: options[key] for key in ('requests', 'concurrency', 'contenders', 'seed', 'with_cache')},
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline['results'], options['tolerance'])
+            regressions += [
+                f"{name}: {result['double_bookings']} double bookings"
+                for name, result in results.items() if result.get('double_bookings')
+            ]
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(self.style.ERROR(f'REGRESSION {line}'))
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
+
+    def prepare(self, requests):
+        """Выбрать из базы специалистов, даты и клиентов для запросов"""
+        schedules = {}
+        for specialist_id, day_of_week in SpecialistSchedule.objects.filter(
+            specialist__is_active=True
+        ).values_list('specialist_id', 'day_of_week'):
+            schedules.setdefault(specialist_id, set()).add(day_of_week)
+        if not schedules:
+            raise CommandError('No active specialists with schedules; run generate_data first')
+        specialist_ids = sorted(schedules)
+        sample = self.rng.sample(specialist_ids, min(200, len(specialist_ids)))
+        # Пары (специалист, рабочий день) в ближайшие две недели
+        self.slot_targets = []
+        for specialist_id in sample:
+            for offset in range(1, 15):
+                day = date.today() + timedelta(days=offset)
+                if day.weekday() in schedules[specialist_id]:
+                    self.slot_targets.append((specialist_id, day.isoformat()))
+        self.rng.shuffle(self.slot_targets)
+
+        self.cities = list(Specialist.objects.filter(is_active=True).values_list('city', flat=True).distinct())
+        self.specializations = list(
+            Specialist.objects.filter(is_active=True).values_list('specialization', flat=True).distinct()
+        )
+        client_ids = list(Client.objects.values_list('id', flat=True))
+        if not client_ids:
+            raise CommandError('No clients; run generate_data first')
+        self.client_ids = self.rng.sample(client_ids, min(500, len(client_ids)))
+        self.create_targets = self.find_free_slots(specialist_ids, -(-requests // self.contenders))
+
+    def find_free_slots(self, specialist_ids, count):
+        """Непересекающиеся свободные слоты через два месяца для сценария создания записей"""
+        targets = []
+        day = date.today() + timedelta(days=60)
+        for specialist_id in specialist_ids:
+            service = Service.objects.filter(specialist_id=specialist_id, is_active=True).order_by('id').first()
+            schedule = SpecialistSchedule.objects.filter(specialist_id=specialist_id, day_of_week=day.weekday()).first()
+            if service is None or schedule is None:
+                continue
+            busy = Appointment.objects.active().filter(
+                specialist_id=specialist_id, date=day
+            ).values_list('start_time', 'end_time')
+            last_end = None
+            for slot in compute_slots(schedule.start_time, schedule.end_time, busy, slot_minutes=service.duration):
+                if last_end is not None and slot['start_time'] < last_end:
+                    continue
+                last_end = slot['end_time']
+                targets.append(dict(slot, specialist=specialist_id, service=service.id, date=day.isoformat()))
+                if len(targets) >= count:
+                    return targets
+        if not targets:
+            raise CommandError('No free slots found for the appointment_create scenario')
+        return targets
+
+    # === Сценарии ===
+
+    def request_available_slots(self, client, i):
+        specialist_id, day = self.slot_targets[i % len(self.slot_targets)]
+        return client.get(f'/api/specialists/{specialist_id}/available_slots/', {'date': day})
+
+    def request_specialist_search(self, client, i):
+        params = {'city': self.cities[i % len(self.cities)]}
+        if i % 2:
+            params['search'] = self.specializations[i % len(self.specializations)]
+        return client.get('/api/specialists/', params)
+
+    def request_availability(self, client, i):
+        return client.get('/api/specialists/availability/', {
+            'city': self.cities[i % len(self.cities)],
+            'date_from': (date.today() + timedelta(days=1 + i % 7)).isoformat(),
+        })
+
+    def request_appointment_list(self, client, i):
+        params = {'client_id': self.client_ids[i % len(self.client_ids)]}
+        if i % 2:
+            params['date_from'] = date.today().isoformat()
+        if i % 3 == 0:
+            params['status'] = 'confirmed'
+        return client.get('/api/appointments/', params)
+
+    def request_appointment_create(self, client, i):
+        # Подряд идущие запросы уходят в разные потоки и бьют в один слот
+        target = self.create_targets[(i // self.contenders) % len(self.create_targets)]
+        response = client.post('/api/appointments/', dict(
+            target,
+            client=self.client_ids[i % len(self.client_ids)],
+            status='pending',
+        ), format='json')
+        if response.status_code == 201:
+            self.created.append(response.data['id'])
+        return response
+
+    def count_double_bookings(self):
+        """Сколько слотов сценария создания оказались заняты больше чем одной записью"""
+        double = 0
+        for target in self.create_targets:
+            overlapping = Appointment.objects.overlapping(
+                target['specialist'], target['date'], target['start_time'], target['end_time']
+            ).count()
+            if overlapping > 1:
+                double += 1
+        return double
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from collections import namedtuple
+from datetime import time, timedelta, datetime, date
+import random
+import timeit
+from booking.slots import compute_slots, to_time
+
+Booking = namedtuple('Booking', ['start_time', 'end_time'])
+
+
+def legacy_slots(work_start, work_end, appointments, slot_minutes=30):
+    """Прежний алгоритм: шаг по сетке и полный перебор записей на каждом шаге"""
+    slot_duration = timedelta(minutes=slot_minutes)
+    slots = []
+    current_time = work_start
+    current_datetime = datetime.combine(date.today(), current_time)
+    while current_time < work_end:
+        end_datetime = current_datetime + slot_duration
+        slot_end_time = end_datetime.time()
+        is_available = True
+        for appointment in appointments:
+            if (current_time < appointment.end_time and slot_end_time > appointment.start_time):
+                is_available = False
+                break
+        if is_available:
+            slots.append({
+                'start_time': current_time.strftime('%H:%M'),
+                'end_time': slot_end_time.strftime('%H:%M')
+            })
+        current_datetime = end_datetime
+        current_time = current_datetime.time()
+    return slots
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark of the available slots computation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, nargs='+', default=[10, 100, 300, 600])
+        parser.add_argument('--slot', type=int, default=5, help='Slot length in minutes')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        slot = options['slot']
+        work_start, work_end = time(0, 0), time(23, 55)
+        window = work_end.hour * 60 + work_end.minute
+
+        for count in options['bookings']:
+            # Короткие записи, случайно разбросанные по дню (могут пересекаться)
+            appointments = []
+            for _ in range(count):
+                start = rng.randrange(0, window - 30)
+                length = rng.choice([5, 10, 15, 20, 30])
+                appointments.append(Booking(to_time(start), to_time(start + length)))
+            appointments.sort(key=lambda a: a.start_time)
+            pairs = [(a.start_time, a.end_time) for a in appointments]
+
+            new = compute_slots(work_start, work_end, pairs, slot_minutes=slot)
+            old = legacy_slots(work_start, work_end, appointments, slot_minutes=slot)
+            if new != old:
+                self.stderr.write(self.style.WARNING(f'{count} bookings: results differ'))
+
+            repeat = options['repeat']
+            old_time = timeit.timeit(lambda: legacy_slots(work_start, work_end, appointments, slot), number=repeat) / repeat
+            new_time = timeit.timeit(lambda: compute_slots(work_start, work_end, pairs, slot_minutes=slot), number=repeat) / repeat
+            self.stdout.write(
+                f'{count:>6} bookings: legacy {old_time * 1000:8.3f} ms, '
+                f'interval {new_time * 1000:8.3f} ms, speedup x{old_time / new_time:.1f}'
+            )
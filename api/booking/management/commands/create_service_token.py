@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = 'Creates a staff service user for the MCP server and prints its API token (API_TOKEN)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default='mcp_server')
+
+    def handle(self, *args, **options):
+        # Служебный пользователь без пароля: входит только по токену
+        user, created = User.objects.get_or_create(username=options['username'], defaults={'is_staff': True})
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        elif not user.is_staff:
+            user.is_staff = True
+            user.save(update_fields=['is_staff'])
+        token, _ = Token.objects.get_or_create(user=user)
+        self.stdout.write(token.key)
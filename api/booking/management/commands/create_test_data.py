@@ -7,6 +7,10 @@ class Command(BaseCommand):
     help = 'Creates test data for the booking app'
 
     def handle(self, *args, **options):
+        # Имена пользователей фиксированы, повторный запуск упал бы на уникальности
+        if User.objects.filter(username='beauty_specialist').exists():
+            self.stdout.write('Test data already exists, skipping (use generate_data for bulk data)')
+            return
         self.stdout.write('Creating test data...')
         
         # Создаем категории услуг
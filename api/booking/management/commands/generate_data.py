@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from booking.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates synthetic specialists, clients and appointments for load testing. '
+        'Reproducible for a given --seed and idempotent: a rerun only creates what is missing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--specialists', type=int, default=100)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--appointments', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='gen', help='Username prefix of generated users')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--days-back', type=int, default=365, help='History depth in days')
+        parser.add_argument('--days-ahead', type=int, default=60, help='How far ahead appointments go')
+        parser.add_argument('--occupancy', type=float, default=0.6, help='Share of booked slots in a working day')
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated data first')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(
+            seed=options['seed'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        if options['clear']:
+            deleted = generator.clear()
+            self.stdout.write(f'Deleted {deleted} generated objects')
+        created = generator.generate(
+            options['specialists'],
+            options['clients'],
+            options['appointments'],
+            days_back=options['days_back'],
+            days_ahead=options['days_ahead'],
+            occupancy=options['occupancy'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['specialists']} specialists, {created['clients']} clients, "
+            f"{created['appointments']} appointments"
+        ))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from booking.loadtest import run_load
+from booking.models import SpecialistSchedule
+from datetime import date, timedelta
+import json
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test of the read endpoints. Each target is NAME=BASE_URL; the same workload runs against each. '
+        'To compare WSGI and ASGI at the same worker count start e.g. '
+        '"uvicorn boba.wsgi:application --interface wsgi --workers 4 --port 8001" and '
+        '"uvicorn boba.asgi:application --workers 4 --port 8002", then run '
+        'loadtest wsgi=http://127.0.0.1:8001/api/ asgi=http://127.0.0.1:8002/api/async/. '
+        'Sync catalog endpoints are served from the catalog cache; set CATALOG_CACHE_TIMEOUT=0 '
+        'on the WSGI server to compare raw DB paths.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='NAME=BASE_URL')
+        parser.add_argument('--paths', nargs='+', help='Paths relative to BASE_URL (default: hot read endpoints)')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per target')
+        parser.add_argument('--warmup', type=float, default=1.0)
+        parser.add_argument('--json', dest='json_path', help='Write results to this file')
+
+    def default_paths(self):
+        # Специалист с расписанием и его ближайший рабочий день
+        schedule = SpecialistSchedule.objects.filter(specialist__is_active=True).order_by('specialist_id').first()
+        if schedule is None:
+            raise CommandError('Need an active specialist with a schedule (run create_test_data)')
+        day = date.today() + timedelta(days=1)
+        while day.weekday() != schedule.day_of_week:
+            day += timedelta(days=1)
+        specialist_id = schedule.specialist_id
+        return [
+            'specialists/',
+            'services/',
+            f'specialists/{specialist_id}/schedule/',
+            f'specialists/{specialist_id}/available_slots/?date={day.isoformat()}',
+        ]
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep or not url:
+                raise CommandError(f'Target must look like NAME=BASE_URL, got {target!r}')
+            targets.append((name, url))
+        paths = options['paths'] or self.default_paths()
+
+        results = {}
+        for name, url in targets:
+            self.stdout.write(f"{name}: {url} x{options['concurrency']} for {options['duration']:.0f}s")
+            result = run_load(
+                url,
+                paths,
+                concurrency=options['concurrency'],
+                duration=options['duration'],
+                warmup=options['warmup'],
+            )
+            results[name] = result
+            self.stdout.write(
+                f"  {result['rps']:>8.1f} req/s  p50 {result['p50_ms']:.1f} ms  "
+                f"p99 {result['p99_ms']:.1f} ms  errors {result['errors']}  statuses {result['statuses']}"
+            )
+            if any(not code.startswith('2') for code in result['statuses']):
+                self.stderr.write(self.style.WARNING(f'  {name}: non-2xx responses'))
+
+        if len(results) > 1:
+            base_name, base = next(iter(results.items()))
+            for name, result in list(results.items())[1:]:
+                if base['rps']:
+                    self.stdout.write(
+                        f"{name} vs {base_name}: throughput x{result['rps'] / base['rps']:.2f}, "
+                        f"p99 {base['p99_ms']:.1f} -> {result['p99_ms']:.1f} ms"
+                    )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({'paths': paths, 'concurrency': options['concurrency'], 'results': results}, f, indent=2)
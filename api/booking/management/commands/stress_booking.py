@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+from booking.models import Specialist, Service, Client, Appointment, SpecialistSchedule
+from booking.slots import compute_slots
+from datetime import date, timedelta
+from threading import Barrier, Thread
+from collections import Counter
+
+
+class Command(BaseCommand):
+    help = 'Fires parallel appointment creates at the same slot and checks that only one succeeds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=20)
+        parser.add_argument('--specialist', type=int, help='Specialist ID (default: first one with a schedule)')
+        parser.add_argument('--keep', action='store_true', help='Keep created appointments')
+
+    def handle(self, *args, **options):
+        specialists = Specialist.objects.filter(is_active=True, schedules__isnull=False, services__isnull=False)
+        if options['specialist']:
+            specialists = specialists.filter(pk=options['specialist'])
+        specialist = specialists.distinct().order_by('id').first()
+        client = Client.objects.order_by('id').first()
+        if specialist is None or client is None:
+            raise CommandError('Need a specialist with schedule and services and at least one client')
+        service = Service.objects.filter(specialist=specialist).order_by('id').first()
+
+        # Ищем ближайший рабочий день со свободным слотом под услугу
+        schedules = {s.day_of_week: s for s in SpecialistSchedule.objects.filter(specialist=specialist)}
+        slot = None
+        day = date.today() + timedelta(days=1)
+        for _ in range(60):
+            schedule = schedules.get(day.weekday())
+            if schedule:
+                busy = Appointment.objects.active().filter(
+                    specialist=specialist, date=day
+                ).values_list('start_time', 'end_time')
+                free = compute_slots(schedule.start_time, schedule.end_time, busy, slot_minutes=service.duration)
+                if free:
+                    slot = free[0]
+                    break
+            day += timedelta(days=1)
+        if slot is None:
+            raise CommandError('No free slot found in the next 60 days')
+
+        payload = {
+            'specialist': specialist.id,
+            'service': service.id,
+            'client': client.id,
+            'date': day.isoformat(),
+            'start_time': slot['start_time'],
+            'end_time': slot['end_time'],
+            'status': 'pending',
+        }
+        self.stdout.write(f"Booking {specialist.name} on {day} {slot['start_time']}-{slot['end_time']} with {options['threads']} threads")
+
+        barrier = Barrier(options['threads'])
+        results = Counter()
+        created = []
+
+        def worker():
+            api = APIClient()
+            try:
+                barrier.wait()
+                response = api.post('/api/appointments/', payload, format='json')
+                results[response.status_code] += 1
+                if response.status_code == 201:
+                    created.append(response.data['id'])
+            except Exception as exc:
+                results[type(exc).__name__] += 1
+            finally:
+                connection.close()
+
+        threads = [Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for outcome, count in sorted(results.items(), key=str):
+            self.stdout.write(f'  {outcome}: {count}')
+
+        overlapping = Appointment.objects.overlapping(
+            specialist, day, slot['start_time'], slot['end_time']
+        ).count()
+        if not options['keep']:
+            Appointment.objects.filter(id__in=created).delete()
+
+        if overlapping > 1:
+            raise CommandError(f'Double booking: {overlapping} overlapping appointments created')
+        self.stdout.write(self.style.SUCCESS(f'OK: {len(created)} appointment created, no overlaps'))
@@ -0,0 +1,104 @@
+"""
+Метрики Prometheus для API, отдаются на /metrics.
+
+Время и число запросов по маршрутам, запросы в работе, число SQL-запросов
+на ответ и попадания в кэш каталога. Маршрут - имя представления
+(specialist-available-slots), а не путь, чтобы id не плодили ряды.
+
+При нескольких воркерах (gunicorn) нужно задать PROMETHEUS_MULTIPROC_DIR:
+воркеры пишут метрики в файлы, а /metrics собирает их вместе.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_LATENCY = Histogram(
+    'api_request_duration_seconds', 'API request latency', ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter('api_requests', 'API requests by response status', ['method', 'route', 'status'])
+IN_FLIGHT = Gauge('api_requests_in_flight', 'API requests being processed', multiprocess_mode='livesum')
+DB_QUERIES = Histogram('api_request_db_queries', 'SQL queries per API request', ['route'], buckets=QUERY_BUCKETS)
+CATALOG_CACHE = Counter('api_catalog_cache', 'Catalog response cache lookups', ['resource', 'result'])
+
+# Счётчик SQL-запросов текущего HTTP-запроса. Список, а не число: ORM
+# async-представлений работает в другом потоке с копией контекста
+_query_count = ContextVar('query_count', default=None)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+@contextmanager
+def observe_request(request):
+    queries = [0]
+    token = _query_count.set(queries)
+    IN_FLIGHT.inc()
+    started = time.perf_counter()
+    result = {}
+    try:
+        yield result
+    finally:
+        elapsed = time.perf_counter() - started
+        IN_FLIGHT.dec()
+        _query_count.reset(token)
+        route = route_name(request)
+        REQUEST_LATENCY.labels(request.method, route).observe(elapsed)
+        REQUESTS.labels(request.method, route, result.get('status', 500)).inc()
+        DB_QUERIES.labels(route).observe(queries[0])
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Время, статус и число SQL-запросов каждого запроса к API"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with observe_request(request) as result:
+                response = await get_response(request)
+                result['status'] = response.status_code
+            return response
+    else:
+        def middleware(request):
+            with observe_request(request) as result:
+                response = get_response(request)
+                result['status'] = response.status_code
+            return response
+    return middleware
+
+
+def count_query(execute, sql, params, many, context):
+    queries = _query_count.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.10 on 2026-10-18 03:59
+
+from django.db import migrations, models
+
+EXCLUSION_CONSTRAINT = "appointment_no_overlap"
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    # Запрет пересекающихся активных записей поддерживается только PostgreSQL
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    schema_editor.execute(
+        f"ALTER TABLE booking_appointment ADD CONSTRAINT {EXCLUSION_CONSTRAINT} "
+        "EXCLUDE USING gist ("
+        "specialist_id WITH =, "
+        "tsrange(date + start_time, date + end_time) WITH &&"
+        ") WHERE (status IN ('pending', 'confirmed'))"
+    )
+
+
+def drop_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"ALTER TABLE booking_appointment DROP CONSTRAINT IF EXISTS {EXCLUSION_CONSTRAINT}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0002_client_telegram_id"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="client",
+            name="telegram_id",
+            field=models.CharField(default="", max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["specialist", "date", "status", "start_time"],
+                name="appointment_conflict_idx",
+            ),
+        ),
+        migrations.RunPython(add_exclusion_constraint, drop_exclusion_constraint),
+    ]
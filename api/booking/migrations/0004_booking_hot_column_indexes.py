@@ -0,0 +1,60 @@
+# Generated by Django 4.2.10 on 2026-10-18 04:16
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+SQLITE_CITY_INDEX = "specialist_active_city_nocase_idx"
+
+
+def add_sqlite_city_index(apps, schema_editor):
+    # В SQLite city__iexact превращается в LIKE, который использует только
+    # индекс с COLLATE NOCASE; индекс по UPPER(city) ему не подходит
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {SQLITE_CITY_INDEX} "
+        "ON booking_specialist (city COLLATE NOCASE) WHERE is_active"
+    )
+
+
+def drop_sqlite_city_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {SQLITE_CITY_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0003_appointment_conflict_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["client", "date"], name="appointment_client_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(fields=["telegram_id"], name="client_telegram_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="service",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "specialist"],
+                name="service_active_category_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="specialist",
+            index=models.Index(
+                django.db.models.functions.text.Upper("city"),
+                condition=models.Q(("is_active", True)),
+                name="specialist_active_city_idx",
+            ),
+        ),
+        migrations.RunPython(add_sqlite_city_index, drop_sqlite_city_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0004_booking_hot_column_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["date", "start_time", "id"], name="appointment_keyset_idx"
+            ),
+        ),
+    ]
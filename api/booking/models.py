@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
 
 class ServiceCategory(models.Model):
@@ -19,6 +20,15 @@ class Specialist(models.Model):
     is_active = models.BooleanField(default=True)
     city = models.CharField(max_length=100, default="Казань")
     
+    class Meta:
+        indexes = [
+            # Фильтр активных специалистов по городу (city__iexact сравнивает UPPER(city)).
+            # Частичный индекс: Django пишет is_active=True как голое "is_active",
+            # и SQLite не использует такое условие как столбец составного индекса.
+            # Для SQLite миграция 0004 добавляет аналог с COLLATE NOCASE
+            models.Index(Upper('city'), condition=models.Q(is_active=True), name='specialist_active_city_idx'),
+        ]
+    
     def __str__(self):
         return self.name
 
@@ -54,6 +64,12 @@ class Service(models.Model):
     category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE, related_name="services", null=True, blank=True)
     is_active = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            # Каталог услуг: активные услуги по категории и специалисту
+            models.Index(fields=['category', 'specialist'], condition=models.Q(is_active=True), name='service_active_category_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.name} ({self.specialist.name})"
 
@@ -66,9 +82,29 @@ class Client(models.Model):
     city = models.CharField(max_length=100, default="Казань")
     telegram_id = models.CharField(max_length=20, default="")
     
+    class Meta:
+        indexes = [
+            # Поиск клиента по Telegram ID из бота
+            models.Index(fields=['telegram_id'], name='client_telegram_id_idx'),
+        ]
+    
     def __str__(self):
         return self.name
 
+class AppointmentQuerySet(models.QuerySet):
+    def active(self):
+        """Записи, которые занимают время специалиста"""
+        return self.filter(status__in=Appointment.ACTIVE_STATUSES)
+    
+    def overlapping(self, specialist, date, start_time, end_time):
+        """Активные записи специалиста, пересекающиеся с интервалом [start_time, end_time)"""
+        return self.active().filter(
+            specialist=specialist,
+            date=date,
+            start_time__lt=end_time,
+            end_time__gt=start_time,
+        )
+
 class Appointment(models.Model):
     """Модель записи на прием"""
     STATUS_CHOICES = (
@@ -77,6 +113,7 @@ class Appointment(models.Model):
         ('completed', 'Завершено'),
         ('cancelled', 'Отменено'),
     )
+    ACTIVE_STATUSES = ('pending', 'confirmed')
     
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name="appointments")
     service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="appointments")
@@ -88,5 +125,17 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AppointmentQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Поиск пересечений при создании записи и расчёте свободных слотов
+            models.Index(fields=['specialist', 'date', 'status', 'start_time'], name='appointment_conflict_idx'),
+            # Записи клиента по датам
+            models.Index(fields=['client', 'date'], name='appointment_client_date_idx'),
+            # Постраничный список и выгрузка по ключу (date, start_time, id)
+            models.Index(fields=['date', 'start_time', 'id'], name='appointment_keyset_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.client.name} - {self.service.name} ({self.date} {self.start_time})"
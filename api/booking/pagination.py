@@ -0,0 +1,182 @@
+"""
+Постраничная выдача больших списков по ключу (keyset) и потоковая выгрузка.
+
+PageNumberPagination на глубоких страницах делает COUNT(*) и OFFSET,
+который перебирает все пропущенные строки. Здесь страница начинается
+сразу после ключа последней строки предыдущей страницы, поэтому каждая
+страница - один запрос по индексу, как бы далеко ни листали:
+
+    GET /api/appointments/?page_size=50
+    -> {"next": ".../api/appointments/?cursor=...&page_size=50", "results": [...]}
+
+Курсор непрозрачный: base64 от значений полей сортировки последней строки.
+Листать можно только вперёд, общего числа строк в ответе нет.
+"""
+import base64
+import binascii
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+MAX_PAGE_SIZE = 100
+EXPORT_BATCH_SIZE = 500
+
+
+def keyset_filter(ordering, position):
+    """
+    Условие "строка после position" для сортировки по ordering.
+
+    Для (date, start_time, id) это date > d OR (date = d AND start_time > t)
+    OR (date = d AND start_time = t AND id > i). Отдельное date >= d
+    даёт базе границу для поиска по индексу, без него OR читается целиком.
+    """
+    condition = Q()
+    for index, field in enumerate(ordering):
+        equal = {name: value for name, value in zip(ordering[:index], position)}
+        condition |= Q(**equal, **{f'{field}__gt': position[index]})
+    return Q(**{f'{ordering[0]}__gte': position[0]}) & condition
+
+
+def keyset_position(obj, ordering):
+    return [getattr(obj, field) for field in ordering]
+
+
+def encode_cursor(position):
+    data = json.dumps(position, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """Позиция из курсора; значения приводятся к типам полей модели"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        # null в ключе не сравнить через >, а поля сортировки не бывают пустыми
+        if not isinstance(values, list) or len(values) != len(ordering) or None in values:
+            raise ValueError
+        return [model._meta.get_field(field).to_python(value) for field, value in zip(ordering, values)]
+    except (ValueError, TypeError, binascii.Error, DjangoValidationError):
+        raise NotFound('Invalid cursor.')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу сортировки view.keyset_ordering (по умолчанию id).
+
+    Поля сортировки должны вместе однозначно определять строку, поэтому
+    последним всегда идёт id.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    max_page_size = MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = getattr(view, 'keyset_ordering', ('id',))
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, queryset.model, ordering)))
+        # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+        rows = list(queryset[:page_size + 1])
+        page = rows[:page_size]
+        self.next_cursor = encode_cursor(keyset_position(page[-1], ordering)) if len(rows) > page_size else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def export_batches(queryset, ordering, batch_size=EXPORT_BATCH_SIZE):
+    """Вся выборка пачками по ключу: в памяти не больше одной пачки"""
+    queryset = queryset.order_by(*ordering)
+    position = None
+    while True:
+        page = queryset if position is None else queryset.filter(keyset_filter(ordering, position))
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        yield batch
+        position = keyset_position(batch[-1], ordering)
+
+
+async def aexport_batches(queryset, ordering, batch_size=EXPORT_BATCH_SIZE):
+    """export_batches для async ORM"""
+    queryset = queryset.order_by(*ordering)
+    position = None
+    while True:
+        page = queryset if position is None else queryset.filter(keyset_filter(ordering, position))
+        batch = [obj async for obj in page[:batch_size]]
+        if not batch:
+            return
+        yield batch
+        position = keyset_position(batch[-1], ordering)
+
+
+def ndjson_lines(rows):
+    return ''.join(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in rows)
+
+
+class ExportMixin:
+    """
+    GET <list>/export/ - весь список в формате NDJSON (по объекту на строку).
+
+    Учитывает те же фильтры и fields=, что и список. Строки читаются пачками
+    по ключу пагинации и сразу отдаются клиенту, поэтому память не растёт
+    с размером таблицы. Доступно только персоналу.
+    """
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = getattr(self, 'keyset_ordering', ('id',))
+
+        def serialize(batch):
+            return ndjson_lines(self.get_serializer(batch, many=True).data)
+
+        # Под ASGI синхронный генератор Django сначала дочитал бы до конца
+        if isinstance(request._request, ASGIRequest):
+            async def content():
+                async for batch in aexport_batches(queryset, ordering):
+                    yield serialize(batch)
+        else:
+            def content():
+                for batch in export_batches(queryset, ordering):
+                    yield serialize(batch)
+
+        response = StreamingHttpResponse(content(), content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}.ndjson"'
+        return response
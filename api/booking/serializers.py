@@ -2,19 +2,41 @@ from rest_framework import serializers
 from .models import ServiceCategory, Specialist, Service, Client, Appointment, SpecialistSchedule
 from django.contrib.auth.models import User
 
+class SparseFieldsMixin:
+    """
+    Выбор полей ответа параметром запроса: ?fields=id,date,status.
+    
+    Действует только на чтение и только на сериализатор верхнего уровня
+    (вложенные объявлены без контекста запроса). Неизвестные имена
+    пропускаются, чтобы клиент мог запрашивать одни поля у разных версий API.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+        # В async-представлениях приходит HttpRequest без query_params
+        fields = getattr(request, 'query_params', request.GET).get('fields')
+        if not fields:
+            return
+        requested = {name.strip() for name in fields.split(',')}
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
 
-class ServiceCategorySerializer(serializers.ModelSerializer):
+class ServiceCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ServiceCategory
         fields = ['id', 'name', 'description']
         read_only_fields = ['id']
 
-class SpecialistScheduleSerializer(serializers.ModelSerializer):
+class SpecialistScheduleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     day_name = serializers.SerializerMethodField()
     
     class Meta:
@@ -26,7 +48,7 @@ class SpecialistScheduleSerializer(serializers.ModelSerializer):
         days = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
         return days[obj.day_of_week]
 
-class SpecialistSerializer(serializers.ModelSerializer):
+class SpecialistSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     schedules = SpecialistScheduleSerializer(many=True, read_only=True)
     
@@ -35,7 +57,7 @@ class SpecialistSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'name', 'specialization', 'description', 'photo', 'city', 'is_active', 'schedules']
         read_only_fields = ['id']
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     specialist_name = serializers.CharField(source='specialist.name', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
     
@@ -44,7 +66,7 @@ class ServiceSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'price', 'duration', 'specialist', 'specialist_name', 'category', 'category_name', 'is_active']
         read_only_fields = ['id']
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     
     class Meta:
@@ -52,7 +74,13 @@ class ClientSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'name', 'phone', 'email', 'city']
         read_only_fields = ['id']
 
-class AppointmentSerializer(serializers.ModelSerializer):
+def has_overlap(specialist, date, start_time, end_time, exclude_id=None):
+    """Есть ли у специалиста активная запись, пересекающаяся с интервалом"""
+    return Appointment.objects.overlapping(
+        specialist, date, start_time, end_time
+    ).exclude(id=exclude_id).exists()
+
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.name', read_only=True)
     service_name = serializers.CharField(source='service.name', read_only=True)
     specialist_name = serializers.CharField(source='specialist.name', read_only=True)
@@ -71,22 +99,21 @@ class AppointmentSerializer(serializers.ModelSerializer):
         """
         Проверка на доступность временного слота
         """
-        # Получаем данные из запроса
-        specialist = data.get('specialist')
-        date = data.get('date')
-        start_time = data.get('start_time')
-        end_time = data.get('end_time')
+        # Получаем данные из запроса (при частичном обновлении - из текущей записи)
+        specialist = data.get('specialist', getattr(self.instance, 'specialist', None))
+        date = data.get('date', getattr(self.instance, 'date', None))
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        status = data.get('status', getattr(self.instance, 'status', 'pending'))
         
-        # Проверяем, не пересекается ли время с другими записями
-        overlapping_appointments = Appointment.objects.filter(
-            specialist=specialist,
-            date=date,
-            status__in=['pending', 'confirmed'],
-        ).exclude(id=self.instance.id if self.instance else None)
+        if start_time >= end_time:
+            raise serializers.ValidationError("Время окончания должно быть позже времени начала.")
         
-        for appointment in overlapping_appointments:
-            if (start_time < appointment.end_time and end_time > appointment.start_time):
-                raise serializers.ValidationError("Выбранное время уже занято.")
+        # Проверяем, не пересекается ли время с другими записями (один индексированный запрос)
+        if status in Appointment.ACTIVE_STATUSES and has_overlap(
+            specialist, date, start_time, end_time, exclude_id=self.instance.id if self.instance else None
+        ):
+            raise serializers.ValidationError("Выбранное время уже занято.")
         
         # Проверяем, соответствует ли время рабочему графику специалиста
         day_of_week = date.weekday()
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import bump_catalog_version
+from .models import ServiceCategory, Specialist, Service, SpecialistSchedule
+
+CATALOG_MODELS = (ServiceCategory, Specialist, Service, SpecialistSchedule)
+
+
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Только для моделей каталога: обработчик post_delete без sender отключает
+# быстрое удаление (DELETE без загрузки строк) для всех моделей
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_catalog_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    # Специалисты выводятся вместе с пользователем; новый пользователь ещё
+    # не специалист, а вход в систему обновляет только last_login
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    if Specialist.objects.filter(user_id=instance.pk).exists():
+        bump_catalog_version()
@@ -0,0 +1,139 @@
+"""
+Расчёт свободных временных слотов специалиста.
+
+Время внутри модуля представлено минутами от начала суток, поэтому
+занятые интервалы сливаются один раз после сортировки, а свободные
+слоты получаются одним линейным проходом по рабочему окну.
+"""
+from datetime import time, timedelta
+
+# Шаг сетки и длина слота по умолчанию (минуты)
+DEFAULT_SLOT_MINUTES = 30
+
+
+def to_minutes(value):
+    """Перевести time в минуты от начала суток"""
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    """Перевести минуты от начала суток в time"""
+    return time(minutes // 60, minutes % 60)
+
+
+def merge_intervals(intervals):
+    """
+    Слить пересекающиеся и соприкасающиеся интервалы.
+
+    Принимает пары (начало, конец) в минутах в любом порядке,
+    возвращает отсортированный список непересекающихся интервалов.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def free_intervals(window_start, window_end, busy):
+    """
+    Вычесть занятые интервалы из рабочего окна.
+
+    busy должен быть результатом merge_intervals (отсортирован, без пересечений).
+    """
+    free = []
+    cursor = window_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < window_end:
+        free.append((cursor, window_end))
+    return free
+
+
+def compute_slots(work_start, work_end, appointments, slot_minutes=DEFAULT_SLOT_MINUTES, step_minutes=None):
+    """
+    Получить свободные слоты внутри рабочего окна.
+
+    Args:
+        work_start: Начало рабочего дня (time)
+        work_end: Конец рабочего дня (time)
+        appointments: Пары (start_time, end_time) занятых записей
+        slot_minutes: Длина слота, например продолжительность услуги
+        step_minutes: Шаг сетки начала слотов (по умолчанию равен длине слота)
+
+    Returns:
+        Список словарей со start_time и end_time в формате HH:MM
+    """
+    step = step_minutes or slot_minutes
+    window_start = to_minutes(work_start)
+    window_end = to_minutes(work_end)
+    busy = merge_intervals((to_minutes(start), to_minutes(end)) for start, end in appointments)
+
+    slots = []
+    for free_start, free_end in free_intervals(window_start, window_end, busy):
+        # Первая точка сетки, не раньше начала свободного интервала
+        offset = free_start - window_start
+        current = window_start + -(-offset // step) * step
+        while current + slot_minutes <= free_end:
+            slots.append({
+                'start_time': to_time(current).strftime('%H:%M'),
+                'end_time': to_time(current + slot_minutes).strftime('%H:%M'),
+            })
+            current += step
+    return slots
+
+
+def compute_availability(schedules, appointments, date_from, date_to, slot_minutes=DEFAULT_SLOT_MINUTES, step_minutes=None):
+    """
+    Получить свободные слоты нескольких специалистов на диапазон дат.
+
+    Args:
+        schedules: Кортежи (specialist_id, day_of_week, start_time, end_time)
+        appointments: Кортежи (specialist_id, date, start_time, end_time) активных записей
+        date_from: Первая дата диапазона (date)
+        date_to: Последняя дата диапазона включительно (date)
+        slot_minutes: Длина слота
+        step_minutes: Шаг сетки начала слотов
+
+    Returns:
+        Словарь specialist_id -> список {'date', 'slots'} по рабочим дням со свободными слотами
+    """
+    windows = {}
+    for specialist_id, day_of_week, start_time, end_time in schedules:
+        windows[(specialist_id, day_of_week)] = (start_time, end_time)
+
+    busy = {}
+    for specialist_id, day, start_time, end_time in appointments:
+        busy.setdefault((specialist_id, day), []).append((start_time, end_time))
+
+    specialist_ids = sorted({specialist_id for specialist_id, _ in windows})
+    availability = {specialist_id: [] for specialist_id in specialist_ids}
+    day = date_from
+    while day <= date_to:
+        weekday = day.weekday()
+        for specialist_id in specialist_ids:
+            window = windows.get((specialist_id, weekday))
+            if window is None:
+                continue
+            slots = compute_slots(
+                window[0],
+                window[1],
+                busy.get((specialist_id, day), []),
+                slot_minutes=slot_minutes,
+                step_minutes=step_minutes,
+            )
+            if slots:
+                availability[specialist_id].append({'date': day.strftime('%Y-%m-%d'), 'slots': slots})
+        day += timedelta(days=1)
+    return availability
@@ -1,3 +1,570 @@
-from django.test import TestCase
+import json
+from collections import Counter
+from datetime import date, time, timedelta
+from io import StringIO
+from threading import Barrier, Thread
+from types import SimpleNamespace
+from unittest import skipUnless
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models.deletion import Collector
+from django.db.models.signals import post_delete
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from .datagen import DataGenerator
+from .models import ServiceCategory, Specialist, SpecialistSchedule, Service, Client, Appointment
+from .pagination import encode_cursor, export_batches, keyset_filter
+from .slots import compute_slots, free_intervals, merge_intervals
+from .views import OVERLAP_CONSTRAINT, save_without_overlap
 
-# Create your tests here.
+
+def create_booking_data(index=0):
+    """Специалист с расписанием на все дни, услуга и клиент"""
+    category = ServiceCategory.objects.create(name=f'Категория {index}')
+    specialist = Specialist.objects.create(
+        user=User.objects.create_user(f'specialist{index}'),
+        name=f'Специалист {index}',
+        specialization='Массаж',
+    )
+    for day in range(7):
+        SpecialistSchedule.objects.create(
+            specialist=specialist, day_of_week=day, start_time=time(9), end_time=time(18)
+        )
+    service = Service.objects.create(
+        name=f'Услуга {index}', price=1000, duration=30, specialist=specialist, category=category
+    )
+    client = Client.objects.create(
+        user=User.objects.create_user(f'client{index}'),
+        name=f'Клиент {index}',
+        phone='+70000000000',
+        telegram_id=str(1000 + index),
+    )
+    return specialist, service, client
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Параллельные записи на один слот: создаётся ровно одна"""
+
+    threads = 10
+
+    def setUp(self):
+        self.specialist, self.service, self.client = create_booking_data()
+        self.day = date.today() + timedelta(days=1)
+
+    def test_parallel_creates_book_slot_once(self):
+        payload = {
+            'specialist': self.specialist.id,
+            'service': self.service.id,
+            'client': self.client.id,
+            'date': self.day.isoformat(),
+            'start_time': '10:00',
+            'end_time': '10:30',
+            'status': 'pending',
+        }
+        barrier = Barrier(self.threads)
+        results = Counter()
+
+        def worker():
+            try:
+                barrier.wait()
+                response = APIClient().post('/api/appointments/', payload, format='json')
+                results[response.status_code] += 1
+            finally:
+                connection.close()
+
+        threads = [Thread(target=worker) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results[201], 1, results)
+        self.assertEqual(results[400], self.threads - 1, results)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_confirm_rejects_overlapping_cancelled_appointment(self):
+        fields = {
+            'client': self.client, 'service': self.service, 'specialist': self.specialist,
+            'date': self.day, 'start_time': time(10), 'end_time': time(10, 30),
+        }
+        cancelled = Appointment.objects.create(status='cancelled', **fields)
+        Appointment.objects.create(status='pending', **fields)
+
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        response = api.post(f'/api/appointments/{cancelled.id}/confirm/')
+
+        self.assertEqual(response.status_code, 400)
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, 'cancelled')
+
+    def test_only_overlap_constraint_means_slot_taken(self):
+        def failing_save(constraint_name):
+            # Так psycopg сообщает имя нарушенного ограничения
+            cause = Exception('violation')
+            cause.diag = SimpleNamespace(constraint_name=constraint_name)
+
+            def save():
+                raise IntegrityError('violation') from cause
+            return save
+
+        args = (self.specialist, self.day, time(10), time(10, 30), 'pending')
+        with self.assertRaises(ValidationError):
+            save_without_overlap(failing_save(OVERLAP_CONSTRAINT), *args)
+        for constraint_name in ('booking_appointment_client_id_fkey', None):
+            with self.subTest(constraint_name=constraint_name), self.assertRaises(IntegrityError):
+                save_without_overlap(failing_save(constraint_name), *args)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Exclusion constraint exists only on PostgreSQL')
+    def test_exclusion_constraint_rejects_overlap(self):
+        # Мимо API: пересечение должна отсечь сама база
+        fields = {
+            'client': self.client, 'service': self.service, 'specialist': self.specialist,
+            'date': self.day, 'status': 'pending',
+        }
+        Appointment.objects.create(start_time=time(10), end_time=time(10, 30), **fields)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Appointment.objects.create(start_time=time(10, 15), end_time=time(10, 45), **fields)
+
+
+class QueryCountTests(TestCase):
+    """Число запросов на эндпоинт не зависит от числа строк на странице"""
+
+    # Эндпоинт -> запросов на ответ; PageNumberPagination добавляет COUNT(*)
+    QUERIES = {
+        '/api/categories/': 2,
+        '/api/specialists/': 3,
+        '/api/specialists/{specialist_id}/': 2,
+        '/api/specialists/{specialist_id}/services/': 3,
+        '/api/specialists/{specialist_id}/schedule/': 2,
+        '/api/schedules/': 1,
+        '/api/services/': 2,
+        '/api/clients/': 1,
+        '/api/appointments/': 1,
+    }
+
+    def setUp(self):
+        # Ответы каталога из кэша не доходят до базы
+        cache.clear()
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('admin', is_staff=True))
+
+    def seed(self, rows):
+        day = date.today() + timedelta(days=1)
+        first_specialist = None
+        for index in range(rows):
+            specialist, service, client = create_booking_data(index)
+            first_specialist = first_specialist or specialist
+            # У первого специалиста услуг столько же, сколько строк
+            if specialist != first_specialist:
+                Service.objects.create(
+                    name=f'Доп. услуга {index}', price=1000, duration=30,
+                    specialist=first_specialist, category=service.category,
+                )
+            Appointment.objects.create(
+                client=client, service=service, specialist=specialist,
+                date=day, start_time=time(10), end_time=time(10, 30),
+            )
+        return first_specialist
+
+    def assert_query_counts(self, page_size):
+        specialist = self.seed(page_size)
+        for endpoint, queries in self.QUERIES.items():
+            url = endpoint.format(specialist_id=specialist.id)
+            with self.subTest(endpoint=endpoint), self.assertNumQueries(queries):
+                response = self.api.get(url, {'page_size': page_size})
+                self.assertEqual(response.status_code, 200)
+
+    def test_page_size_1(self):
+        self.assert_query_counts(1)
+
+    def test_page_size_10(self):
+        self.assert_query_counts(10)
+
+
+class IndexUsageTests(TestCase):
+    """Горячие запросы идут по индексам из миграций 0003-0005 (по EXPLAIN)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        DataGenerator(seed=42).generate(
+            specialists=50, clients=500, appointments=20_000
+        )
+        # Без статистики планировщик на маленьких таблицах выбирает полный просмотр
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assert_uses_index(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan, f'{queryset.query}\n{plan}')
+
+    def setUp(self):
+        self.specialist = Specialist.objects.order_by('id').first()
+        self.client_profile = Client.objects.order_by('id').first()
+        self.category = ServiceCategory.objects.order_by('id').first()
+        self.day = date.today() + timedelta(days=7)
+
+    def test_overlap_check(self):
+        self.assert_uses_index(
+            Appointment.objects.overlapping(self.specialist, self.day, time(10), time(10, 30)),
+            'appointment_conflict_idx',
+        )
+
+    def test_available_slots(self):
+        self.assert_uses_index(
+            Appointment.objects.active().filter(specialist=self.specialist, date=self.day)
+            .values_list('start_time', 'end_time'),
+            'appointment_conflict_idx',
+        )
+
+    def test_client_appointments(self):
+        self.assert_uses_index(
+            Appointment.objects.filter(client=self.client_profile, date__gte=date.today()),
+            'appointment_client_date_idx',
+        )
+
+    def test_appointments_keyset_page(self):
+        ordering = ('date', 'start_time', 'id')
+        self.assert_uses_index(
+            Appointment.objects.filter(keyset_filter(ordering, [self.day, time(10), 0])).order_by(*ordering)[:10],
+            'appointment_keyset_idx',
+        )
+
+    def test_specialists_by_city(self):
+        # На SQLite iexact сравнивает через LIKE, для него отдельный индекс с COLLATE NOCASE
+        index = 'specialist_active_city_nocase_idx' if connection.vendor == 'sqlite' else 'specialist_active_city_idx'
+        self.assert_uses_index(Specialist.objects.filter(is_active=True, city__iexact='Казань'), index)
+
+    def test_services_by_category(self):
+        self.assert_uses_index(
+            Service.objects.filter(is_active=True, category=self.category),
+            'service_active_category_idx',
+        )
+
+    def test_services_of_specialist_in_category(self):
+        self.assert_uses_index(
+            Service.objects.filter(is_active=True, category=self.category, specialist=self.specialist),
+            'service_active_category_idx',
+        )
+
+    def test_client_by_telegram_id(self):
+        self.assert_uses_index(
+            Client.objects.filter(telegram_id=self.client_profile.telegram_id),
+            'client_telegram_id_idx',
+        )
+
+
+class KeysetCursorTests(TestCase):
+
+    def setUp(self):
+        specialist, service, client = create_booking_data()
+        day = date.today() + timedelta(days=1)
+        fields = {'client': client, 'service': service, 'specialist': specialist, 'date': day}
+        # Много записей с одинаковыми (date, start_time): порядок решает только id
+        Appointment.objects.bulk_create(
+            [Appointment(start_time=time(10), end_time=time(10, 30), status='cancelled', **fields) for _ in range(23)]
+            + [Appointment(start_time=time(9), end_time=time(9, 30), **fields)]
+            + [Appointment(start_time=time(11), end_time=time(11, 30), **fields)]
+        )
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_next_links_return_every_row_once(self):
+        ids = []
+        url, params = '/api/appointments/', {'page_size': 4}
+        while url:
+            response = self.api.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids += [row['id'] for row in response.data['results']]
+            url, params = response.data['next'], None
+
+        self.assertEqual(len(ids), len(set(ids)))
+        expected = Appointment.objects.order_by('date', 'start_time', 'id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_fields_trims_response(self):
+        response = self.api.get('/api/appointments/', {'fields': 'id,status'})
+
+        self.assertEqual({tuple(sorted(row)) for row in response.data['results']}, {('id', 'status')})
+
+    def test_export_is_staff_only(self):
+        self.assertIn(APIClient().get('/api/appointments/export/').status_code, (401, 403))
+        api = APIClient()
+        api.force_authenticate(Client.objects.get().user)
+        self.assertEqual(api.get('/api/appointments/export/').status_code, 403)
+
+    def test_export_streams_filtered_rows_as_ndjson(self):
+        response = self.api.get('/api/appointments/export/', {'status': 'cancelled', 'fields': 'id,status'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        expected = Appointment.objects.filter(status='cancelled').order_by('date', 'start_time', 'id')
+        self.assertEqual(rows, [{'id': pk, 'status': 'cancelled'} for pk in expected.values_list('id', flat=True)])
+
+    def test_export_batches_cover_equal_keys(self):
+        ordering = ('date', 'start_time', 'id')
+        batches = list(export_batches(Appointment.objects.all(), ordering, batch_size=4))
+
+        self.assertTrue(all(len(batch) <= 4 for batch in batches))
+        self.assertEqual(
+            [obj.id for batch in batches for obj in batch],
+            list(Appointment.objects.order_by(*ordering).values_list('id', flat=True)),
+        )
+
+    def test_cursor_with_nulls_is_not_found(self):
+        cursor = encode_cursor([None, None, None])
+
+        response = self.api.get('/api/appointments/', {'cursor': cursor})
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AccessTests(TestCase):
+
+    def setUp(self):
+        self.specialist, self.service, self.client_profile = create_booking_data()
+        Appointment.objects.create(
+            client=self.client_profile, service=self.service, specialist=self.specialist,
+            date=date.today() + timedelta(days=1), start_time=time(10), end_time=time(10, 30),
+        )
+
+    def test_anonymous_sees_no_appointments(self):
+        response = APIClient().get('/api/appointments/', {'client_id': self.client_profile.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_anonymous_sees_no_clients(self):
+        response = APIClient().get('/api/clients/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_by_telegram_requires_staff(self):
+        url = f'/api/clients/by_telegram/{self.client_profile.telegram_id}/'
+        api = APIClient()
+        self.assertIn(api.get(url).status_code, (401, 403))
+
+        api.force_authenticate(self.client_profile.user)
+        self.assertEqual(api.get(url).status_code, 403)
+
+    def test_by_telegram_with_service_token(self):
+        call_command('create_service_token', stdout=StringIO())
+        token = Token.objects.get(user__username='mcp_server')
+        api = APIClient(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        response = api.get(f'/api/clients/by_telegram/{self.client_profile.telegram_id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], self.client_profile.id)
+
+
+class SlotTests(SimpleTestCase):
+
+    def starts(self, slots):
+        return [(slot['start_time'], slot['end_time']) for slot in slots]
+
+    def test_merge_overlapping_and_touching(self):
+        self.assertEqual(
+            merge_intervals([(60, 90), (90, 120), (10, 20), (15, 30), (40, 40)]),
+            [(10, 30), (60, 120)],
+        )
+
+    def test_free_intervals_clip_to_window(self):
+        self.assertEqual(free_intervals(540, 720, [(480, 570), (705, 780)]), [(570, 705)])
+        self.assertEqual(free_intervals(540, 720, [(400, 500), (800, 900)]), [(540, 720)])
+
+    def test_overlapping_and_touching_appointments(self):
+        slots = compute_slots(time(9), time(12), [
+            (time(10), time(10, 30)), (time(10, 15), time(11)), (time(11), time(11, 30)),
+        ])
+        self.assertEqual(self.starts(slots), [('09:00', '09:30'), ('09:30', '10:00'), ('11:30', '12:00')])
+
+    def test_appointments_partly_outside_window(self):
+        slots = compute_slots(time(9), time(12), [(time(8), time(9, 30)), (time(11, 45), time(13))])
+        self.assertEqual(self.starts(slots), [
+            ('09:30', '10:00'), ('10:00', '10:30'), ('10:30', '11:00'), ('11:00', '11:30'),
+        ])
+
+    def test_service_longer_than_free_gap(self):
+        slots = compute_slots(
+            time(9), time(12), [(time(10), time(10, 30)), (time(11), time(12))], slot_minutes=60,
+        )
+        self.assertEqual(self.starts(slots), [('09:00', '10:00')])
+
+    def test_step_smaller_than_slot(self):
+        self.assertEqual(
+            self.starts(compute_slots(time(9), time(10, 30), [], slot_minutes=60, step_minutes=30)),
+            [('09:00', '10:00'), ('09:30', '10:30')],
+        )
+        # Начало слота выравнивается по сетке от начала рабочего дня
+        self.assertEqual(
+            self.starts(compute_slots(time(9), time(10, 30), [(time(9), time(9, 15))], slot_minutes=60, step_minutes=30)),
+            [('09:30', '10:30')],
+        )
+
+
+class AvailabilityTests(TestCase):
+
+    def setUp(self):
+        self.kazan, self.kazan_service, self.client_profile = create_booking_data(0)
+        self.moscow, self.moscow_service, _ = create_booking_data(1)
+        Specialist.objects.filter(pk=self.moscow.pk).update(city='Москва')
+        self.day = date.today() + timedelta(days=1)
+        Appointment.objects.create(
+            client=self.client_profile, service=self.kazan_service, specialist=self.kazan,
+            date=self.day, start_time=time(9), end_time=time(17, 30),
+        )
+        self.api = APIClient()
+
+    def get(self, **params):
+        params.setdefault('date_from', self.day.isoformat())
+        return self.api.get('/api/specialists/availability/', params)
+
+    def test_range_over_limit_is_rejected(self):
+        response = self.get(date_to=(self.day + timedelta(days=14)).isoformat())
+        self.assertEqual(response.status_code, 400)
+        response = self.get(date_to=(self.day + timedelta(days=13)).isoformat())
+        self.assertEqual(response.status_code, 200)
+
+    def test_filter_by_city(self):
+        # LIKE в SQLite не сравнивает кириллицу без учёта регистра
+        response = self.get(date_to=self.day.isoformat(), city='Москва')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.moscow.id])
+
+    def test_filter_by_category(self):
+        response = self.get(date_to=self.day.isoformat(), category_id=self.kazan_service.category_id)
+        results = response.data['results']
+        self.assertEqual([row['id'] for row in results], [self.kazan.id])
+        # Занятое время в слоты не попадает
+        self.assertEqual(results[0]['days'][0]['slots'], [{'start_time': '17:30', 'end_time': '18:00'}])
+
+    def test_query_count_does_not_depend_on_days(self):
+        for days in (1, 14):
+            with self.subTest(days=days), self.assertNumQueries(4):
+                response = self.get(date_to=(self.day + timedelta(days=days - 1)).isoformat())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results'][0]['days']), days)
+
+
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.specialist, self.service, self.client_profile = create_booking_data()
+        self.api = APIClient()
+
+    def get_categories(self, **headers):
+        return self.api.get('/api/categories/', **headers)
+
+    def test_repeat_get_with_etag_is_not_modified(self):
+        etag = self.get_categories()['ETag']
+
+        response = self.get_categories(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_change_changes_etag(self):
+        first = self.get_categories()
+        category = ServiceCategory.objects.get(pk=self.service.category_id)
+        category.name = 'Новое имя'
+        category.save()
+
+        response = self.get_categories(HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertNotEqual(response['Last-Modified'], first['Last-Modified'])
+
+    def test_appointment_change_keeps_catalog_cached(self):
+        first = self.get_categories()
+        Appointment.objects.create(
+            client=self.client_profile, service=self.service, specialist=self.specialist,
+            date=date.today() + timedelta(days=1), start_time=time(10), end_time=time(10, 30),
+        ).delete()
+
+        # Версия каталога не сменилась - ответ целиком из кэша
+        with self.assertNumQueries(0):
+            response = self.get_categories(HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_non_catalog_deletes_stay_fast(self):
+        # Обработчики каталога не должны отключать DELETE без загрузки строк
+        for model in (Appointment, Client, User):
+            with self.subTest(model=model.__name__):
+                self.assertFalse(post_delete.has_listeners(model))
+        self.assertTrue(Collector(using='default').can_fast_delete(Appointment.objects.all()))
+
+
+class AsyncCatalogTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for index, name in enumerate(['Анна', 'Петр', 'Иван']):
+            specialist, _, _ = create_booking_data(index)
+            Specialist.objects.filter(pk=specialist.pk).update(name=name)
+        self.api = APIClient()
+
+    def names(self, url, **params):
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()['results']]
+
+    def test_ordering_matches_sync_viewset(self):
+        for ordering in ('-name', 'name', 'city,-name', 'unknown'):
+            with self.subTest(ordering=ordering):
+                self.assertEqual(
+                    self.names('/api/async/specialists/', ordering=ordering),
+                    self.names('/api/specialists/', ordering=ordering),
+                )
+        self.assertEqual(self.names('/api/async/specialists/', ordering='-name'), ['Петр', 'Иван', 'Анна'])
+
+    def test_services_ordering(self):
+        Service.objects.filter(name='Услуга 1').update(price=5000)
+        self.assertEqual(
+            self.names('/api/async/services/', ordering='-price'),
+            self.names('/api/services/', ordering='-price'),
+        )
+
+    def test_conditional_get(self):
+        first = self.api.get('/api/async/specialists/')
+        self.assertIn('Last-Modified', first)
+
+        response = self.api.get('/api/async/specialists/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        specialist = Specialist.objects.get(name='Анна')
+        specialist.name = 'Алла'
+        specialist.save()
+        response = self.api.get('/api/async/specialists/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertIn('Алла', [row['name'] for row in response.json()['results']])
+
+
+class DataGeneratorTests(TestCase):
+
+    def test_clear_runs_fixed_number_of_queries(self):
+        kept = create_booking_data()
+        for prefix, size in (('small', 1), ('large', 5)):
+            with self.subTest(size=size):
+                generator = DataGenerator(prefix=prefix)
+                generator.generate(specialists=2 * size, clients=5 * size, appointments=100 * size)
+                # По DELETE на таблицу профилей и записей и каскад от пользователей
+                # без загрузки профилей, сколько бы строк ни было
+                with self.assertNumQueries(15):
+                    generator.clear()
+                self.assertFalse(User.objects.filter(username__startswith=f'{prefix}_').exists())
+        self.assertEqual(Appointment.objects.count(), 0)
+        self.assertEqual(Specialist.objects.get().pk, kept[0].pk)
+        self.assertEqual(Service.objects.get().pk, kept[1].pk)
+        self.assertEqual(Client.objects.get().pk, kept[2].pk)
@@ -0,0 +1,118 @@
+"""
+Трассировка запросов к API на OpenTelemetry.
+
+Спан на каждый HTTP-запрос (с родителем из заголовка traceparent,
+который присылает MCP-сервер) и дочерний спан на каждый SQL-запрос.
+Выгрузка задаётся настройкой TRACING_EXPORTER: none, console,
+file (JSON спанов в TRACING_FILE, по строке на спан) или otlp
+(OTLP/HTTP, нужен пакет opentelemetry-exporter-otlp-proto-http).
+"""
+import sys
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+tracer = trace.get_tracer('booking')
+
+# Длинные запросы (IN на тысячи id) обрезаются
+MAX_STATEMENT_LENGTH = 2000
+
+
+def make_exporter(name):
+    if name == 'console':
+        return ConsoleSpanExporter(out=sys.stderr)
+    if name == 'file':
+        # Тот же ConsoleSpanExporter, но в файл и по спану на строку
+        return ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE, 'a'),
+            formatter=lambda span: span.to_json(indent=None) + '\n',
+        )
+    if name == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f'Unknown TRACING_EXPORTER: {name}')
+
+
+def setup_tracing():
+    """Включить выгрузку спанов, если задан TRACING_EXPORTER"""
+    if settings.TRACING_EXPORTER == 'none':
+        return
+    provider = TracerProvider(resource=Resource.create({'service.name': settings.TRACING_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(make_exporter(settings.TRACING_EXPORTER)))
+    trace.set_tracer_provider(provider)
+
+
+@contextmanager
+def request_span(request):
+    # HttpHeaders не зависит от регистра, traceparent найдётся в любом написании
+    parent = propagate.extract(request.headers)
+    with tracer.start_as_current_span(f'{request.method} {request.path}', context=parent, kind=SpanKind.SERVER, attributes={
+        'http.request.method': request.method,
+        'url.path': request.path,
+    }) as span:
+        yield span
+
+
+def finish_span(span, request, response):
+    match = getattr(request, 'resolver_match', None)
+    if match is not None and match.route:
+        # Имя по шаблону маршрута, чтобы запросы к разным id группировались
+        span.update_name(f'{request.method} {match.route}')
+        span.set_attribute('http.route', match.route)
+    span.set_attribute('http.response.status_code', response.status_code)
+    if response.status_code >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+
+
+@sync_and_async_middleware
+def tracing_middleware(get_response):
+    """Спан на каждый запрос; SQL-запросы внутри становятся дочерними спанами"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with request_span(request) as span:
+                response = await get_response(request)
+                finish_span(span, request, response)
+            return response
+    else:
+        def middleware(request):
+            with request_span(request) as span:
+                response = get_response(request)
+                finish_span(span, request, response)
+            return response
+    return middleware
+
+
+def trace_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL: спан на запрос, если он идёт внутри трассы"""
+    if not trace.get_current_span().is_recording():
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    attributes = {
+        'db.system': connection.vendor,
+        'db.name': connection.alias,
+        'db.statement': sql[:MAX_STATEMENT_LENGTH],
+    }
+    if many:
+        attributes['db.executemany'] = True
+    with tracer.start_as_current_span(f'SQL {sql.split(None, 1)[0].upper()}', kind=SpanKind.CLIENT, attributes=attributes):
+        return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_tracing(sender, connection, **kwargs):
+    """
+    Подключить trace_query к каждому соединению.
+
+    Обёртка ставится на соединение, а не на время запроса в middleware:
+    async-представления выполняют ORM в отдельном потоке со своим соединением.
+    """
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
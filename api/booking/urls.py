@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ServiceCategoryViewSet, SpecialistViewSet, ServiceViewSet, ClientViewSet, AppointmentViewSet, SpecialistScheduleViewSet
+from .views import ServiceCategoryViewSet, SpecialistViewSet, ServiceViewSet, ClientViewSet, AppointmentViewSet, SpecialistScheduleViewSet, health
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'categories', ServiceCategoryViewSet)
@@ -10,6 +11,16 @@ router.register(r'services', ServiceViewSet)
 router.register(r'clients', ClientViewSet)
 router.register(r'appointments', AppointmentViewSet)
 
+# Асинхронные эндпоинты чтения для запуска под ASGI (uvicorn boba.asgi:application)
+async_urlpatterns = [
+    path('specialists/', async_views.specialists_list, name='async-specialist-list'),
+    path('specialists/<int:pk>/schedule/', async_views.specialist_schedule, name='async-specialist-schedule'),
+    path('specialists/<int:pk>/available_slots/', async_views.specialist_available_slots, name='async-specialist-available-slots'),
+    path('services/', async_views.services_list, name='async-service-list'),
+]
+
 urlpatterns = [
+    path('health/', health, name='health'),
+    path('async/', include(async_urlpatterns)),
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
@@ -1,15 +1,68 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, filters, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
 from datetime import datetime, timedelta, date
 from .models import ServiceCategory, Specialist, Service, Client, Appointment, SpecialistSchedule
-from .serializers import ServiceCategorySerializer, SpecialistSerializer, ServiceSerializer, ClientSerializer, AppointmentSerializer, SpecialistScheduleSerializer
+from .serializers import ServiceCategorySerializer, SpecialistSerializer, ServiceSerializer, ClientSerializer, AppointmentSerializer, SpecialistScheduleSerializer, has_overlap
+from .cache import CatalogCacheMixin, catalog_cache
+from .db import ReplicaReadMixin, check_databases
+from .pagination import ExportMixin, KeysetPagination
+from .slots import compute_slots, compute_availability, DEFAULT_SLOT_MINUTES
+
+# Максимальная длина диапазона дат для поиска свободных слотов
+MAX_AVAILABILITY_DAYS = 14
+
+# Exclusion constraint против пересечений записей (миграция 0003, только PostgreSQL)
+OVERLAP_CONSTRAINT = 'appointment_no_overlap'
 
 # Create your views here.
 
-class ServiceCategoryViewSet(viewsets.ModelViewSet):
+def lock_specialist(specialist_id):
+    """
+    Заблокировать строку специалиста до конца текущей транзакции.
+    
+    SQLite не поддерживает SELECT ... FOR UPDATE, поэтому там блокировка записи
+    берётся холостым UPDATE в начале транзакции - иначе параллельные транзакции
+    упираются друг в друга при переходе от чтения к записи.
+    """
+    if connection.vendor == 'sqlite':
+        Specialist.objects.filter(pk=specialist_id).update(is_active=F('is_active'))
+    else:
+        Specialist.objects.select_for_update().get(pk=specialist_id)
+
+def save_without_overlap(save, specialist, date, start_time, end_time, status_value, exclude_id=None):
+    """
+    Выполнить save(), исключив двойное бронирование.
+    
+    Строка специалиста блокируется на время транзакции, поэтому параллельные
+    записи к одному специалисту проверяются и сохраняются по очереди.
+    На PostgreSQL дополнительно действует exclusion constraint: если он
+    всё же сработал, клиент получает ту же ошибку 400, а не 500.
+    """
+    try:
+        with transaction.atomic():
+            lock_specialist(specialist.pk)
+            if status_value in Appointment.ACTIVE_STATUSES and has_overlap(
+                specialist, date, start_time, end_time, exclude_id=exclude_id,
+            ):
+                raise ValidationError("Выбранное время уже занято.")
+            return save()
+    except IntegrityError as exc:
+        # Остальные нарушения (внешний ключ, NOT NULL) - не занятое время
+        if not is_overlap_violation(exc):
+            raise
+        raise ValidationError("Выбранное время уже занято.")
+
+def is_overlap_violation(exc):
+    """IntegrityError вызван OVERLAP_CONSTRAINT (psycopg передаёт имя в diag)"""
+    diag = getattr(exc.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == OVERLAP_CONSTRAINT
+
+class ServiceCategoryViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     """
     API для работы с категориями услуг.
     
@@ -37,7 +90,7 @@ class ServiceCategoryViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
 
-class SpecialistViewSet(viewsets.ModelViewSet):
+class SpecialistViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     """
     API для работы со специалистами (мастерами/врачами).
     
@@ -68,7 +121,8 @@ class SpecialistViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'specialization', 'city']
     
     def get_queryset(self):
-        queryset = Specialist.objects.filter(is_active=True)
+        # SpecialistSerializer выводит пользователя и расписание
+        queryset = Specialist.objects.filter(is_active=True).select_related('user').prefetch_related('schedules')
         
         # Фильтрация по городу
         city = self.request.query_params.get('city', None)
@@ -82,7 +136,83 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Получить свободные слоты нескольких специалистов на диапазон дат.
+        
+        Принимает параметры запроса:
+        - date_from, date_to: диапазон дат в формате YYYY-MM-DD
+          (по умолчанию неделя, начиная с текущей даты, не более 14 дней)
+        - city, category_id, specialization, search: фильтры специалистов
+        - duration: длина слота в минутах (по умолчанию 30)
+        
+        Возвращает постраничный список специалистов со свободными слотами по дням.
+        """
+        try:
+            date_from = datetime.strptime(
+                request.query_params.get('date_from', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d'
+            ).date()
+            date_to = request.query_params.get('date_to', None)
+            if date_to:
+                date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+            else:
+                date_to = date_from + timedelta(days=6)
+        except ValueError:
+            return Response({"error": "Неверный формат даты. Используйте YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if date_to < date_from:
+            return Response({"error": "date_to не может быть раньше date_from"}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days >= MAX_AVAILABILITY_DAYS:
+            return Response({"error": f"Диапазон дат не может превышать {MAX_AVAILABILITY_DAYS} дней"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            slot_minutes = int(request.query_params.get('duration', DEFAULT_SLOT_MINUTES))
+        except ValueError:
+            slot_minutes = 0
+        if slot_minutes <= 0:
+            return Response({"error": "duration должен быть положительным числом минут"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        
+        # Фильтрация по специализации
+        specialization = request.query_params.get('specialization', None)
+        if specialization:
+            queryset = queryset.filter(specialization__icontains=specialization)
+        
+        specialists = queryset.order_by('id').values('id', 'name', 'specialization', 'city')
+        page = self.paginate_queryset(specialists)
+        specialists = page if page is not None else list(specialists)
+        specialist_ids = [specialist['id'] for specialist in specialists]
+        
+        # Одним запросом получаем расписания и одним - активные записи всех специалистов
+        schedules = SpecialistSchedule.objects.filter(
+            specialist_id__in=specialist_ids
+        ).values_list('specialist_id', 'day_of_week', 'start_time', 'end_time')
+        appointments = Appointment.objects.filter(
+            specialist_id__in=specialist_ids,
+            date__range=(date_from, date_to),
+            status__in=['pending', 'confirmed']
+        ).values_list('specialist_id', 'date', 'start_time', 'end_time')
+        
+        availability = compute_availability(
+            schedules,
+            appointments,
+            date_from,
+            date_to,
+            slot_minutes=slot_minutes,
+            step_minutes=DEFAULT_SLOT_MINUTES,
+        )
+        results = [
+            dict(specialist, days=availability.get(specialist['id'], []))
+            for specialist in specialists
+        ]
+        if page is not None:
+            return self.get_paginated_response(results)
+        return Response(results)
+    
     @action(detail=True, methods=['get'])
+    @catalog_cache
     def services(self, request, pk=None):
         """
         Получить все услуги специалиста.
@@ -91,7 +221,7 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         Поддерживает фильтрацию по категории услуг (?category_id=1).
         """
         specialist = self.get_object()
-        services = Service.objects.filter(specialist=specialist, is_active=True)
+        services = Service.objects.filter(specialist=specialist, is_active=True).select_related('specialist', 'category')
         
         # Фильтрация по категории
         category_id = request.query_params.get('category_id', None)
@@ -102,6 +232,7 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
+    @catalog_cache
     def schedule(self, request, pk=None):
         """
         Получить график работы специалиста.
@@ -109,7 +240,8 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         Возвращает расписание работы специалиста по дням недели.
         """
         specialist = self.get_object()
-        schedules = SpecialistSchedule.objects.filter(specialist=specialist)
+        # Расписание уже загружено prefetch_related в get_queryset
+        schedules = specialist.schedules.all()
         serializer = SpecialistScheduleSerializer(schedules, many=True)
         return Response(serializer.data)
     
@@ -121,6 +253,7 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         Возвращает список доступных слотов для записи на указанную дату.
         Принимает параметр запроса 'date' в формате YYYY-MM-DD.
         Если дата не указана, используется текущая дата.
+        Если передан 'service_id', длина слота равна продолжительности услуги.
         """
         specialist = self.get_object()
         
@@ -131,6 +264,17 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({"error": "Неверный формат даты. Используйте YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
         
+        # Длина слота: продолжительность услуги или стандартные 30 минут
+        slot_minutes = DEFAULT_SLOT_MINUTES
+        service_id = request.query_params.get('service_id', None)
+        if service_id:
+            try:
+                slot_minutes = Service.objects.values_list('duration', flat=True).get(
+                    pk=service_id, specialist=specialist
+                )
+            except (Service.DoesNotExist, ValueError):
+                return Response({"error": "Услуга не найдена у этого специалиста"}, status=status.HTTP_400_BAD_REQUEST)
+        
         # Проверяем, есть ли расписание на этот день недели
         day_of_week = requested_date.weekday()
         try:
@@ -138,58 +282,34 @@ class SpecialistViewSet(viewsets.ModelViewSet):
         except SpecialistSchedule.DoesNotExist:
             return Response({"error": f"Специалист не работает в этот день недели"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Получаем все подтвержденные записи на эту дату
+        # Получаем все активные записи на эту дату
         appointments = Appointment.objects.filter(
             specialist=specialist,
             date=requested_date,
             status__in=['pending', 'confirmed']
-        ).order_by('start_time')
-        
-        # Определяем рабочее время специалиста
-        work_start = schedule.start_time
-        work_end = schedule.end_time
-        
-        # Стандартная продолжительность слота (30 минут)
-        slot_duration = timedelta(minutes=30)
-        
-        # Создаем временные слоты
-        slots = []
-        current_time = work_start
-        current_datetime = datetime.combine(requested_date, current_time)
-        
-        while current_time < work_end:
-            end_datetime = current_datetime + slot_duration
-            slot_end_time = end_datetime.time()
-            
-            # Проверяем, не пересекается ли этот слот с существующими записями
-            is_available = True
-            for appointment in appointments:
-                if (current_time < appointment.end_time and slot_end_time > appointment.start_time):
-                    is_available = False
-                    break
-            
-            if is_available:
-                slots.append({
-                    'start_time': current_time.strftime('%H:%M'),
-                    'end_time': slot_end_time.strftime('%H:%M')
-                })
-            
-            # Переходим к следующему слоту
-            current_datetime = end_datetime
-            current_time = current_datetime.time()
-        
+        ).values_list('start_time', 'end_time')
+        
+        slots = compute_slots(
+            schedule.start_time,
+            schedule.end_time,
+            appointments,
+            slot_minutes=slot_minutes,
+            step_minutes=DEFAULT_SLOT_MINUTES,
+        )
         return Response(slots)
 
-class SpecialistScheduleViewSet(viewsets.ModelViewSet):
+class SpecialistScheduleViewSet(ReplicaReadMixin, ExportMixin, viewsets.ModelViewSet):
     """
     API для работы с расписанием специалистов
     """
     queryset = SpecialistSchedule.objects.all()
     serializer_class = SpecialistScheduleSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
     filter_backends = [filters.SearchFilter]
     
     def get_queryset(self):
+        # SpecialistScheduleSerializer использует только собственные поля, join не нужен
         queryset = SpecialistSchedule.objects.all()
         
         # Фильтрация по специалисту
@@ -204,7 +324,7 @@ class SpecialistScheduleViewSet(viewsets.ModelViewSet):
             
         return queryset
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     """
     API для работы с услугами
     """
@@ -216,7 +336,8 @@ class ServiceViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'price', 'duration']
     
     def get_queryset(self):
-        queryset = Service.objects.filter(is_active=True)
+        # ServiceSerializer выводит имена специалиста и категории
+        queryset = Service.objects.filter(is_active=True).select_related('specialist', 'category')
         
         # Фильтрация по категории
         category_id = self.request.query_params.get('category_id', None)
@@ -235,24 +356,46 @@ class ServiceViewSet(viewsets.ModelViewSet):
             
         return queryset
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     API для работы с клиентами
     """
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'phone', 'email', 'city']
     
     def get_queryset(self):
         # Обычный пользователь видит только свой профиль
         user = self.request.user
+        if not user.is_authenticated:
+            return Client.objects.none()
+        # ClientSerializer выводит вложенного пользователя
+        queryset = Client.objects.select_related('user')
         if user.is_staff:
-            return Client.objects.all()
-        return Client.objects.filter(user=user)
+            return queryset
+        return queryset.filter(user=user)
+
+    @action(detail=False, methods=['get'], url_path=r'by_telegram/(?P<telegram_id>\d+)',
+            permission_classes=[permissions.IsAdminUser])
+    def by_telegram(self, request, telegram_id=None):
+        """
+        Найти клиента по Telegram ID.
+
+        Один запрос по индексу client_telegram_id_idx вместо перебора
+        списка клиентов. Бот вызывает его на каждого нового собеседника,
+        поэтому отдаются только id, имя и город, без контактов. Поиск
+        идёт мимо ограничения "только свой профиль", поэтому доступен
+        только персоналу (MCP-сервер ходит с токеном служебного пользователя).
+        """
+        client = Client.objects.filter(telegram_id=telegram_id).values('id', 'name', 'city').first()
+        if client is None:
+            return Response({'detail': 'Клиент не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(client)
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ExportMixin, viewsets.ModelViewSet):
     """
     API для работы с записями на прием.
     
@@ -268,6 +411,12 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         - статусу (?status=pending)
         - диапазону дат (?date_from=2024-05-01&date_to=2024-05-31)
         
+        Записи отсортированы по дате, времени начала и id и выдаются
+        страницами по курсору (?cursor=, ?page_size= до 100).
+        
+    export:
+        Выгрузить все подходящие записи в NDJSON (только для персонала).
+        
     retrieve:
         Получить детальную информацию о записи по ID.
         
@@ -287,24 +436,28 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # Сортировка задаётся ключом пагинации, OrderingFilter с ним несовместим
+    filter_backends = [filters.SearchFilter]
     search_fields = ['client__name', 'specialist__name', 'service__name']
-    ordering_fields = ['date', 'start_time', 'status']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('date', 'start_time', 'id')
     
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            queryset = Appointment.objects.all()
-        else:
+        # AppointmentSerializer выводит имена клиента, услуги, категории и специалиста
+        queryset = Appointment.objects.select_related('client', 'service__category', 'specialist')
+        if not user.is_authenticated:
+            return Appointment.objects.none()
+        if not user.is_staff:
             # Клиент видит только свои записи
             try:
                 client = Client.objects.get(user=user)
-                queryset = Appointment.objects.filter(client=client)
+                queryset = queryset.filter(client=client)
             except Client.DoesNotExist:
                 # Специалист видит только записи к себе
                 try:
                     specialist = Specialist.objects.get(user=user)
-                    queryset = Appointment.objects.filter(specialist=specialist)
+                    queryset = queryset.filter(specialist=specialist)
                 except Specialist.DoesNotExist:
                     return Appointment.objects.none()
         
@@ -347,6 +500,47 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def perform_create(self, serializer):
+        self._save_without_overlap(serializer)
+    
+    def perform_update(self, serializer):
+        self._save_without_overlap(serializer)
+    
+    def _save_without_overlap(self, serializer):
+        data = serializer.validated_data
+        instance = serializer.instance
+        save_without_overlap(
+            serializer.save,
+            data.get('specialist', getattr(instance, 'specialist', None)),
+            data.get('date', getattr(instance, 'date', None)),
+            data.get('start_time', getattr(instance, 'start_time', None)),
+            data.get('end_time', getattr(instance, 'end_time', None)),
+            data.get('status', getattr(instance, 'status', 'pending')),
+            exclude_id=instance.id if instance else None,
+        )
+    
+    def _set_status(self, status_value):
+        """
+        Сменить статус записи.
+        
+        Возврат отменённой или завершённой записи в активный статус снова
+        занимает время специалиста, поэтому проверяется на пересечения
+        под той же блокировкой, что и создание записи.
+        """
+        appointment = self.get_object()
+        appointment.status = status_value
+        save_without_overlap(
+            appointment.save,
+            appointment.specialist,
+            appointment.date,
+            appointment.start_time,
+            appointment.end_time,
+            status_value,
+            exclude_id=appointment.id,
+        )
+        serializer = self.get_serializer(appointment)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """
@@ -355,11 +549,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         Изменяет статус записи на 'cancelled' (отменено).
         Доступно для клиентов и специалистов, которым принадлежит запись.
         """
-        appointment = self.get_object()
-        appointment.status = 'cancelled'
-        appointment.save()
-        serializer = self.get_serializer(appointment)
-        return Response(serializer.data)
+        return self._set_status('cancelled')
     
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
@@ -369,11 +559,7 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         Изменяет статус записи на 'confirmed' (подтверждено).
         Обычно используется специалистами для подтверждения записи.
         """
-        appointment = self.get_object()
-        appointment.status = 'confirmed'
-        appointment.save()
-        serializer = self.get_serializer(appointment)
-        return Response(serializer.data)
+        return self._set_status('confirmed')
     
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
@@ -383,8 +569,23 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         Изменяет статус записи на 'completed' (завершено).
         Используется специалистами после оказания услуги.
         """
-        appointment = self.get_object()
-        appointment.status = 'completed'
-        appointment.save()
-        serializer = self.get_serializer(appointment)
-        return Response(serializer.data)
+        return self._set_status('completed')
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def health(request):
+    """
+    Проверка доступности баз данных.
+    
+    Возвращает 503, если недоступна основная база; недоступная реплика
+    отмечается статусом degraded.
+    """
+    databases = check_databases()
+    if not databases['default']['ok']:
+        health_status, code = 'unavailable', status.HTTP_503_SERVICE_UNAVAILABLE
+    elif all(database['ok'] for database in databases.values()):
+        health_status, code = 'ok', status.HTTP_200_OK
+    else:
+        health_status, code = 'degraded', status.HTTP_200_OK
+    return Response({'status': health_status, 'databases': databases}, status=code)
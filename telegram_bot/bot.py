@@ -3,29 +3,102 @@ from aiogram.filters import CommandStart
 from aiogram.types import Message
 import logging
 import os
-from langchain_ollama import ChatOllama
 from langchain_core.messages.ai import AIMessage
 from mcp_use import MCPAgent, MCPClient
 import os
 import re
+import json
 from dotenv import load_dotenv
-from asyncio import run
+from asyncio import run, create_task
+from sessions import SessionManager
+from streaming import MessageStreamer
+from webhook import create_app, UpdateDeduplicator, RedisUpdateDeduplicator
+from router import FastPathRouter
+from cache import TTLCache
+import tracing
+import metrics
+import memory
+import inference
+import tool_calls
+from prometheus_client import REGISTRY, start_http_server
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
+tracing.setup_tracing("telegram-bot")
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 OLLAMA_URL = os.getenv("OLLAMA_URL")
+# Параметры инференса Ollama (см. inference.py)
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen3:8b")
+# Сколько модель держится в памяти после запроса: "30m", секунды, "-1" - не выгружать
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Контекст в токенах: системный промпт, схемы инструментов, память диалога и шаги агента
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# Потоки CPU для инференса, 0 - на усмотрение Ollama
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", "0"))
+# Прогрев модели при старте и затем после каждых стольких секунд простоя; 0 - только при старте
+OLLAMA_WARMUP_INTERVAL = float(os.getenv("OLLAMA_WARMUP_INTERVAL", "300"))
+# Сколько запусков LLM может выполняться одновременно (для всех пользователей)
+MAX_CONCURRENT_RUNS = int(os.getenv("MAX_CONCURRENT_RUNS", "4"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "1800"))
+# Потоковый вывод ответа правками сообщения
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+# Не чаще одной правки сообщения за столько секунд (ограничения Telegram)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+# Режим получения обновлений: polling (для разработки) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес бота, например https://bot.example.com (если не задан, вебхук не регистрируется)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8001"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Общий Redis для дедупликации update_id между репликами
+REDIS_URL = os.getenv("REDIS_URL")
+# Быстрый путь без LLM для частых однозначных запросов
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+# Порт /metrics в режиме polling (в режиме вебхука метрики отдаёт само приложение); 0 - не поднимать
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+# Как часто забирать метрики дочернего MCP-сервера, секунды
+MCP_METRICS_INTERVAL = float(os.getenv("MCP_METRICS_INTERVAL", "15"))
+# Адрес общего MCP-сервиса (SSE), например http://mcp:8080/sse.
+# Если не задан, MCP-сервер запускается дочерним процессом бота (stdio)
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL")
+# Как часто проверять соединение с MCP-сервисом, секунды
+MCP_KEEPALIVE_INTERVAL = float(os.getenv("MCP_KEEPALIVE_INTERVAL", "30"))
+# Память диалогов: memory (в процессе), sqlite, redis (REDIS_URL) или none
+# (тогда историю хранит сам агент, без ограничения и до вытеснения сессии)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "memory")
+MEMORY_SQLITE_PATH = os.getenv("MEMORY_SQLITE_PATH", "memory.sqlite3")
+MEMORY_TTL = int(os.getenv("MEMORY_TTL", str(7 * 24 * 3600)))
+MEMORY_MAX_USERS = int(os.getenv("MEMORY_MAX_USERS", "10000"))
+# Сколько последних реплик передаётся дословно и сколько символов памяти всего попадает в промпт
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "6"))
+MEMORY_MAX_CHARS = int(os.getenv("MEMORY_MAX_CHARS", "4000"))
+# Сколько секунд помнить, какой клиент стоит за пользователем Telegram (и что его нет)
+CLIENT_CACHE_TTL = int(os.getenv("CLIENT_CACHE_TTL", "600"))
+CLIENT_CACHE_MAX_SIZE = int(os.getenv("CLIENT_CACHE_MAX_SIZE", "10000"))
+MCP_SERVER_NAME = "Appointment Booking Assistant"
+if MCP_SERVER_URL:
+    # Одна SSE-сессия на процесс бота, её делят все агенты
+    MCP_SERVER_CONFIG = {"url": MCP_SERVER_URL}
+else:
+    MCP_SERVER_CONFIG = {
+        "command": "mcp",
+        "args": [
+            "run",
+            "mcp_server.py"
+        ],
+        # Без env дочерний процесс получает только PATH/HOME и не видит настроек из .env
+        "env": dict(os.environ),
+    }
 CONFIG = {
       "mcpServers": {
-        "Appointment Booking Assistant": {
-            "command": "mcp",
-            "args": [
-                "run",
-                "mcp_server.py"
-            ]
-            }
+        MCP_SERVER_NAME: MCP_SERVER_CONFIG
       }
     }
 
@@ -34,8 +107,91 @@ SYSTEM_PROMPT = """
 """
 
 client = MCPClient.from_dict(CONFIG)
-llm = ChatOllama(model="qwen3:8b", base_url=OLLAMA_URL)
-agent = MCPAgent(llm=llm, client=client, max_steps=30, system_prompt=SYSTEM_PROMPT)
+llm = inference.make_llm(
+    OLLAMA_MODEL,
+    OLLAMA_URL,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    num_ctx=OLLAMA_NUM_CTX,
+    num_thread=OLLAMA_NUM_THREAD,
+    callbacks=[tracing.AgentStepTracer(), metrics.LLMStepMetrics()],
+)
+
+# Трассировка, метрики и запись в память вызовов инструментов
+tool_calls.register(tracing.trace_tool_call)
+tool_calls.register(metrics.measure_tool_call)
+tool_calls.register(memory.record_tool_call)
+
+def make_memory_store():
+    if MEMORY_BACKEND == "none":
+        return None
+    if MEMORY_BACKEND == "redis":
+        return memory.RedisStore(REDIS_URL, ttl=MEMORY_TTL)
+    if MEMORY_BACKEND == "sqlite":
+        return memory.SQLiteStore(MEMORY_SQLITE_PATH, ttl=MEMORY_TTL)
+    return memory.MemoryStore(max_size=MEMORY_MAX_USERS)
+
+memory_store = make_memory_store()
+conversations = memory.ConversationMemory(
+    memory_store, max_turns=MEMORY_MAX_TURNS, max_chars=MEMORY_MAX_CHARS,
+) if memory_store is not None else None
+
+def make_agent(model=None) -> MCPAgent:
+    # С внешней памятью история передаётся агенту при каждом запуске
+    return MCPAgent(
+        llm=model or llm, client=client, max_steps=30, system_prompt=SYSTEM_PROMPT, memory_enabled=conversations is None,
+    )
+
+sessions = SessionManager(
+    make_agent,
+    client=client,
+    max_concurrent_runs=MAX_CONCURRENT_RUNS,
+    max_sessions=MAX_SESSIONS,
+    idle_ttl=SESSION_IDLE_TTL,
+    on_connect=tool_calls.install,
+    memory=conversations,
+)
+
+async def call_tool(name: str, arguments: dict) -> list:
+    """Вызвать инструмент MCP напрямую, минуя агента"""
+    await sessions.connect()
+    result = await client.get_session(MCP_SERVER_NAME).call_tool(name, arguments)
+    if result.isError:
+        raise RuntimeError(f"Tool {name} failed: {result.content}")
+    return [json.loads(item.text) for item in result.content if item.type == "text"]
+
+client_cache = TTLCache(max_size=CLIENT_CACHE_MAX_SIZE)
+
+async def resolve_client(telegram_id):
+    """Клиент пользователя Telegram (id, имя, город) или None, если он не зарегистрирован"""
+    async def fetch():
+        found = (await call_tool("get_client_by_telegram_id", {"telegram_id": telegram_id}))[0]
+        return found if "id" in found else None
+    return await client_cache.get_or_fetch(telegram_id, "clients", CLIENT_CACHE_TTL, fetch)
+
+async def resolve_client_id(telegram_id):
+    found = await resolve_client(telegram_id)
+    return found["id"] if found else None
+
+async def client_context(telegram_id) -> str:
+    """Кто пишет боту - чтобы агенту не искать клиента самому; пустая строка, если узнать не удалось"""
+    try:
+        found = await resolve_client(telegram_id)
+    except Exception:
+        logger.warning("Failed to resolve client for %s", telegram_id, exc_info=True)
+        return ""
+    if found is None:
+        return "Пользователь не зарегистрирован как клиент."
+    return f"Пользователь - клиент {found['name']} (client_id: {found['id']}, город: {found['city']})."
+
+router = FastPathRouter(call_tool, resolve_client=resolve_client_id)
+warmer = inference.ModelWarmer(make_agent, llm, sessions, interval=OLLAMA_WARMUP_INTERVAL)
+
+REGISTRY.register(metrics.BotCollector(sessions, router))
+mcp_metrics = None
+if not MCP_SERVER_URL:
+    # Общий MCP-сервис отдаёт метрики сам, а дочерний процесс - только через ресурсы
+    mcp_metrics = metrics.MCPServerCollector(client, MCP_SERVER_NAME)
+    REGISTRY.register(mcp_metrics)
 
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
@@ -45,13 +201,30 @@ def parse_result(result: str) -> str:
     cleaned_text = re.sub(pattern, "", result, flags=re.DOTALL)
     return cleaned_text.strip()
 
-async def ask(message: Message) -> str:
+def build_query(message: Message, client: str = "") -> str:
     identifier = f"Пользователь с айди: {message.from_user.id} спрашивает у тебя:"
-    message_text = identifier + "\n" + message.text
-    content = await agent.run(message_text)
+    if client:
+        identifier = client + "\n" + identifier
+    return identifier + "\n" + message.text
+
+async def ask(message: Message) -> str:
+    query = build_query(message, await client_context(message.from_user.id))
+    with tracing.tracer.start_as_current_span("agent.run"), metrics.AGENT_RUNS.labels("run").time():
+        content = await sessions.run(message.from_user.id, query, text=message.text)
     result = AIMessage(content)
     return parse_result(result.content)
 
+async def ask_streaming(message: Message) -> str:
+    streamer = MessageStreamer(bot, message.chat.id, interval=STREAM_EDIT_INTERVAL)
+    query = build_query(message, await client_context(message.from_user.id))
+    with tracing.tracer.start_as_current_span("agent.run", attributes={"agent.streaming": True}), \
+            metrics.AGENT_RUNS.labels("stream").time():
+        content = await sessions.stream(message.from_user.id, query, streamer.update, text=message.text)
+    response = parse_result(content)
+    await streamer.finish(response)
+    logger.info('Time to first text: %s s', streamer.time_to_first_text)
+    return response
+
 @dp.message(CommandStart())
 async def start_command(message: Message):
     await message.answer(f"Hello, {message.from_user.first_name}! I'm your bot.")
@@ -59,14 +232,67 @@ async def start_command(message: Message):
 @dp.message()
 async def ask_llm(message: Message):
     message_text = message.text
-    await bot.send_chat_action(message.chat.id, "typing")
-    print(message_text)
-    response = await ask(message)
-    await message.answer(response, parse_mode="HTML")
+    with tracing.tracer.start_as_current_span("bot.message", attributes={"telegram.user_id": message.from_user.id}) as span:
+        if FAST_PATH_ENABLED:
+            with memory.recording() as calls:
+                response = await router.route(message.from_user.id, message_text)
+            if response is not None:
+                span.set_attribute("bot.route", "fast_path")
+                metrics.MESSAGES.labels("fast_path").inc()
+                await message.answer(response)
+                # Ответ быстрого пути тоже часть диалога: агент увидит его в следующей реплике
+                if conversations is not None:
+                    await conversations.remember(message.from_user.id, message_text, response, calls)
+                return
+        span.set_attribute("bot.route", "agent")
+        metrics.MESSAGES.labels("agent").inc()
+        await bot.send_chat_action(message.chat.id, "typing")
+        if STREAM_RESPONSES:
+            await ask_streaming(message)
+        else:
+            response = await ask(message)
+            await message.answer(response, parse_mode="HTML")
     
+def background_jobs():
+    jobs = [sessions.run_evictor, warmer.run]
+    if isinstance(memory_store, memory.SQLiteStore):
+        jobs.append(memory_store.run_purger)
+    if MCP_SERVER_URL:
+        jobs.append(lambda: sessions.run_keepalive(MCP_KEEPALIVE_INTERVAL))
+    else:
+        jobs.append(lambda: mcp_metrics.poll(MCP_METRICS_INTERVAL))
+    return jobs
+
 async def main():
-    await dp.start_polling(bot)
+    for job in background_jobs():
+        create_task(job())
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    # Каждое обновление обрабатывается в отдельной задаче, пользователи не ждут друг друга
+    await dp.start_polling(bot, handle_as_tasks=True)
+
+def create_webhook_app():
+    """
+    ASGI-приложение для режима вебхука.
+    Несколько реплик: uvicorn bot:create_webhook_app --factory --host 0.0.0.0 --port 8001
+    """
+    deduplicator = RedisUpdateDeduplicator(REDIS_URL) if REDIS_URL else UpdateDeduplicator()
+    return create_app(
+        bot,
+        dp,
+        WEBHOOK_PATH,
+        webhook_url=WEBHOOK_URL,
+        secret=WEBHOOK_SECRET,
+        workers=WEBHOOK_WORKERS,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        deduplicator=deduplicator,
+        background=background_jobs(),
+    )
 
 if __name__ == '__main__':
     logger.info('Running')
-    run(main())
\ No newline at end of file
+    if BOT_MODE == "webhook":
+        import uvicorn
+        uvicorn.run(create_webhook_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    else:
+        run(main())
\ No newline at end of file
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    In-process кэш ответов с TTL и вытеснением по LRU.
+
+    Одинаковые запросы, пришедшие одновременно, ждут один общий вызов fetch.
+    Записи группируются по тегам, чтобы сбрасывать их после изменения данных.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (expires_at, tag, value)
+        self._pending = {}  # key -> asyncio.Task
+        self._generations = {}  # tag -> номер поколения
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+    async def get_or_fetch(self, key, tag, ttl, fetch):
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.stats["hits"] += 1
+                self._data.move_to_end(key)
+                return entry[2]
+            del self._data[key]
+
+        task = self._pending.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(fetch())
+            self._pending[key] = task
+            generation = self._generations.get(tag, 0)
+            task.add_done_callback(lambda done: self._store(key, tag, ttl, generation, done))
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    def _store(self, key, tag, ttl, generation, task):
+        self._pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        # Данные могли измениться, пока шёл запрос
+        if self._generations.get(tag, 0) != generation:
+            return
+        self._data[key] = (time.monotonic() + ttl, tag, task.result())
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        for key in [key for key, entry in self._data.items() if entry[1] in tags]:
+            del self._data[key]
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["size"] = len(self._data)
+        stats["max_size"] = self.max_size
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else 0.0
+        return stats
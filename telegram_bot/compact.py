@@ -0,0 +1,273 @@
+"""
+Сжатие ответов инструментов MCP перед отправкой в контекст LLM.
+
+Ответы API рассчитаны на приложения: вложенный user, расписание каждого
+специалиста, описания, служебные поля. Для агента из них нужны id и то,
+что он пересказывает пользователю, а каждый лишний токен на маленькой
+локальной модели - это задержка. Поэтому ответ инструмента:
+
+    1. проецируется на нужные поля (project_* ниже), длинные списки
+       слотов сворачиваются в диапазоны времени начала;
+    2. укладывается в бюджет токенов: хвост списка отбрасывается,
+       агенту сообщается, сколько элементов не показано;
+    3. сериализуется в одну строку JSON без отступов. Иначе FastMCP
+       форматирует ответ с indent=2, а список разбивает на отдельные
+       текстовые блоки, которые mcp_use склеивает без разделителей.
+
+Токены оцениваются по длине JSON (CHARS_PER_TOKEN символов на токен):
+точный токенизатор модели серверу MCP недоступен, а для сравнения
+"до" и "после" оценки достаточно.
+"""
+import json
+import math
+import httpx
+from opentelemetry import trace
+
+CHARS_PER_TOKEN = 3
+
+DAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def raw_text(result) -> str:
+    """Текст, который FastMCP отправил бы без сжатия"""
+    items = result if isinstance(result, (list, tuple)) else [result]
+    return "".join(json.dumps(item, ensure_ascii=False, indent=2, default=str) for item in items)
+
+
+def hhmm(value):
+    """'09:30:00' -> '09:30'"""
+    return value[:5] if isinstance(value, str) else value
+
+
+def pick(item, fields):
+    return {field: item[field] for field in fields if field in item}
+
+
+def unwrap(page):
+    """Результаты страницы DRF; номер следующей страницы, если она есть"""
+    if not isinstance(page, dict) or "results" not in page:
+        return page, None
+    if not page.get("next"):
+        return page["results"], None
+    # У пагинации по курсору номера страницы нет, только признак продолжения
+    number = httpx.URL(page["next"]).params.get("page")
+    return page["results"], int(number) if number else True
+
+
+def paged(page, project):
+    results, next_page = unwrap(page)
+    results = [project(item) for item in results]
+    if next_page is None:
+        return results
+    return {"results": results, "next_page": next_page}
+
+
+def work_days(schedules):
+    """Расписание одной строкой: 'Пн-Пт 09:00-18:00, Сб 10:00-15:00'"""
+    days = sorted(schedules, key=lambda schedule: schedule["day_of_week"])
+    groups = []
+    for schedule in days:
+        hours = f"{hhmm(schedule['start_time'])}-{hhmm(schedule['end_time'])}"
+        day = schedule["day_of_week"]
+        if groups and groups[-1][2] == hours and groups[-1][1] == day - 1:
+            groups[-1][1] = day
+        else:
+            groups.append([day, day, hours])
+    return ", ".join(
+        f"{DAY_NAMES[first]}{'-' + DAY_NAMES[last] if last != first else ''} {hours}"
+        for first, last, hours in groups
+    )
+
+
+def start_ranges(slots):
+    """
+    Слоты [{start_time, end_time}, ...] -> диапазоны времени начала.
+
+    Слоты идут по сетке с шагом step, поэтому подряд идущие начала
+    сворачиваются в {"from": первое, "to": последнее}.
+    """
+    def minutes(value):
+        hours, mins = value.split(":")[:2]
+        return int(hours) * 60 + int(mins)
+
+    starts = [minutes(slot["start_time"]) for slot in slots]
+    if not starts:
+        return {"free": []}
+    gaps = [b - a for a, b in zip(starts, starts[1:]) if b > a]
+    step = min(gaps) if gaps else 30
+    ranges = []
+    for start in starts:
+        if ranges and start - ranges[-1][1] == step:
+            ranges[-1][1] = start
+        else:
+            ranges.append([start, start])
+
+    def fmt(value):
+        return f"{value // 60:02d}:{value % 60:02d}"
+
+    return {
+        "duration_minutes": minutes(slots[0]["end_time"]) - starts[0],
+        "step_minutes": step,
+        "free": [{"from": fmt(first), "to": fmt(last)} for first, last in ranges],
+    }
+
+
+def project_specialist(item):
+    compact = pick(item, ("id", "name", "specialization", "city"))
+    if item.get("schedules"):
+        compact["work_days"] = work_days(item["schedules"])
+    return compact
+
+
+def project_category(item):
+    return pick(item, ("id", "name"))
+
+
+def project_appointment(item):
+    compact = pick(item, (
+        "id", "service", "service_name", "specialist", "specialist_name", "date", "start_time", "end_time", "status",
+    ))
+    for field in ("start_time", "end_time"):
+        if field in compact:
+            compact[field] = hhmm(compact[field])
+    return compact
+
+
+def project_client(item):
+    return pick(item, ("id", "name", "city"))
+
+
+def project_availability(item):
+    compact = pick(item, ("id", "name", "specialization", "city"))
+    compact["days"] = [
+        {"date": day["date"], "free": start_ranges(day["slots"])["free"]}
+        for day in item.get("days", [])
+        if day.get("slots")
+    ]
+    return compact
+
+
+def specialists(result):
+    return paged(result, project_specialist)
+
+
+def categories(result):
+    return paged(result, project_category)
+
+
+def appointments(result):
+    return paged(result, project_appointment)
+
+
+def appointment(result):
+    return project_appointment(result) if isinstance(result, dict) and "id" in result else result
+
+
+def client(result):
+    return project_client(result) if isinstance(result, dict) and "id" in result else result
+
+
+def slots(result):
+    return start_ranges(result) if isinstance(result, list) else result
+
+
+def availability(result):
+    """Свободное время по дням; длина приёма и шаг у всех дней общие и выносятся наверх"""
+    results, next_page = unwrap(result)
+    if not isinstance(results, list):
+        return result
+    compact = {}
+    for item in results:
+        for day in item.get("days", []):
+            if day.get("slots"):
+                ranges = start_ranges(day["slots"])
+                compact = {"duration_minutes": ranges["duration_minutes"], "step_minutes": ranges["step_minutes"]}
+                break
+        if compact:
+            break
+    compact["results"] = [project_availability(item) for item in results]
+    if next_page is not None:
+        compact["next_page"] = next_page
+    return compact
+
+
+def fit(value, budget):
+    """
+    Уложить значение в budget токенов, отбросив хвост списка результатов.
+
+    Возвращает (значение, сколько элементов отброшено). Значение без
+    списка не режется: лучше превысить бюджет, чем отдать обрывок объекта.
+    """
+    if budget <= 0 or estimate_tokens(dumps(value)) <= budget:
+        return value, 0
+    if isinstance(value, list):
+        items, wrap = value, lambda kept, omitted: {"results": kept, "omitted": omitted}
+    elif isinstance(value, dict) and isinstance(value.get("results"), list):
+        items, wrap = value["results"], lambda kept, omitted: {**value, "results": kept, "omitted": omitted}
+    elif isinstance(value, dict) and isinstance(value.get("free"), list):
+        items, wrap = value["free"], lambda kept, omitted: {**value, "free": kept, "omitted": omitted}
+    else:
+        return value, 0
+    # Сколько элементов влезает - двоичным поиском, каждая проба - одна сериализация
+    low, high = 0, len(items)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(dumps(wrap(items[:middle], len(items) - middle))) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    omitted = len(items) - low
+    return wrap(items[:low], omitted), omitted
+
+
+class Compactor:
+    """Проекция и бюджет токенов для ответов инструментов, со статистикой"""
+
+    def __init__(self, budget=1000):
+        self.budget = budget
+        self.stats = {
+            "calls": 0,
+            "tokens_raw": 0,
+            "tokens_sent": 0,
+            "truncated": 0,
+        }
+        self.tools = {}  # имя инструмента -> {calls, tokens_raw, tokens_sent}
+
+    def apply(self, tool, result, project) -> str:
+        tokens_raw = estimate_tokens(raw_text(result))
+        compact, omitted = fit(project(result), self.budget)
+        text = dumps(compact)
+        tokens_sent = estimate_tokens(text)
+
+        self.stats["calls"] += 1
+        self.stats["tokens_raw"] += tokens_raw
+        self.stats["tokens_sent"] += tokens_sent
+        if omitted:
+            self.stats["truncated"] += 1
+        tool_stats = self.tools.setdefault(tool, {"calls": 0, "tokens_raw": 0, "tokens_sent": 0})
+        tool_stats["calls"] += 1
+        tool_stats["tokens_raw"] += tokens_raw
+        tool_stats["tokens_sent"] += tokens_sent
+
+        span = trace.get_current_span()
+        span.set_attribute("mcp.tokens_raw", tokens_raw)
+        span.set_attribute("mcp.tokens_sent", tokens_sent)
+        if omitted:
+            span.set_attribute("mcp.items_omitted", omitted)
+        return text
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "tokens_saved": self.stats["tokens_raw"] - self.stats["tokens_sent"],
+            "budget": self.budget,
+            "tools": self.tools,
+        }
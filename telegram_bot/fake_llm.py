@@ -0,0 +1,137 @@
+import asyncio
+import json
+import re
+import time
+from datetime import date, timedelta
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+PLACEHOLDER = re.compile(r"\{([^{}]+)\}")
+DATE_OFFSET = re.compile(r"date([+-]\d+)?")
+
+
+def parse_tool_output(text: str) -> list:
+    """
+    Разобрать ответ инструмента MCP в список JSON-объектов.
+
+    Адаптер mcp_use склеивает текстовые блоки ответа в одну строку,
+    поэтому список из нескольких объектов приходит как {...}{...}.
+    """
+    decoder = json.JSONDecoder()
+    values, position = [], 0
+    text = text.strip()
+    while position < len(text):
+        try:
+            value, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            return [text]
+        values.append(value)
+        while position < len(text) and text[position].isspace():
+            position += 1
+    return values
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Детерминированная модель для замеров агента без LLM.
+
+    Для каждого запроса пользователя (текст HumanMessage целиком или его
+    окончание - память диалога добавляет перед запросом контекст) задан
+    сценарий - список шагов {"tool": имя, "args": {...}} или {"reply": текст}.
+    Номер шага - число вызовов инструментов после последнего сообщения
+    пользователя, так что модель ведёт агента по сценарию, как настоящая.
+
+    В аргументах и ответах подставляются {date+N} (дата через N дней) и
+    {имя_инструмента.путь} - значение из последнего ответа инструмента,
+    например {get_available_slots.0.start_time}.
+    """
+
+    scripts: dict = {}
+    # Искусственная задержка каждого шага, секунды
+    latency: float = 0.0
+    results: dict = {}
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def reset(self):
+        """Забыть ответы инструментов перед новым диалогом"""
+        self.results = {}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+    def _respond(self, messages) -> ChatResult:
+        self.calls += 1
+        last_human = max(i for i, message in enumerate(messages) if isinstance(message, HumanMessage))
+        query = messages[last_human].content
+        steps = self.scripts.get(query)
+        if steps is None:
+            steps = next((steps for key, steps in self.scripts.items() if query.endswith(key)), None)
+        if steps is None:
+            raise ValueError(f"No script for query: {query!r}")
+
+        scratchpad = messages[last_human + 1:]
+        self._remember(scratchpad)
+        step_index = sum(1 for message in scratchpad if isinstance(message, AIMessage) and message.tool_calls)
+        if step_index >= len(steps):
+            raise ValueError(f"Script for {query!r} has no step {step_index}")
+        step = steps[step_index]
+        if "reply" in step:
+            message = AIMessage(content=self._substitute(step["reply"]))
+        else:
+            message = AIMessage(content="", tool_calls=[{
+                "name": step["tool"],
+                "args": self._substitute(step.get("args", {})),
+                "id": f"call_{self.calls}",
+            }])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _remember(self, scratchpad):
+        names = {
+            call["id"]: call["name"]
+            for message in scratchpad if isinstance(message, AIMessage)
+            for call in message.tool_calls
+        }
+        for message in scratchpad:
+            if isinstance(message, ToolMessage) and message.tool_call_id in names:
+                self.results[names[message.tool_call_id]] = parse_tool_output(message.content)
+
+    def _substitute(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: self._substitute(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._substitute(item) for item in value]
+        if not isinstance(value, str):
+            return value
+        whole = PLACEHOLDER.fullmatch(value)
+        if whole:
+            # Значение целиком из плейсхолдера сохраняет тип (например, id - число)
+            return self._resolve(whole.group(1))
+        return PLACEHOLDER.sub(lambda match: str(self._resolve(match.group(1))), value)
+
+    def _resolve(self, name: str) -> Any:
+        offset = DATE_OFFSET.fullmatch(name)
+        if offset:
+            return (date.today() + timedelta(days=int(offset.group(1) or 0))).isoformat()
+        tool, *path = name.split(".")
+        if tool not in self.results:
+            raise ValueError(f"No result of {tool} for placeholder {{{name}}}")
+        value = self.results[tool]
+        for key in path:
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        return value
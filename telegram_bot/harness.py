@@ -0,0 +1,267 @@
+"""
+Замер задержек агента от сообщения до ответа без Telegram и без LLM.
+
+Записанные диалоги (harness_conversations.json) прогоняются через ask()
+из bot.py. Вместо Ollama отвечает ScriptedChatModel, которая вызывает
+инструменты по сценарию, MCP-сервер и API - настоящие (API поднимается
+локально: python manage.py runserver). Для каждой реплики время
+раскладывается по этапам:
+
+    llm    - шаги модели
+    tool   - вызовы инструментов MCP целиком (stdio + сервер + API)
+    http   - запросы MCP-сервера к API
+    mcp    - tool - http: stdio, сериализация, кэш MCP-сервера
+    agent  - всё остальное: цикл агента, история, инициализация
+
+Запуск из каталога telegram_bot:
+    python harness.py --repeat 5 --llm-latency 0.3 --json results.json
+
+С настоящей моделью (--ollama qwen3:8b) она создаётся с теми же параметрами
+OLLAMA_*, что и в боте; реплики, где Ollama загружала модель, помечаются
+cold. --warm-up прогревает модель перед первой репликой, как бот при старте.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+# Токен нужен только для создания aiogram.Bot, в Telegram харнесс не ходит
+os.environ.setdefault("BOT_TOKEN", "123456:harness")
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from pydantic import AnyUrl
+import metrics
+import tool_calls
+
+STAGES = ("total", "llm", "tool", "http", "mcp", "agent")
+METRICS_URI = "http://localhost:8080/metrics/http"
+AGENT_ERROR_PREFIX = "Agent stopped due to an error"
+
+
+class StageTimer(AsyncCallbackHandler):
+    """Время шагов LLM (через колбэки модели) и вызовов инструментов"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.llm = 0.0
+        self.llm_steps = 0
+        # Сколько секунд Ollama загружала модель (у ScriptedChatModel всегда 0)
+        self.load = 0.0
+        self.tool = 0.0
+        self.tool_calls = 0
+        self.tool_errors = 0
+        self._started = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+        self.load += metrics.load_seconds(response) or 0.0
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def _finish(self, run_id):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.llm += time.perf_counter() - started
+            self.llm_steps += 1
+
+    async def time_tool_call(self, call, name, arguments):
+        """Обёртка tool_calls: время и ошибки вызовов инструментов"""
+        started = time.perf_counter()
+        try:
+            result = await call(name, arguments)
+        except Exception:
+            self.tool_errors += 1
+            raise
+        finally:
+            self.tool += time.perf_counter() - started
+            self.tool_calls += 1
+        if result.isError:
+            self.tool_errors += 1
+        return result
+
+
+async def read_http_stats(connector) -> dict:
+    """Счётчики HTTP-запросов MCP-сервера к API (ресурс metrics/http)"""
+    result = await connector.client.read_resource(AnyUrl(METRICS_URI))
+    return json.loads(result.contents[0].text)
+
+
+def load_conversations(path, names=None):
+    with open(path) as f:
+        conversations = json.load(f)
+    if names:
+        conversations = [c for c in conversations if c["name"] in names]
+    return conversations
+
+
+def summarize(turns):
+    """Среднее и максимум по каждому этапу, миллисекунды"""
+    summary = {}
+    for stage in STAGES:
+        values = [turn[stage] for turn in turns]
+        summary[stage] = {
+            "avg_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+            "max_ms": round(max(values, default=0.0) * 1000, 1),
+        }
+    # Доля этапа в суммарном времени всех реплик
+    grand_total = sum(turn["total"] for turn in turns)
+    summary["share"] = {
+        stage: round(sum(turn[stage] for turn in turns) / grand_total, 3)
+        for stage in STAGES[1:]
+    } if grand_total else {}
+    return summary
+
+
+async def run_turn(bot, model, timer, connector, user_id, turn):
+    message = SimpleNamespace(
+        from_user=SimpleNamespace(id=user_id, first_name="Harness"),
+        chat=SimpleNamespace(id=user_id),
+        text=turn["text"],
+    )
+    if model is not None:
+        model.scripts[bot.build_query(message)] = turn["steps"]
+    before = await read_http_stats(connector)
+    timer.reset()
+    error = None
+    started = time.perf_counter()
+    try:
+        reply = await bot.ask(message)
+    except Exception as exc:
+        reply, error = None, f"{type(exc).__name__}: {exc}"
+    else:
+        # MCPAgent не пробрасывает ошибки, а возвращает их текстом
+        if reply.startswith(AGENT_ERROR_PREFIX):
+            error = reply
+    total = time.perf_counter() - started
+    after = await read_http_stats(connector)
+    http = after["time_total"] - before["time_total"]
+    return {
+        "text": turn["text"],
+        "reply": reply,
+        "error": error,
+        "total": total,
+        "llm": timer.llm,
+        "tool": timer.tool,
+        "http": http,
+        "mcp": max(timer.tool - http, 0.0),
+        "agent": max(total - timer.llm - timer.tool, 0.0),
+        "llm_steps": timer.llm_steps,
+        "load": timer.load,
+        "tool_calls": timer.tool_calls,
+        "tool_errors": timer.tool_errors,
+        "http_requests": after["requests"] - before["requests"],
+    }
+
+
+async def main(args):
+    if args.api_url:
+        # До импорта bot: окружение передаётся дочернему процессу MCP-сервера
+        os.environ["API_BASE_URL"] = args.api_url
+    import bot
+    import tracing
+    import inference
+    from fake_llm import ScriptedChatModel
+
+    timer = StageTimer()
+    if args.ollama:
+        model = None
+        bot.llm = inference.make_llm(
+            args.ollama,
+            bot.OLLAMA_URL,
+            keep_alive=bot.OLLAMA_KEEP_ALIVE,
+            num_ctx=bot.OLLAMA_NUM_CTX,
+            num_thread=bot.OLLAMA_NUM_THREAD,
+            callbacks=[timer, tracing.AgentStepTracer()],
+        )
+    else:
+        model = ScriptedChatModel(latency=args.llm_latency, callbacks=[timer, tracing.AgentStepTracer()])
+        bot.llm = model
+
+    conversations = load_conversations(args.conversations, args.only)
+    started = time.perf_counter()
+    await bot.sessions.connect()
+    connect_time = time.perf_counter() - started
+    connector = bot.client.get_session(bot.MCP_SERVER_NAME).connector
+    tool_calls.register(timer.time_tool_call)
+    print(f"MCP connect: {connect_time * 1000:.1f} ms")
+    if args.warm_up and args.ollama:
+        warm_up_time = await inference.ModelWarmer(bot.make_agent, bot.llm, bot.sessions).warm_up()
+        print(f"Model warm-up: {warm_up_time * 1000:.1f} ms")
+
+    turns = []
+    try:
+        for repeat in range(args.repeat):
+            for conversation in conversations:
+                # Новый пользователь на каждый повтор: своя история и свой агент
+                user_id = conversation["user_id"] + repeat * 1_000_000
+                if model is not None:
+                    model.reset()
+                for index, turn in enumerate(conversation["turns"]):
+                    result = await run_turn(bot, model, timer, connector, user_id, turn)
+                    result.update(conversation=conversation["name"], repeat=repeat, turn=index)
+                    turns.append(result)
+                    print(
+                        f"{conversation['name']:<14} #{repeat}.{index} "
+                        + "  ".join(f"{stage} {result[stage] * 1000:7.1f}" for stage in STAGES)
+                        + f"  steps {result['llm_steps']} tools {result['tool_calls']}"
+                        f" http {result['http_requests']}"
+                        + (f"  tool errors {result['tool_errors']}" if result["tool_errors"] else "")
+                        + (f"  cold (load {result['load'] * 1000:.0f} ms)"
+                           if result["load"] >= metrics.COLD_LOAD_SECONDS else "")
+                        + (f"  ERROR {result['error']}" if result["error"] else "")
+                    )
+                    if args.verbose and result["reply"]:
+                        print(f"    > {result['reply']}")
+    finally:
+        await bot.client.close_all_sessions()
+
+    summary = summarize(turns)
+    print("\nstage      avg ms    max ms   share")
+    for stage in STAGES:
+        share = summary["share"].get(stage)
+        print(
+            f"{stage:<8} {summary[stage]['avg_ms']:>8.1f} {summary[stage]['max_ms']:>9.1f}"
+            + (f"   {share:>5.1%}" if share is not None else "")
+        )
+    errors = sum(1 for turn in turns if turn["error"])
+    if errors:
+        print(f"{errors} of {len(turns)} turns failed")
+
+    if args.json:
+        report = {
+            "options": {
+                "llm": args.ollama or "scripted",
+                "llm_latency": args.llm_latency,
+                "warm_up": args.warm_up,
+                "repeat": args.repeat,
+                "api_url": os.getenv("API_BASE_URL"),
+            },
+            "mcp_connect_ms": round(connect_time * 1000, 1),
+            "summary": summary,
+            "turns": turns,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agent latency harness")
+    parser.add_argument("--conversations", default=os.path.join(os.path.dirname(__file__), "harness_conversations.json"))
+    parser.add_argument("--only", nargs="+", help="Run only these conversations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the scripted model sleeps per step")
+    parser.add_argument("--ollama", metavar="MODEL", help="Use a real Ollama model instead of the scripted one")
+    parser.add_argument("--warm-up", action="store_true", help="Warm the Ollama model up before the first turn")
+    parser.add_argument("--api-url", help="API base URL for the MCP server, e.g. http://localhost:8000/api")
+    parser.add_argument("--json", help="Write per-turn results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Print agent replies")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Инференс Ollama: параметры модели, прогрев и учёт холодных вызовов.
+
+Ollama выгружает модель через keep_alive после последнего запроса
+(по умолчанию через 5 минут), и первый ответ после паузы ждёт загрузки
+весов - это секунды. Смена num_ctx или num_thread между запросами тоже
+перезагружает модель, поэтому все вызовы, включая прогрев, идут с одними
+параметрами из make_llm().
+
+Начало промпта - системный промпт агента и схемы инструментов - у всех
+запросов одинаковое. Всё, что меняется от запроса к запросу (клиент,
+память диалога, сам вопрос), стоит в последнем сообщении, после истории.
+Ollama переиспользует KV-кэш для совпадающего начала промпта, так что
+после прогрева общий префикс заново не считается. Прогрев идёт через
+такого же агента, как обычные запросы, чтобы промпт совпал до байта.
+При OLLAMA_NUM_PARALLEL > 1 у каждого слота сервера свой кэш.
+
+Холодный вызов - тот, где Ollama сообщила load_duration не меньше
+metrics.COLD_LOAD_SECONDS; время холодных и тёплых вызовов считается
+в metrics.LLMStepMetrics.
+"""
+import asyncio
+import logging
+import time
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_ollama import ChatOllama
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_QUERY = "ping"
+# MCPAgent не пробрасывает ошибки, а возвращает их текстом
+AGENT_ERROR_PREFIX = "Agent stopped due to an error"
+
+
+def keep_alive_value(value):
+    """Число секунд ("600", "-1" - не выгружать) Ollama ждёт числом, длительность ("30m") - строкой"""
+    value = str(value).strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def make_llm(model, base_url, keep_alive="30m", num_ctx=8192, num_thread=0, callbacks=None) -> ChatOllama:
+    return ChatOllama(
+        model=model,
+        base_url=base_url,
+        keep_alive=keep_alive_value(keep_alive),
+        num_ctx=num_ctx,
+        # None - число потоков выбирает Ollama
+        num_thread=num_thread or None,
+        callbacks=callbacks,
+    )
+
+
+class LoadRecorder(AsyncCallbackHandler):
+    """Время загрузки модели из последнего ответа Ollama"""
+
+    def __init__(self):
+        self.load = None
+
+    async def on_llm_end(self, response, **kwargs):
+        self.load = metrics.load_seconds(response)
+
+
+class ModelWarmer:
+    """
+    Прогрев модели Ollama.
+
+    warm_up() прогоняет через агента запрос с ответом в один токен:
+    Ollama загружает модель и считает общий префикс промпта. run()
+    прогревает при старте и затем каждые interval секунд, если за это
+    время агент ни разу не запускался, чтобы модель не выгружалась по
+    keep_alive между всплесками нагрузки.
+
+    agent_factory(llm) -> MCPAgent должен собирать агента так же, как
+    для пользователей, иначе префикс промпта не совпадёт.
+    """
+
+    def __init__(self, agent_factory, llm, sessions, interval=300):
+        self.agent_factory = agent_factory
+        self.llm = llm
+        self.sessions = sessions
+        self.interval = interval
+
+    async def warm_up(self) -> float:
+        # Сессии MCP поднимает SessionManager, чтобы сработал on_connect
+        await self.sessions.connect()
+        recorder = LoadRecorder()
+        # Параметры модели те же, что у агентов, иначе Ollama перезагрузит модель
+        llm = self.llm.model_copy(update={"num_predict": 1, "callbacks": [recorder]})
+        agent = self.agent_factory(llm)
+        started = time.perf_counter()
+        # Сессиями MCP владеет SessionManager: агент инициализируется на них
+        # и не закрывает их после ответа
+        await agent.initialize()
+        reply = await agent.run(WARM_UP_QUERY, manage_connector=False, external_history=[])
+        elapsed = time.perf_counter() - started
+        if reply.startswith(AGENT_ERROR_PREFIX):
+            raise RuntimeError(reply)
+        cold = recorder.load is not None and recorder.load >= metrics.COLD_LOAD_SECONDS
+        metrics.LLM_WARMUPS.labels("cold" if cold else "warm").observe(elapsed)
+        logger.info(
+            "Model warm-up took %.2f s (%s, load %.2f s)",
+            elapsed, "cold" if cold else "warm", recorder.load or 0.0,
+        )
+        return elapsed
+
+    async def run(self):
+        idle = True
+        while True:
+            if idle:
+                try:
+                    await self.warm_up()
+                except Exception:
+                    logger.warning("Model warm-up failed", exc_info=True)
+            if not self.interval:
+                return
+            runs = self.sessions.stats["runs"]
+            await asyncio.sleep(self.interval)
+            # Агент запускался - модель загружена, а keep_alive отсчитывается заново
+            idle = self.sessions.stats["runs"] == runs
@@ -1,49 +1,283 @@
 #!/usr/bin/env python3
+"""
+MCP-сервер записи к специалистам.
+
+Два режима запуска (MCP_TRANSPORT):
+    stdio - дочерний процесс бота (mcp run mcp_server.py), по процессу на бота
+    http  - отдельный долгоживущий сервис, общий для всех реплик бота:
+            python mcp_server.py с MCP_TRANSPORT=http или
+            uvicorn mcp_server:create_app --factory --host 0.0.0.0 --port 8080
+
+HTTP-сервис отдаёт SSE (/sse и /messages/, к нему подключается mcp_use)
+и streamable HTTP (/mcp/), а также /healthz и /metrics. Кэш ответов и пул
+соединений к API живут в процессе, поэтому воркер uvicorn должен быть один;
+масштабируется сервис репликами за балансировщиком с привязкой SSE-сессий.
+"""
+import os
+import time
+from functools import wraps
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime
+from importlib.util import find_spec
 import httpx
 from mcp.server.fastmcp import FastMCP
 from asyncio import run
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from cache import TTLCache
+import compact
+import metrics
+from opentelemetry.trace import SpanKind
+import tracing
 
-API_BASE_URL = "http://localhost:8000/api"
-AUTH_TOKEN = "your_auth_token_here"
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000/api")
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.getenv("MCP_PORT", "8080"))
+# Токен служебного пользователя API (python manage.py create_service_token)
+API_TOKEN = os.getenv("API_TOKEN", "")
 MCP_BASE_URL = "http://localhost:8080"
 
 DEFAULT_HEADERS = {
-    "Authorization": f"Token {AUTH_TOKEN}",
     "Content-Type": "application/json",
 }
+if API_TOKEN:
+    DEFAULT_HEADERS["Authorization"] = f"Token {API_TOKEN}"
 
-mcp = FastMCP("Healthcare Booking Assistant")
+# Настройки пула соединений к API
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+API_MAX_KEEPALIVE = int(os.getenv("API_MAX_KEEPALIVE", "10"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+# HTTP/2 включается только если установлен пакет h2 (httpx[http2])
+API_HTTP2 = os.getenv("API_HTTP2", "1") == "1" and find_spec("h2") is not None
 
-async def api_get(endpoint, params=None):
+# Таймауты для медленных эндпоинтов (по сегменту пути)
+ENDPOINT_TIMEOUTS = {
+    "available_slots": 20.0,
+    "availability": 30.0,
+}
+
+# Кэш редко меняющихся данных: TTL в секундах по типу ресурса
+CACHE_ENABLED = os.getenv("MCP_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_SIZE = int(os.getenv("MCP_CACHE_MAX_SIZE", "512"))
+CACHE_TTLS = {
+    "categories": 3600,
+    "services": 600,
+    "schedule": 600,
+    "specialists": 300,
+    "available_slots": 30,
+    "availability": 30,
+    # Клиент по Telegram ID: бот держит свой кэш, здесь - для агента
+    "by_telegram": 300,
+}
+
+# Какие закэшированные ресурсы устаревают после записи в ресурс
+WRITE_INVALIDATES = {
+    "appointments": ("available_slots", "availability"),
+    "schedules": ("schedule", "specialists", "available_slots", "availability"),
+    "services": ("services", "available_slots", "availability"),
+    "specialists": ("specialists", "available_slots", "availability"),
+    "categories": ("categories", "services"),
+    "clients": ("by_telegram",),
+}
+
+# Списки клиентов и записей API отдаёт страницами по курсору.
+# Ресурсы MCP читают их целиком, но не больше MAX_LIST_ROWS строк
+LIST_PAGE_SIZE = 100
+MAX_LIST_ROWS = int(os.getenv("MCP_MAX_LIST_ROWS", "1000"))
+
+# Ответы инструментов сжимаются перед отправкой в LLM (см. compact.py).
+# Бюджет - оценка токенов на один ответ, 0 - без ограничения
+COMPACT_ENABLED = os.getenv("MCP_COMPACT_RESULTS", "1") == "1"
+TOOL_TOKEN_BUDGET = int(os.getenv("MCP_TOOL_TOKEN_BUDGET", "1000"))
+
+response_cache = TTLCache(max_size=CACHE_MAX_SIZE)
+compactor = compact.Compactor(budget=TOOL_TOKEN_BUDGET)
+# ETag последних ответов каталога: после истечения TTL запрос идёт
+# с If-None-Match, и на 304 API не сериализует данные заново
+_validators = OrderedDict()
+
+_http_client = None
+# В режиме HTTP-сервиса клиент общий для всех сессий MCP
+_serving_http = False
+_http_stats = {
+    "requests": 0,
+    "errors": 0,
+    "in_flight": 0,
+    # Суммарное время ответов API, секунды
+    "time_total": 0.0,
+}
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий клиент с keep-alive на всё время жизни процесса"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            http2=API_HTTP2,
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_KEEPALIVE,
+                keepalive_expiry=API_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def get_pool_stats() -> dict:
+    """Счётчики запросов и состояние пула соединений"""
+    stats = dict(_http_stats)
+    stats["http2"] = API_HTTP2
+    stats["max_connections"] = API_MAX_CONNECTIONS
+    stats["connections"] = 0
+    stats["idle_connections"] = 0
+    # httpx не даёт публичного доступа к пулу, поэтому читаем его осторожно
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    for connection in getattr(pool, "connections", []):
+        stats["connections"] += 1
+        if connection.is_idle():
+            stats["idle_connections"] += 1
+    return stats
+
+def _timeout_for(endpoint):
+    for segment in endpoint.split("/"):
+        if segment in ENDPOINT_TIMEOUTS:
+            return httpx.Timeout(ENDPOINT_TIMEOUTS[segment], connect=API_CONNECT_TIMEOUT)
+    return httpx.USE_CLIENT_DEFAULT
+
+async def api_request(method, endpoint, **kwargs):
     url = f"{API_BASE_URL}/{endpoint}/"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params, headers=DEFAULT_HEADERS)
-        response.raise_for_status()
+    _http_stats["requests"] += 1
+    _http_stats["in_flight"] += 1
+    started = time.perf_counter()
+    attributes = {"http.request.method": method, "url.full": url}
+    try:
+        with tracing.tracer.start_as_current_span(
+            f"HTTP {method} {_resource_kind(endpoint)}", kind=SpanKind.CLIENT, attributes=attributes
+        ) as span:
+            # traceparent связывает запрос к API с трассой бота
+            headers = tracing.inject_headers(kwargs.pop("headers", None))
+            response = await get_http_client().request(
+                method, url, headers=headers, timeout=_timeout_for(endpoint), **kwargs
+            )
+            span.set_attribute("http.response.status_code", response.status_code)
+            # 304 - ответ на условный запрос, данные берутся из кэша
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+    except httpx.HTTPError:
+        _http_stats["errors"] += 1
+        raise
+    finally:
+        _http_stats["in_flight"] -= 1
+        _http_stats["time_total"] += time.perf_counter() - started
+
+@asynccontextmanager
+async def lifespan(server):
+    # Выполняется на каждую сессию MCP. В stdio сессия одна на процесс, а
+    # HTTP-сервис закрывает общий клиент только при остановке приложения
+    try:
+        yield
+    finally:
+        if not _serving_http:
+            await close_http_client()
+
+mcp = FastMCP("Healthcare Booking Assistant", lifespan=lifespan)
+tracing.setup_tracing("mcp-server")
+tracing.instrument_server(mcp)
+
+def _resource_kind(endpoint):
+    """Тип ресурса - последний нечисловой сегмент пути (specialists/1/schedule -> schedule)"""
+    segments = [segment for segment in endpoint.split("/") if segment and not segment.isdigit()]
+    return segments[-1] if segments else endpoint
+
+def _invalidate_after_write(endpoint):
+    tags = WRITE_INVALIDATES.get(endpoint.split("/")[0])
+    if tags:
+        response_cache.invalidate(*tags)
+
+async def api_get(endpoint, params=None):
+    kind = _resource_kind(endpoint)
+    ttl = CACHE_TTLS.get(kind)
+
+    key = (endpoint, tuple(sorted((params or {}).items())))
+
+    async def fetch():
+        response = await api_request("GET", endpoint, params=params)
         return response.json()
 
+    async def revalidate():
+        validator = _validators.get(key)
+        headers = {"If-None-Match": validator[0]} if validator else None
+        response = await api_request("GET", endpoint, params=params, headers=headers)
+        if response.status_code == 304 and validator:
+            _validators.move_to_end(key)
+            return validator[1]
+        data = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            _validators[key] = (etag, data)
+            _validators.move_to_end(key)
+            while len(_validators) > CACHE_MAX_SIZE:
+                _validators.popitem(last=False)
+        return data
+
+    if not CACHE_ENABLED or ttl is None:
+        return await fetch()
+    return await response_cache.get_or_fetch(key, kind, ttl, revalidate)
+
+async def api_get_all(endpoint, params=None, limit=MAX_LIST_ROWS):
+    """Все строки списка с пагинацией по курсору, но не больше limit"""
+    params = dict(params or {}, page_size=LIST_PAGE_SIZE)
+    rows = []
+    while True:
+        page = await api_get(endpoint, params)
+        rows.extend(page["results"])
+        if not page.get("next") or len(rows) >= limit:
+            return rows[:limit]
+        params["cursor"] = httpx.URL(page["next"]).params["cursor"]
+
 async def api_post(endpoint, data):
-    url = f"{API_BASE_URL}/{endpoint}/"
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=data, headers=DEFAULT_HEADERS)
-        response.raise_for_status()
-        return response.json()
+    response = await api_request("POST", endpoint, json=data)
+    _invalidate_after_write(endpoint)
+    return response.json()
 
 async def api_patch(endpoint, data):
-    url = f"{API_BASE_URL}/{endpoint}/"
-    async with httpx.AsyncClient() as client:
-        response = await client.patch(url, json=data, headers=DEFAULT_HEADERS)
-        response.raise_for_status()
-        return response.json()
+    response = await api_request("PATCH", endpoint, json=data)
+    _invalidate_after_write(endpoint)
+    return response.json()
 
 async def api_delete(endpoint):
-    url = f"{API_BASE_URL}/{endpoint}/"
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(url, headers=DEFAULT_HEADERS)
-        response.raise_for_status()
-        return response.status_code
+    response = await api_request("DELETE", endpoint)
+    _invalidate_after_write(endpoint)
+    return response.status_code
+
+def compacted(project):
+    """Ответ инструмента - через проекцию project и бюджет токенов"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            result = await func(*args, **kwargs)
+            if not COMPACT_ENABLED:
+                return result
+            return compactor.apply(func.__name__, result, project)
+        return wrapper
+    return decorator
 
 @mcp.tool()
+@compacted(compact.specialists)
 async def search_specialists(specialization: str = None, city: str = None, category_id: int = None) -> list:
     """
     Поиск специалистов (врачей) по заданным критериям
@@ -68,6 +302,7 @@ async def search_specialists(specialization: str = None, city: str = None, categ
     return specialists
 
 @mcp.tool()
+@compacted(compact.appointment)
 async def create_appointment(
     specialist_id: int,
     service_id: int,
@@ -116,6 +351,7 @@ async def create_appointment(
     return result
 
 @mcp.tool()
+@compacted(compact.appointment)
 async def cancel_appointment(appointment_id: int) -> dict:
     """
     Отменить запись на приём
@@ -130,6 +366,7 @@ async def cancel_appointment(appointment_id: int) -> dict:
     return result
 
 @mcp.tool()
+@compacted(compact.appointment)
 async def confirm_appointment(appointment_id: int) -> dict:
     """
     Подтвердить запись на приём
@@ -144,6 +381,7 @@ async def confirm_appointment(appointment_id: int) -> dict:
     return result
 
 @mcp.tool()
+@compacted(compact.appointment)
 async def complete_appointment(appointment_id: int) -> dict:
     """
     Отметить запись на приём как завершенную
@@ -158,26 +396,133 @@ async def complete_appointment(appointment_id: int) -> dict:
     return result
 
 @mcp.tool()
-async def get_available_slots(specialist_id: int, date: str = None) -> list:
+@compacted(compact.slots)
+async def get_available_slots(specialist_id: int, date: str = None, service_id: int = None) -> dict:
     """
     Получить доступные слоты для записи к специалисту на определенную дату
     
     Args:
         specialist_id: ID специалиста
         date: Дата в формате YYYY-MM-DD (если не указана, используется текущая дата)
+        service_id: ID услуги (длина слота будет равна продолжительности услуги)
         
     Returns:
-        Список доступных временных слотов
+        Свободное время начала приёма: диапазоны free от from до to
+        включительно с шагом step_minutes, длина приёма duration_minutes
     """
     params = {}
     if date:
         params["date"] = date
     else:
         params["date"] = datetime.now().strftime("%Y-%m-%d")
+    if service_id:
+        params["service_id"] = service_id
         
     slots = await api_get(f"specialists/{specialist_id}/available_slots", params)
     return slots
 
+@mcp.tool()
+@compacted(compact.availability)
+async def find_available_slots(
+    date_from: str = None,
+    date_to: str = None,
+    city: str = None,
+    category_id: int = None,
+    specialization: str = None,
+    duration: int = None,
+    page: int = None
+) -> dict:
+    """
+    Найти свободные слоты сразу у всех подходящих специалистов на диапазон дат.
+    Используй вместо многократных вызовов get_available_slots по каждому специалисту и дню.
+    
+    Args:
+        date_from: Первая дата в формате YYYY-MM-DD (если не указана, используется текущая дата)
+        date_to: Последняя дата в формате YYYY-MM-DD (по умолчанию неделя от date_from, не более 14 дней)
+        city: Город специалиста (например, "Казань")
+        category_id: ID категории услуг
+        specialization: Специализация врача (например, "Стоматолог")
+        duration: Продолжительность приёма в минутах (по умолчанию 30)
+        page: Номер страницы результатов
+        
+    Returns:
+        Список специалистов со свободным временем по датам: диапазоны free
+        времени начала от from до to включительно с шагом step_minutes
+    """
+    params = {
+        "date_from": date_from or datetime.now().strftime("%Y-%m-%d"),
+    }
+    if date_to:
+        params["date_to"] = date_to
+    if city:
+        params["city"] = city
+    if category_id:
+        params["category_id"] = category_id
+    if specialization:
+        params["specialization"] = specialization
+    if duration:
+        params["duration"] = duration
+    if page:
+        params["page"] = page
+        
+    availability = await api_get("specialists/availability", params)
+    return availability
+
+@mcp.tool()
+@compacted(compact.categories)
+async def get_service_categories() -> dict:
+    """
+    Получить список категорий услуг
+    
+    Returns:
+        Список категорий услуг с их ID
+    """
+    return await api_get("categories")
+
+@mcp.tool()
+@compacted(compact.appointments)
+async def get_client_appointments(client_id: int, status: str = None, date_from: str = None, fields: str = None) -> dict:
+    """
+    Получить записи клиента на приём
+    
+    Args:
+        client_id: ID клиента
+        status: Статус записи (pending, confirmed, completed, cancelled)
+        date_from: Показывать записи начиная с даты в формате YYYY-MM-DD
+        fields: Только эти поля через запятую, например "id,date,start_time,status"
+        
+    Returns:
+        Список записей клиента
+    """
+    params = {"client_id": client_id}
+    if status:
+        params["status"] = status
+    if date_from:
+        params["date_from"] = date_from
+    if fields:
+        params["fields"] = fields
+        
+    return await api_get("appointments", params)
+
+@mcp.tool()
+@compacted(compact.client)
+async def get_client_by_telegram_id(telegram_id: int) -> dict:
+    """
+    Найти клиента по Telegram ID пользователя
+
+    Args:
+        telegram_id: Telegram ID пользователя (айди из запроса)
+
+    Returns:
+        id, имя и город клиента или {"found": false}, если клиент не зарегистрирован
+    """
+    try:
+        return await api_get(f"clients/by_telegram/{telegram_id}")
+    except httpx.HTTPStatusError as error:
+        if error.response.status_code == 404:
+            return {"found": False}
+        raise
+
 # === RESOURCES ===
 
 @mcp.resource(f"{MCP_BASE_URL}/specialists")
@@ -239,9 +584,9 @@ async def get_category(category_id: int) -> dict:
 @mcp.resource(f"{MCP_BASE_URL}/appointments")
 async def get_appointments() -> list:
     """
-    Получить список всех записей на приём
+    Получить список всех записей на приём (по дате и времени)
     """
-    return await api_get("appointments")
+    return await api_get_all("appointments")
 
 @mcp.resource(f"{MCP_BASE_URL}/appointments/{{appointment_id}}")
 async def get_appointment(appointment_id: int) -> dict:
@@ -255,7 +600,7 @@ async def get_clients() -> list:
     """
     Получить список всех клиентов
     """
-    return await api_get("clients")
+    return await api_get_all("clients")
 
 @mcp.resource(f"{MCP_BASE_URL}/clients/{{client_id}}")
 async def get_client(client_id: int) -> dict:
@@ -264,5 +609,68 @@ async def get_client(client_id: int) -> dict:
     """
     return await api_get(f"clients/{client_id}")
 
+@mcp.resource(f"{MCP_BASE_URL}/metrics/http")
+async def get_http_metrics() -> dict:
+    """
+    Получить статистику пула HTTP-соединений к API
+    """
+    return get_pool_stats()
+
+@mcp.resource(f"{MCP_BASE_URL}/metrics/compaction")
+async def get_compaction_metrics() -> dict:
+    """
+    Сколько токенов сэкономило сжатие ответов инструментов
+    """
+    return compactor.get_stats()
+
+@mcp.resource(f"{MCP_BASE_URL}/metrics/cache")
+async def get_cache_metrics() -> dict:
+    """
+    Получить статистику кэша ответов API
+    """
+    return response_cache.get_stats()
+
+class ServerStatsCollector:
+    """Счётчики пула соединений, кэша и сжатия ответов для /metrics HTTP-сервиса"""
+
+    def collect(self):
+        yield from metrics.mcp_server_metrics(get_pool_stats(), response_cache.get_stats(), compactor.get_stats())
+
+def create_app() -> Starlette:
+    """ASGI-приложение MCP-сервиса: SSE, streamable HTTP, /healthz и /metrics"""
+    global _serving_http
+    _serving_http = True
+    sse_app = mcp.sse_app()
+    streamable_app = mcp.streamable_http_app()
+    REGISTRY.register(ServerStatsCollector())
+
+    async def health(request: Request):
+        return JSONResponse({"status": "ok", "api": API_BASE_URL, **get_pool_stats()})
+
+    async def metrics_endpoint(request: Request):
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+    @asynccontextmanager
+    async def app_lifespan(app):
+        async with mcp.session_manager.run():
+            try:
+                yield
+            finally:
+                await close_http_client()
+
+    return Starlette(
+        routes=[
+            Route("/healthz", health, methods=["GET"]),
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+            *sse_app.routes,
+            *streamable_app.routes,
+        ],
+        lifespan=app_lifespan,
+    )
+
 if __name__ == "__main__":
-    run(mcp.run_stdio_async())
\ No newline at end of file
+    if MCP_TRANSPORT == "http":
+        import uvicorn
+        uvicorn.run(create_app(), host=MCP_HOST, port=MCP_PORT)
+    else:
+        run(mcp.run_stdio_async())
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+Память диалогов бота по пользователям.
+
+Агенту передаются последние реплики дословно (external_history MCPAgent),
+а перед запросом - блок контекста: сжатое содержание более старых реплик
+и известные сущности (client_id, выбранные специалист и услуга, последняя
+запись). Сущности берутся из аргументов и ответов инструментов, которые
+вызывались во время реплики, поэтому на следующей реплике агенту не нужно
+снова искать специалиста или услугу.
+
+Размер памяти в промпте ограничен: реплики сверх max_turns или max_chars
+сворачиваются в краткое содержание, а оно само обрезается по старым строкам.
+
+Хранилища взаимозаменяемы:
+    MemoryStore - LRU в процессе (по умолчанию)
+    SQLiteStore - файл SQLite, переживает перезапуск бота
+    RedisStore  - общий Redis, память видят все реплики бота
+"""
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain_core.messages import AIMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+# Рассуждения qwen3 (<think>...</think>) в память не попадают
+THINK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+# Аргументы инструментов, которые запоминаются как сущности диалога
+ENTITY_ARGUMENTS = ("client_id", "specialist_id", "service_id", "appointment_id", "category_id", "city")
+
+# Вызовы инструментов текущей реплики: (имя, аргументы, ответ)
+_tool_calls = ContextVar("tool_calls", default=None)
+
+
+@contextmanager
+def recording():
+    """Собирать вызовы инструментов внутри блока в список"""
+    calls = []
+    token = _tool_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _tool_calls.reset(token)
+
+
+async def record_tool_call(call, name, arguments):
+    """Обёртка tool_calls: записать вызов инструмента в текущую реплику"""
+    result = await call(name, arguments)
+    calls = _tool_calls.get()
+    if calls is not None:
+        calls.append((name, arguments, result))
+    return result
+
+
+def _tool_output(result):
+    """JSON из ответа инструмента MCP или None"""
+    if getattr(result, "isError", False):
+        return None
+    texts = [item.text for item in getattr(result, "content", []) if getattr(item, "type", None) == "text"]
+    if len(texts) != 1:
+        return None
+    try:
+        return json.loads(texts[0])
+    except ValueError:
+        return None
+
+
+def extract_entities(calls) -> dict:
+    """Сущности из вызовов инструментов реплики: id из аргументов и созданные записи"""
+    entities = {}
+    for name, arguments, result in calls:
+        for key in ENTITY_ARGUMENTS:
+            if arguments.get(key) not in (None, ""):
+                entities[key] = arguments[key]
+        output = _tool_output(result)
+        if name.endswith("_appointment") and isinstance(output, dict) and "id" in output:
+            entities["appointment_id"] = output["id"]
+            for key in ("status", "date", "start_time", "specialist_name", "service_name"):
+                if key in output:
+                    entities[f"appointment_{key}"] = output[key]
+        elif name == "get_client_by_telegram_id" and isinstance(output, dict) and "id" in output:
+            entities["client_id"] = output["id"]
+        elif name == "search_specialists" and isinstance(output, list) and len(output) == 1:
+            # Единственный найденный специалист и есть выбранный
+            entities["specialist_id"] = output[0].get("id")
+            entities["specialist_name"] = output[0].get("name")
+    return {key: value for key, value in entities.items() if value is not None}
+
+
+def extractive_summary(summary, turns, max_chars):
+    """
+    Краткое содержание без LLM: по строке на реплику, самые старые строки
+    отбрасываются, когда содержание не помещается в max_chars.
+    """
+    lines = summary.splitlines() if summary else []
+    for user_text, reply in turns:
+        lines.append(f"- {_shorten(user_text, 120)} -> {_shorten(reply, 160)}")
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class MemoryStore:
+    """Память в процессе; при переполнении забываются самые давние пользователи"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    async def load(self, user_id):
+        conversation = self._data.get(user_id)
+        if conversation is not None:
+            self._data.move_to_end(user_id)
+        return conversation
+
+    async def save(self, user_id, conversation):
+        self._data[user_id] = conversation
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, user_id):
+        self._data.pop(user_id, None)
+
+
+class SQLiteStore:
+    """Память в файле SQLite; запросы выполняются в потоке, чтобы не блокировать цикл событий"""
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchone()
+
+    async def load(self, user_id):
+        row = await asyncio.to_thread(
+            self._execute,
+            "SELECT data FROM conversations WHERE user_id = ? AND updated_at > ?",
+            (user_id, time.time() - self.ttl),
+        )
+        return json.loads(row[0]) if row else None
+
+    async def save(self, user_id, conversation):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO conversations (user_id, data, updated_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(conversation, ensure_ascii=False), time.time()),
+        )
+
+    async def delete(self, user_id):
+        await asyncio.to_thread(self._execute, "DELETE FROM conversations WHERE user_id = ?", (user_id,))
+
+    async def purge_expired(self) -> int:
+        """Удалить диалоги, не обновлявшиеся дольше ttl"""
+        def purge():
+            with self._lock, self._db:
+                return self._db.execute(
+                    "DELETE FROM conversations WHERE updated_at <= ?", (time.time() - self.ttl,)
+                ).rowcount
+        return await asyncio.to_thread(purge)
+
+    async def run_purger(self, interval=3600):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                purged = await self.purge_expired()
+            except Exception:
+                logger.warning("Failed to purge expired conversations", exc_info=True)
+                continue
+            if purged:
+                logger.info("Purged %s expired conversations", purged)
+
+
+class RedisStore:
+    """Память в Redis с истечением через ttl, общая для всех реплик бота"""
+
+    def __init__(self, url, ttl=7 * 24 * 3600):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+
+    async def load(self, user_id):
+        data = await self.redis.get(f"telegram:memory:{user_id}")
+        return json.loads(data) if data else None
+
+    async def save(self, user_id, conversation):
+        await self.redis.set(f"telegram:memory:{user_id}", json.dumps(conversation, ensure_ascii=False), ex=self.ttl)
+
+    async def delete(self, user_id):
+        await self.redis.delete(f"telegram:memory:{user_id}")
+
+
+class ConversationMemory:
+    """
+    История диалога пользователя для агента.
+
+    prepare() перед запуском агента возвращает историю и запрос с блоком
+    контекста, remember() после ответа сохраняет реплику и сущности.
+    summarizer(summary, turns, max_chars) -> str сворачивает старые реплики,
+    по умолчанию без LLM.
+    """
+
+    def __init__(self, store, max_turns=6, max_chars=4000, summarizer=extractive_summary):
+        self.store = store
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.summarizer = summarizer
+
+    async def load(self, user_id) -> dict:
+        try:
+            conversation = await self.store.load(user_id)
+        except Exception:
+            # Без памяти бот всё равно ответит, только без контекста
+            logger.warning("Failed to load conversation memory", exc_info=True)
+            conversation = None
+        return conversation or {"summary": "", "turns": [], "entities": {}}
+
+    def context(self, conversation) -> str:
+        parts = []
+        if conversation["entities"]:
+            facts = ", ".join(f"{key}={value}" for key, value in conversation["entities"].items())
+            parts.append(f"Известно из разговора: {facts}")
+        if conversation["summary"]:
+            parts.append("Ранее в разговоре:\n" + conversation["summary"])
+        return "\n".join(parts)
+
+    async def prepare(self, user_id, query):
+        """История сообщений и запрос с контекстом диалога"""
+        conversation = await self.load(user_id)
+        context = self.context(conversation)
+        budget = self.max_chars - len(context)
+        # Свежие реплики, сколько помещается в бюджет
+        turns = []
+        for user_text, reply in reversed(conversation["turns"]):
+            budget -= len(user_text) + len(reply)
+            if budget < 0:
+                break
+            turns.insert(0, (user_text, reply))
+        history = []
+        for user_text, reply in turns:
+            history.append(HumanMessage(content=user_text))
+            history.append(AIMessage(content=reply))
+        prompt = f"{context}\n\n{query}" if context else query
+        return history, prompt
+
+    async def remember(self, user_id, text, reply, calls=()):
+        conversation = await self.load(user_id)
+        conversation["entities"].update(extract_entities(calls))
+        reply = THINK_PATTERN.sub("", reply).strip()
+        turns = conversation["turns"]
+        turns.append([text, reply])
+        # Старые реплики сворачиваем, пока история не влезет в лимиты
+        folded = 0
+        while folded < len(turns) - 1 and (
+            len(turns) - folded > self.max_turns
+            or sum(len(u) + len(r) for u, r in turns[folded:]) > self.max_chars * 2 // 3
+        ):
+            folded += 1
+        if folded:
+            conversation["summary"] = self.summarizer(conversation["summary"], turns[:folded], self.max_chars // 3)
+            conversation["turns"] = turns[folded:]
+        try:
+            await self.store.save(user_id, conversation)
+        except Exception:
+            logger.warning("Failed to save conversation memory", exc_info=True)
+
+    async def forget(self, user_id):
+        await self.store.delete(user_id)
@@ -0,0 +1,209 @@
+"""
+Метрики Prometheus процесса бота.
+
+Гистограммы времени запусков агента, шагов LLM и вызовов инструментов MCP
+считаются по ходу работы. Очереди, сессии, быстрый путь и вебхук читаются
+из их счётчиков в момент опроса /metrics. Метрики дочернего MCP-сервера
+(HTTP к API, кэш ответов, сжатие ответов инструментов) бот периодически
+забирает из его ресурсов metrics/* и отдаёт вместе со своими; общий MCP-сервис
+(MCP_TRANSPORT=http) отдаёт те же метрики на своём /metrics.
+"""
+import asyncio
+import json
+import logging
+import time
+from langchain_core.callbacks import AsyncCallbackHandler
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pydantic import AnyUrl
+
+logger = logging.getLogger(__name__)
+
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+# Ollama загружала модель хотя бы столько секунд - вызов холодный
+COLD_LOAD_SECONDS = 1.0
+TOOL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+MESSAGES = Counter("bot_messages", "Incoming messages by how they were answered", ["route"])
+AGENT_RUNS = Histogram("bot_agent_run_duration_seconds", "Agent run time including queueing", ["mode"], buckets=LLM_BUCKETS)
+LLM_STEPS = Histogram("bot_llm_step_duration_seconds", "Time of one LLM call of the agent", buckets=LLM_BUCKETS)
+LLM_ERRORS = Counter("bot_llm_errors", "Failed LLM calls")
+LLM_CALLS_BY_LOAD = Histogram(
+    "bot_llm_call_duration_seconds", "Ollama call time, cold (model loaded for the call) or warm", ["load"],
+    buckets=LLM_BUCKETS,
+)
+LLM_MODEL_LOAD = Histogram("bot_llm_model_load_seconds", "Model load time reported by Ollama", buckets=LLM_BUCKETS)
+LLM_WARMUPS = Histogram("bot_llm_warmup_duration_seconds", "Model warm-up time", ["load"], buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter("bot_llm_tokens", "LLM tokens by direction", ["direction"])
+TOOL_CALLS = Histogram(
+    "bot_mcp_tool_call_duration_seconds", "MCP tool call time as seen by the bot", ["tool", "status"],
+    buckets=TOOL_BUCKETS,
+)
+
+
+def load_seconds(response):
+    """Время загрузки модели из ответа Ollama (load_duration в наносекундах) или None"""
+    if not response.generations or not response.generations[0]:
+        return None
+    generation = response.generations[0][0]
+    message = getattr(generation, "message", None)
+    info = generation.generation_info or getattr(message, "response_metadata", None) or {}
+    load = info.get("load_duration")
+    return load / 1e9 if load is not None else None
+
+
+class LLMStepMetrics(AsyncCallbackHandler):
+    """Время и токены каждого вызова LLM, холодные и тёплые вызовы Ollama"""
+
+    def __init__(self):
+        self._started = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        elapsed = time.perf_counter() - started if started is not None else None
+        if elapsed is not None:
+            LLM_STEPS.observe(elapsed)
+        load = load_seconds(response)
+        if load is not None:
+            LLM_MODEL_LOAD.observe(load)
+            if elapsed is not None:
+                LLM_CALLS_BY_LOAD.labels("cold" if load >= COLD_LOAD_SECONDS else "warm").observe(elapsed)
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            LLM_TOKENS.labels("input").inc(usage["input_tokens"])
+            LLM_TOKENS.labels("output").inc(usage["output_tokens"])
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        LLM_ERRORS.inc()
+
+
+async def measure_tool_call(call, name, arguments):
+    """Обёртка tool_calls: время вызова инструмента"""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        result = await call(name, arguments)
+        status = "error" if result.isError else "ok"
+        return result
+    finally:
+        TOOL_CALLS.labels(name, status).observe(time.perf_counter() - started)
+
+
+class BotCollector:
+    """Текущее состояние сессий, очереди запусков LLM и быстрого пути"""
+
+    def __init__(self, sessions, router=None):
+        self.sessions = sessions
+        self.router = router
+
+    def collect(self):
+        yield GaugeMetricFamily("bot_sessions", "Agent sessions kept in memory", value=len(self.sessions))
+        yield GaugeMetricFamily("bot_llm_runs_in_flight", "Agent runs holding an LLM slot", value=self.sessions.in_flight)
+        yield GaugeMetricFamily("bot_llm_runs_waiting", "Agent runs waiting for an LLM slot", value=self.sessions.waiting)
+        yield GaugeMetricFamily("bot_llm_runs_limit", "Concurrent agent runs allowed", value=self.sessions.max_concurrent_runs)
+        stats = self.sessions.stats
+        yield CounterMetricFamily("bot_llm_runs", "Agent runs that got an LLM slot", value=stats["runs"])
+        yield CounterMetricFamily("bot_llm_run_wait_seconds", "Total time runs waited for an LLM slot", value=stats["wait_total"])
+        if self.router is not None:
+            stats = self.router.get_stats()
+            family = CounterMetricFamily("bot_fast_path_requests", "Fast path routing results", labels=["result"])
+            for result in ("handled", "fallthrough", "errors"):
+                family.add_metric([result], stats[result])
+            yield family
+
+
+class WebhookCollector:
+    """Очередь и счётчики приёма обновлений вебхука"""
+
+    def __init__(self, stats, queue, queue_size, workers):
+        self.stats = stats
+        self.queue = queue
+        self.queue_size = queue_size
+        self.workers = workers
+
+    def collect(self):
+        family = CounterMetricFamily("bot_webhook_updates", "Webhook updates by outcome", labels=["outcome"])
+        for outcome, count in self.stats.items():
+            family.add_metric([outcome], count)
+        yield family
+        yield GaugeMetricFamily("bot_webhook_queue_depth", "Updates waiting for a worker", value=self.queue.qsize())
+        yield GaugeMetricFamily("bot_webhook_queue_size", "Webhook queue capacity", value=self.queue_size)
+        yield GaugeMetricFamily("bot_webhook_workers", "Webhook worker tasks", value=self.workers)
+
+
+class MCPServerCollector:
+    """
+    Метрики дочернего MCP-сервера.
+
+    У процесса MCP-сервера нет своего HTTP-порта, поэтому его счётчики
+    читаются через протокол MCP фоновой задачей poll(), а при опросе
+    /metrics отдаётся последний снимок.
+    """
+
+    HTTP_URI = "http://localhost:8080/metrics/http"
+    CACHE_URI = "http://localhost:8080/metrics/cache"
+    COMPACTION_URI = "http://localhost:8080/metrics/compaction"
+
+    def __init__(self, client, server_name):
+        self.client = client
+        self.server_name = server_name
+        self.http = None
+        self.cache = None
+        self.compaction = None
+        self.updated = None
+
+    async def refresh(self):
+        session = self.client.get_all_active_sessions().get(self.server_name)
+        if session is None or session.connector.client is None:
+            return
+        self.http = await self._read(session, self.HTTP_URI)
+        self.cache = await self._read(session, self.CACHE_URI)
+        self.compaction = await self._read(session, self.COMPACTION_URI)
+        self.updated = time.time()
+
+    @staticmethod
+    async def _read(session, uri):
+        # connector.read_resource в mcp_use не работает с результатом MCP, читаем через сессию
+        result = await session.connector.client.read_resource(AnyUrl(uri))
+        return json.loads(result.contents[0].text)
+
+    async def poll(self, interval=15):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning("Failed to read MCP server metrics", exc_info=True)
+            await asyncio.sleep(interval)
+
+    def collect(self):
+        if self.updated is None:
+            return
+        yield GaugeMetricFamily("mcp_metrics_updated_timestamp_seconds", "When MCP server metrics were read", value=self.updated)
+        yield from mcp_server_metrics(self.http, self.cache, self.compaction)
+
+
+def mcp_server_metrics(http, cache, compaction):
+    """Метрики MCP-сервера из его get_pool_stats(), статистики кэша и сжатия ответов"""
+    yield CounterMetricFamily("mcp_api_requests", "Requests from the MCP server to the API", value=http["requests"])
+    yield CounterMetricFamily("mcp_api_errors", "Failed requests from the MCP server to the API", value=http["errors"])
+    yield CounterMetricFamily("mcp_api_request_duration_seconds", "Total time of API requests", value=http["time_total"])
+    yield GaugeMetricFamily("mcp_api_requests_in_flight", "API requests in progress", value=http["in_flight"])
+    yield GaugeMetricFamily("mcp_api_connections", "Open connections to the API", value=http["connections"])
+    yield GaugeMetricFamily("mcp_api_idle_connections", "Idle keep-alive connections", value=http["idle_connections"])
+    yield GaugeMetricFamily("mcp_api_max_connections", "Connection pool limit", value=http["max_connections"])
+    family = CounterMetricFamily("mcp_cache_lookups", "MCP response cache lookups", labels=["result"])
+    for result in ("hits", "misses", "coalesced"):
+        family.add_metric([result], cache[result])
+    yield family
+    yield GaugeMetricFamily("mcp_cache_entries", "Entries in the MCP response cache", value=cache["size"])
+    family = CounterMetricFamily("mcp_tool_result_tokens", "Estimated tokens of tool results", labels=["tool", "stage"])
+    for tool, stats in compaction["tools"].items():
+        family.add_metric([tool, "raw"], stats["tokens_raw"])
+        family.add_metric([tool, "sent"], stats["tokens_sent"])
+    yield family
+    yield CounterMetricFamily("mcp_tool_results_truncated", "Tool results cut to the token budget", value=compaction["truncated"])
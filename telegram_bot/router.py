@@ -0,0 +1,155 @@
+import logging
+import re
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+STATUS_NAMES = {
+    'pending': 'ожидает подтверждения',
+    'confirmed': 'подтверждена',
+    'completed': 'завершена',
+    'cancelled': 'отменена',
+}
+
+
+def normalize(text: str) -> str:
+    text = text.lower().replace('ё', 'е')
+    text = re.sub(r'[!?.,;:]+$', '', text.strip())
+    return re.sub(r'\s+', ' ', text)
+
+
+class Intent:
+    def __init__(self, name, patterns, handler, needs_client=False):
+        self.name = name
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.handler = handler
+        self.needs_client = needs_client
+
+    def match(self, text):
+        for pattern in self.patterns:
+            match = pattern.fullmatch(text)
+            if match:
+                return match
+        return None
+
+
+class FastPathRouter:
+    """
+    Быстрый путь для частых однозначных запросов.
+
+    Сообщение целиком сверяется с короткими шаблонами ("мои записи",
+    "отмени запись 42", "покажи категории"); при совпадении нужный
+    инструмент MCP вызывается напрямую, без LLM. Всё остальное,
+    а также любые ошибки, возвращают None и уходят агенту.
+
+    Args:
+        call_tool: async (name, arguments) -> список JSON-объектов из ответа инструмента
+        resolve_client: async (telegram_id) -> client_id или None
+    """
+
+    def __init__(self, call_tool, resolve_client=None):
+        self.call_tool = call_tool
+        self.resolve_client = resolve_client
+        self.intents = [
+            Intent('categories', [
+                r'(покажи |показать |какие |список )?(все )?категори\w*( услуг)?',
+                r'(show |list )?(all )?(service )?categories',
+            ], self.show_categories),
+            Intent('my_appointments', [
+                r'(покажи |показать |список )?(мои|моя) запис\w*',
+                r'(show )?my (appointments|bookings)',
+            ], self.show_appointments, needs_client=True),
+            Intent('cancel_appointment', [
+                r'отмени(ть)? (мою )?запись (№ ?|# ?|номер )?(?P<id>\d+)',
+                r'cancel (my )?(appointment|booking) #?(?P<id>\d+)',
+            ], self.cancel_appointment, needs_client=True),
+        ]
+        self.stats = {'total': 0, 'handled': 0, 'fallthrough': 0, 'errors': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+        self.intent_counts = {intent.name: 0 for intent in self.intents}
+
+    async def route(self, telegram_id, text):
+        """Вернуть готовый ответ или None, если запрос нужно отдать агенту"""
+        self.stats['total'] += 1
+        started = time.perf_counter()
+        normalized = normalize(text or '')
+        for intent in self.intents:
+            match = intent.match(normalized)
+            if match is None:
+                continue
+            try:
+                kwargs = match.groupdict()
+                if intent.needs_client:
+                    client_id = await self.resolve_client(telegram_id) if self.resolve_client else None
+                    if client_id is None:
+                        break
+                    kwargs['client_id'] = client_id
+                reply = await intent.handler(**kwargs)
+            except Exception:
+                self.stats['errors'] += 1
+                logger.exception('Fast path %s failed, falling back to agent', intent.name)
+                break
+            if reply is None:
+                break
+            elapsed = time.perf_counter() - started
+            self.stats['handled'] += 1
+            self.stats['latency_total'] += elapsed
+            self.stats['latency_max'] = max(self.stats['latency_max'], elapsed)
+            self.intent_counts[intent.name] += 1
+            logger.info('Fast path %s answered in %.1f ms', intent.name, elapsed * 1000)
+            return reply
+        self.stats['fallthrough'] += 1
+        return None
+
+    def get_stats(self) -> dict:
+        handled = self.stats['handled']
+        return {
+            'total': self.stats['total'],
+            'handled': handled,
+            'fallthrough': self.stats['fallthrough'],
+            'errors': self.stats['errors'],
+            'share': round(handled / self.stats['total'], 3) if self.stats['total'] else 0.0,
+            'latency_avg_ms': round(self.stats['latency_total'] / handled * 1000, 1) if handled else 0.0,
+            'latency_max_ms': round(self.stats['latency_max'] * 1000, 1),
+            'intents': dict(self.intent_counts),
+        }
+
+    # === Обработчики ===
+
+    async def show_categories(self):
+        page = (await self.call_tool('get_service_categories', {}))[0]
+        categories = page['results'] if isinstance(page, dict) else page
+        if not categories:
+            return 'Категорий услуг пока нет.'
+        lines = [f"• {category['name']}" for category in categories]
+        return 'Категории услуг:\n' + '\n'.join(lines)
+
+    async def show_appointments(self, client_id):
+        appointments = await self.active_appointments(client_id)
+        if not appointments:
+            return 'У вас нет активных записей.'
+        lines = [
+            f"• №{a['id']}: {a['service_name']} у {a['specialist_name']}, "
+            f"{a['date']} в {a['start_time'][:5]} ({STATUS_NAMES.get(a['status'], a['status'])})"
+            for a in appointments
+        ]
+        return 'Ваши записи:\n' + '\n'.join(lines)
+
+    async def cancel_appointment(self, client_id, id):
+        appointment_id = int(id)
+        # Отменять можно только свою активную запись, иначе пусть разбирается агент
+        if appointment_id not in {a['id'] for a in await self.active_appointments(client_id)}:
+            return None
+        appointment = (await self.call_tool('cancel_appointment', {'appointment_id': appointment_id}))[0]
+        return f"Запись №{appointment['id']} на {appointment['date']} в {appointment['start_time'][:5]} отменена."
+
+    async def active_appointments(self, client_id):
+        arguments = {
+            'client_id': client_id,
+            'date_from': date.today().isoformat(),
+            # Только то, что показывается в ответе
+            'fields': 'id,service_name,specialist_name,date,start_time,status',
+        }
+        page = (await self.call_tool('get_client_appointments', arguments))[0]
+        appointments = page['results'] if isinstance(page, dict) else page
+        return [a for a in appointments if a['status'] in ('pending', 'confirmed')]
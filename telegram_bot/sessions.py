@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from langchain_core.messages import AIMessage
+from streaming import stream_agent_reply
+import memory as conversation_memory
+
+logger = logging.getLogger(__name__)
+
+
+class UserSession:
+    """Состояние агента одного пользователя"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.initialized = False
+        # Сообщения одного пользователя обрабатываются строго по очереди
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """
+    Агенты по пользователям Telegram.
+
+    У каждого пользователя свой агент (и своя история диалога), запросы
+    разных пользователей выполняются параллельно, но не больше
+    max_concurrent_runs запусков LLM одновременно. on_connect(client)
+    вызывается после того, как подняты сессии MCPClient.
+
+    С memory (ConversationMemory) история диалога хранится вне агента:
+    она переживает вытеснение сессии и ограничена по размеру, а агент
+    получает её через external_history.
+    """
+
+    def __init__(self, agent_factory, client=None, max_concurrent_runs=4, max_sessions=1000, idle_ttl=1800,
+                 on_connect=None, memory=None):
+        self.agent_factory = agent_factory
+        self.client = client
+        self.on_connect = on_connect
+        self.memory = memory
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._runs = asyncio.Semaphore(max_concurrent_runs)
+        # Агенты делят один MCPClient, поэтому инициализируем их по одному,
+        # чтобы не поднять несколько MCP-сессий одновременно
+        self._init_lock = asyncio.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        # Сколько запусков дождались слота LLM и сколько секунд ждали в сумме
+        self.stats = {"runs": 0, "wait_total": 0.0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id) -> UserSession:
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = UserSession(self.agent_factory())
+            self._sessions[user_id] = session
+            self._evict_overflow()
+        else:
+            self._sessions.move_to_end(user_id)
+        return session
+
+    async def run(self, user_id, query, text=None, **kwargs) -> str:
+        """
+        Выполнить запрос агентом пользователя.
+
+        text - сообщение пользователя как есть, оно попадает в память
+        диалога (query может содержать служебный префикс).
+        """
+        session = self.get(user_id)
+        async with self._running(session):
+            if self.memory is None:
+                return await session.agent.run(query, **kwargs)
+            history, prompt = await self.memory.prepare(user_id, query)
+            with conversation_memory.recording() as calls:
+                output = await session.agent.run(prompt, external_history=history, **kwargs)
+            await self.memory.remember(user_id, text or query, output, calls)
+            return output
+
+    async def stream(self, user_id, query, on_text, text=None) -> str:
+        """
+        Выполнить запрос в потоковом режиме.
+
+        Видимый текст ответа передаётся в on_text по мере генерации,
+        возвращается итоговый ответ агента.
+        """
+        session = self.get(user_id)
+        async with self._running(session):
+            agent = session.agent
+            if self.memory is None:
+                output = await stream_agent_reply(agent.astream(query), on_text)
+                # astream не сохраняет ответ модели в историю, добавляем его сами
+                if agent.memory_enabled and output:
+                    agent.add_to_history(AIMessage(content=output))
+                return output
+            history, prompt = await self.memory.prepare(user_id, query)
+            with conversation_memory.recording() as calls:
+                output = await stream_agent_reply(agent.astream(prompt, external_history=history), on_text)
+            await self.memory.remember(user_id, text or query, output, calls)
+            return output
+
+    @asynccontextmanager
+    async def _running(self, session):
+        async with session.lock:
+            self.waiting += 1
+            started = time.monotonic()
+            try:
+                await self._runs.acquire()
+            finally:
+                self.waiting -= 1
+            self.stats["runs"] += 1
+            self.stats["wait_total"] += time.monotonic() - started
+            self.in_flight += 1
+            try:
+                await self._ensure_initialized(session)
+                yield
+            finally:
+                self.in_flight -= 1
+                self._runs.release()
+                session.last_used = time.monotonic()
+
+    async def connect(self):
+        """Поднять сессии общего MCPClient, если их ещё нет"""
+        async with self._init_lock:
+            if self.client is not None and not self.client.get_all_active_sessions():
+                await self.client.create_all_sessions()
+                if self.on_connect is not None:
+                    self.on_connect(self.client)
+
+    async def ping(self, timeout=10) -> bool:
+        """Проверить, что все сессии MCPClient отвечают"""
+        if self.client is None:
+            return True
+        try:
+            for mcp_session in self.client.get_all_active_sessions().values():
+                await asyncio.wait_for(mcp_session.connector.client.send_ping(), timeout)
+        except Exception:
+            return False
+        return True
+
+    async def reconnect(self):
+        """
+        Заново подключиться к MCP-серверу (например, после его перезапуска).
+
+        Инструменты агентов привязаны к старым коннекторам, поэтому агенты
+        инициализируются заново при следующем запросе; история диалогов остаётся.
+        """
+        async with self._init_lock:
+            try:
+                await self.client.close_all_sessions()
+            except Exception:
+                logger.warning('Failed to close stale MCP sessions', exc_info=True)
+            for session in self._sessions.values():
+                session.initialized = False
+            await self.client.create_all_sessions()
+            if self.on_connect is not None:
+                self.on_connect(self.client)
+
+    async def run_keepalive(self, interval=30):
+        """Следить за соединением с долгоживущим MCP-сервером и восстанавливать его"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.client is None or not self.client.get_all_active_sessions():
+                continue
+            if await self.ping():
+                continue
+            logger.warning('MCP server is not responding, reconnecting')
+            try:
+                await self.reconnect()
+            except Exception:
+                logger.exception('Failed to reconnect to the MCP server')
+
+    async def _ensure_initialized(self, session):
+        if session.initialized:
+            return
+        # Сессии MCP поднимаем сами, а не внутри agent.initialize(), чтобы сработал on_connect
+        await self.connect()
+        async with self._init_lock:
+            if not session.initialized:
+                await session.agent.initialize()
+                session.initialized = True
+
+    def evict_idle(self) -> int:
+        """Удалить сессии, неактивные дольше idle_ttl"""
+        deadline = time.monotonic() - self.idle_ttl
+        expired = [
+            user_id for user_id, session in self._sessions.items()
+            if session.last_used < deadline and not session.lock.locked()
+        ]
+        for user_id in expired:
+            # agent.close() не вызываем: он закрыл бы общие сессии MCPClient
+            del self._sessions[user_id]
+        return len(expired)
+
+    def _evict_overflow(self):
+        # Вытесняем самые давние сессии, которые сейчас ничего не выполняют
+        for user_id in list(self._sessions)[:-1]:
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not self._sessions[user_id].lock.locked():
+                del self._sessions[user_id]
+
+    async def run_evictor(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.evict_idle()
+            if evicted:
+                logger.info('Evicted %s idle sessions, %s active', evicted, len(self))
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+# Попыток заменить потоковый текст итоговым ответом
+FINAL_EDIT_ATTEMPTS = 3
+
+
+class ThinkFilter:
+    """
+    Потоковый фильтр блоков <think>...</think>.
+
+    Теги могут прийти разорванными между чанками, поэтому хвост буфера,
+    похожий на начало тега, придерживается до следующего чанка.
+    """
+
+    def __init__(self):
+        self.visible = ""
+        self._buffer = ""
+        self._in_think = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        while self._buffer:
+            tag = THINK_CLOSE if self._in_think else THINK_OPEN
+            index = self._buffer.find(tag)
+            if index >= 0:
+                if not self._in_think:
+                    self.visible += self._buffer[:index]
+                self._buffer = self._buffer[index + len(tag):]
+                self._in_think = not self._in_think
+                continue
+            # Придерживаем возможное начало тега в конце буфера
+            keep = _partial_tag_length(self._buffer, tag)
+            if not self._in_think:
+                self.visible += self._buffer[:len(self._buffer) - keep]
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return self.visible
+
+    def flush(self) -> str:
+        if not self._in_think:
+            self.visible += self._buffer
+        self._buffer = ""
+        return self.visible
+
+
+def _partial_tag_length(text, tag):
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class MessageStreamer:
+    """
+    Показывает ответ по мере генерации: первое сообщение отправляется сразу,
+    дальше текст обновляется через edit_message_text не чаще раза в interval секунд.
+    """
+
+    def __init__(self, bot, chat_id, interval=1.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message_id = None
+        self.first_text_at = None
+        self._started = time.monotonic()
+        self._sent_text = ""
+        self._pending_text = ""
+        self._last_edit = 0.0
+        self._flush_task = None
+
+    async def update(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        self._pending_text = text[:MESSAGE_LIMIT]
+        if self.message_id is None:
+            await self._send_first()
+        elif self._flush_task is None:
+            # Копим изменения и отправляем их одной правкой
+            delay = max(0.0, self._last_edit + self.interval - time.monotonic())
+            self._flush_task = asyncio.create_task(self._flush_later(delay))
+
+    async def finish(self, text: str, parse_mode="HTML"):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        parts = [text[i:i + MESSAGE_LIMIT] for i in range(0, len(text), MESSAGE_LIMIT)] or [""]
+        if self.message_id is None:
+            for part in parts:
+                await self._send(part, parse_mode)
+            return
+        if not await self._edit_final(parts[0], parse_mode):
+            # Сообщение так и не удалось обновить - ответ приходит отдельным сообщением
+            await self._send(parts[0], parse_mode)
+        for part in parts[1:]:
+            await self._send(part, parse_mode)
+
+    @property
+    def time_to_first_text(self):
+        if self.first_text_at is None:
+            return None
+        return self.first_text_at - self._started
+
+    async def _send_first(self):
+        message = await self.bot.send_message(self.chat_id, self._pending_text)
+        self.message_id = message.message_id
+        self.first_text_at = time.monotonic()
+        self._sent_text = self._pending_text
+        self._last_edit = time.monotonic()
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        if self._pending_text != self._sent_text:
+            await self._edit(self._pending_text)
+
+    async def _edit(self, text):
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+            self._sent_text = text
+        except TelegramRetryAfter as exc:
+            logger.warning("Telegram edit rate limit, retry after %s s", exc.retry_after)
+        except TelegramBadRequest as exc:
+            if "not modified" not in str(exc):
+                raise
+        self._last_edit = time.monotonic()
+
+    async def _edit_final(self, text, parse_mode) -> bool:
+        """Заменить потоковый текст итоговым; False, если правка не удалась"""
+        for attempt in range(FINAL_EDIT_ATTEMPTS):
+            try:
+                await self.bot.edit_message_text(
+                    text, chat_id=self.chat_id, message_id=self.message_id, parse_mode=parse_mode
+                )
+                return True
+            except TelegramRetryAfter as exc:
+                # После серии потоковых правок лимит вероятен: ждём и пробуем ещё раз
+                logger.warning("Telegram edit rate limit on final answer, retry after %s s", exc.retry_after)
+                if attempt + 1 < FINAL_EDIT_ATTEMPTS:
+                    await asyncio.sleep(exc.retry_after)
+            except TelegramBadRequest as exc:
+                if "not modified" in str(exc):
+                    return True
+                if parse_mode is None:
+                    return False
+                # HTML не разобрался - оставляем простой текст
+                parse_mode = None
+        return False
+
+    async def _send(self, text, parse_mode):
+        try:
+            await self.bot.send_message(self.chat_id, text, parse_mode=parse_mode)
+        except TelegramRetryAfter as exc:
+            await asyncio.sleep(exc.retry_after)
+            await self._send(text, parse_mode)
+        except TelegramBadRequest:
+            await self.bot.send_message(self.chat_id, text)
+
+
+async def stream_agent_reply(events, on_text) -> str:
+    """
+    Разобрать поток событий AgentExecutor.astream_events.
+
+    Видимый текст текущего вызова модели (без <think>) передаётся в on_text.
+    Возвращает итоговый ответ агента.
+    """
+    think_filter = ThinkFilter()
+    shown = ""
+    output = None
+    async for event in events:
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            # Новый шаг агента: показываем текст только последнего вызова модели
+            think_filter = ThinkFilter()
+        elif kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if isinstance(content, str) and content:
+                visible = think_filter.feed(content)
+                if visible != shown:
+                    shown = visible
+                    await on_text(visible)
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            result = event["data"].get("output")
+            if isinstance(result, dict):
+                output = result.get("output")
+    if output is None:
+        output = think_filter.flush()
+    return output
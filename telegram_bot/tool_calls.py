@@ -0,0 +1,52 @@
+"""
+Единая точка перехвата вызовов инструментов MCP.
+
+call_tool коннектора mcp_use подменяется один раз (install), а трассировка,
+метрики и память регистрируют свои обёртки через register(). Обёртка -
+async hook(call, name, arguments), где call(name, arguments) - остаток
+цепочки; первая зарегистрированная обёртка - внешняя.
+
+Коннектор не умеет передавать _meta, поэтому tools/call отправляется
+напрямую через сессию MCP с контекстом трассы (traceparent) в _meta.
+"""
+from functools import partial
+from mcp import types
+import tracing
+
+_hooks = []
+
+
+def register(hook):
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+async def _send(connector, name, arguments):
+    if not connector.client:
+        raise RuntimeError("MCP client is not connected")
+    params = types.CallToolRequestParams(name=name, arguments=arguments, _meta=tracing.inject_headers() or None)
+    return await connector.client.send_request(
+        types.ClientRequest(types.CallToolRequest(method="tools/call", params=params)),
+        types.CallToolResult,
+    )
+
+
+def install_connector(connector):
+    """Пропускать вызовы инструментов коннектора через зарегистрированные обёртки"""
+    if getattr(connector, "hooked", False):
+        return
+
+    async def call_tool(name, arguments):
+        call = partial(_send, connector)
+        for hook in reversed(_hooks):
+            call = partial(hook, call)
+        return await call(name, arguments)
+
+    connector.call_tool = call_tool
+    connector.hooked = True
+
+
+def install(client):
+    """on_connect для SessionManager: подключить все активные сессии MCPClient"""
+    for session in client.get_all_active_sessions().values():
+        install_connector(session.connector)
@@ -0,0 +1,136 @@
+"""
+Трассировка запроса бот -> MCP -> API на OpenTelemetry.
+
+Куда выгружать спаны, задаёт TRACING_EXPORTER:
+    none    - никуда (по умолчанию, трассировка ничего не стоит)
+    console - в stderr (stdout MCP-сервера занят протоколом stdio)
+    file    - JSON спанов в TRACING_FILE, по строке на спан
+    otlp    - OTLP/HTTP в OTEL_EXPORTER_OTLP_ENDPOINT
+              (нужен пакет opentelemetry-exporter-otlp-proto-http)
+
+Контекст передаётся в формате W3C traceparent: от бота к MCP-серверу
+через _meta запроса MCP, от MCP-сервера к API через HTTP-заголовки.
+"""
+import os
+import sys
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from langchain_core.callbacks import AsyncCallbackHandler
+from mcp import types
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+
+tracer = trace.get_tracer("telegram_bot")
+
+
+def make_exporter(name):
+    if name == "console":
+        return ConsoleSpanExporter(out=sys.stderr)
+    if name == "file":
+        # Бот и MCP-сервер могут писать в один файл: спан пишется одной строкой
+        return ConsoleSpanExporter(
+            out=open(TRACING_FILE, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {name}")
+
+
+def setup_tracing(service_name):
+    """Включить выгрузку спанов процесса, если задан TRACING_EXPORTER"""
+    if TRACING_EXPORTER == "none":
+        return
+    resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)})
+    provider = TracerProvider(resource=resource)
+    exporter = make_exporter(TRACING_EXPORTER)
+    # Локальные экспортёры пишут сразу: клиент MCP завершает дочерний процесс,
+    # не дожидаясь выгрузки пачки, и последние спаны терялись бы
+    processor = BatchSpanProcessor(exporter) if TRACING_EXPORTER == "otlp" else SimpleSpanProcessor(exporter)
+    provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+
+
+def inject_headers(headers=None) -> dict:
+    """Заголовки запроса с контекстом текущего спана"""
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+
+class AgentStepTracer(AsyncCallbackHandler):
+    """Спан на каждый шаг агента - вызов LLM"""
+
+    def __init__(self):
+        self._spans = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._spans[run_id] = tracer.start_span("agent.step", attributes={
+            "llm.model": (kwargs.get("invocation_params") or {}).get("model", ""),
+            "llm.messages": sum(len(batch) for batch in messages),
+        })
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        tool_calls = getattr(message, "tool_calls", None) or []
+        span.set_attribute("llm.tool_calls", len(tool_calls))
+        if tool_calls:
+            span.set_attribute("llm.tools", [call["name"] for call in tool_calls])
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            span.set_attribute("llm.input_tokens", usage["input_tokens"])
+            span.set_attribute("llm.output_tokens", usage["output_tokens"])
+        span.end()
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+            span.end()
+
+
+async def trace_tool_call(call, name, arguments):
+    """Обёртка tool_calls: спан на вызов инструмента, его контекст уходит в _meta запроса"""
+    with tracer.start_as_current_span(f"mcp.call_tool {name}", kind=SpanKind.CLIENT, attributes={"mcp.tool": name}) as span:
+        result = await call(name, arguments)
+        if result.isError:
+            span.set_status(Status(StatusCode.ERROR))
+        return result
+
+
+def instrument_server(server):
+    """
+    Спаны на вызовы инструментов и чтение ресурсов FastMCP-сервера.
+
+    Родительский контекст берётся из _meta запроса, поэтому спаны
+    MCP-сервера и запросы к API попадают в трассу бота.
+    """
+    handlers = server._mcp_server.request_handlers
+    wrapped = {
+        types.CallToolRequest: lambda params: ("mcp.tool " + params.name, {"mcp.tool": params.name}),
+        types.ReadResourceRequest: lambda params: ("mcp.resource", {"mcp.resource": str(params.uri)}),
+    }
+    for request_type, describe in wrapped.items():
+        handlers[request_type] = _traced_handler(handlers[request_type], describe)
+
+
+def _traced_handler(handler, describe):
+    async def traced(request):
+        meta = request.params.meta
+        parent = propagate.extract(meta.model_extra if meta is not None else {})
+        name, attributes = describe(request.params)
+        with tracer.start_as_current_span(name, context=parent, kind=SpanKind.SERVER, attributes=attributes) as span:
+            result = await handler(request)
+            if getattr(result.root, "isError", False):
+                span.set_status(Status(StatusCode.ERROR))
+            return result
+    return traced
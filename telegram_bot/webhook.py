@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from aiogram.types import Update
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from metrics import WebhookCollector
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateDeduplicator:
+    """Последние update_id, уже принятые этим процессом"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._seen = OrderedDict()
+
+    async def seen(self, update_id) -> bool:
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
+
+    async def forget(self, update_id):
+        self._seen.pop(update_id, None)
+
+
+class RedisUpdateDeduplicator:
+    """update_id в Redis: повтор не обработается, даже если попадёт на другую реплику"""
+
+    def __init__(self, url, ttl=3600):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+
+    async def seen(self, update_id) -> bool:
+        return not await self.redis.set(f"telegram:update:{update_id}", 1, nx=True, ex=self.ttl)
+
+    async def forget(self, update_id):
+        await self.redis.delete(f"telegram:update:{update_id}")
+
+
+def create_app(bot, dp, path, webhook_url=None, secret=None, workers=8, queue_size=1000, deduplicator=None, background=()):
+    """
+    ASGI-приложение для приёма обновлений Telegram через вебхук.
+
+    Обновление сразу кладётся в ограниченную очередь и подтверждается,
+    обрабатывают его workers фоновых задач. При переполнении очереди
+    отвечаем 503, и Telegram повторит доставку позже.
+    """
+    deduplicator = deduplicator or UpdateDeduplicator()
+    queue = asyncio.Queue(maxsize=queue_size)
+    stats = {"received": 0, "duplicates": 0, "rejected": 0, "processed": 0, "failed": 0}
+    REGISTRY.register(WebhookCollector(stats, queue, queue_size, workers))
+
+    async def worker():
+        while True:
+            data = await queue.get()
+            try:
+                update = Update.model_validate(data, context={"bot": bot})
+                await dp.feed_update(bot, update)
+                stats["processed"] += 1
+            except Exception:
+                stats["failed"] += 1
+                logger.exception("Failed to process update %s", data.get("update_id"))
+            finally:
+                queue.task_done()
+
+    async def handle_update(request: Request):
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return Response(status_code=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        # Обновление Telegram - всегда объект
+        if not isinstance(data, dict):
+            return Response(status_code=400)
+        stats["received"] += 1
+        update_id = data.get("update_id")
+        if update_id is not None and await deduplicator.seen(update_id):
+            stats["duplicates"] += 1
+            return Response()
+        try:
+            queue.put_nowait(data)
+        except asyncio.QueueFull:
+            stats["rejected"] += 1
+            if update_id is not None:
+                await deduplicator.forget(update_id)
+            return Response(status_code=503)
+        return Response()
+
+    async def health(request: Request):
+        return JSONResponse(dict(stats, queue_depth=queue.qsize(), queue_size=queue_size, workers=workers))
+
+    async def metrics(request: Request):
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        tasks += [asyncio.create_task(job()) for job in background]
+        if webhook_url:
+            await bot.set_webhook(
+                webhook_url.rstrip("/") + path,
+                secret_token=secret,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        try:
+            yield
+        finally:
+            # Даём досчитать уже принятые обновления
+            try:
+                await asyncio.wait_for(queue.join(), timeout=30)
+            except asyncio.TimeoutError:
+                logger.warning("Shutting down with %s unprocessed updates", queue.qsize())
+            for task in tasks:
+                task.cancel()
+            await bot.session.close()
+
+    return Starlette(
+        routes=[
+            Route(path, handle_update, methods=["POST"]),
+            Route("/healthz", health, methods=["GET"]),
+            Route("/metrics", metrics, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )